@@ -0,0 +1,196 @@
+# admission.py
+"""
+Admission control for the upstream LLM and embedding APIs.
+
+A Limiter allows `limit` calls in flight. Callers beyond that wait in a queue
+with one bound per priority lane; a freed slot goes to the oldest waiter of the
+most urgent lane, so interactive chat overtakes batch questions and ingest.
+Requests are shed early instead of piling onto the upstream:
+  429 + Retry-After  when the caller's lane queue is full (checked on arrival)
+  503 + Retry-After  when the wait exceeds the lane's deadline
+Both are HTTPExceptions, so FastAPI turns them into responses with the header set.
+
+The lane of the current request is a context variable, set by the endpoint and
+inherited by the tasks it starts (ingest jobs, embedding batches).
+
+    llm_limiter.check()                 # 429 now if the lane's queue is full, nothing held
+    ... retrieval, prompt building ...
+    async with llm_limiter.reserve():   # waits for the slot (503 on deadline), released on exit
+        await call_upstream()
+"""
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextvars import ContextVar
+from typing import Dict, Optional
+from fastapi import HTTPException
+from metrics import HistogramFamily, STAGE_SECONDS_BUCKETS
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+INGEST = "ingest"
+LANES = (INTERACTIVE, BATCH, INGEST)  # most urgent first
+
+_lane: ContextVar[str] = ContextVar("admission_lane", default=INTERACTIVE)
+
+
+def set_lane(lane: str):
+    _lane.set(lane)
+
+
+def current_lane() -> str:
+    return _lane.get()
+
+
+class Overloaded(HTTPException):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """A queue position that becomes a slot; release() is idempotent."""
+
+    def __init__(self, limiter: "Limiter", lane: str, deadline: float):
+        self.limiter = limiter
+        self.lane = lane
+        self.deadline = deadline
+        self.enqueued = time.perf_counter()
+        self.future: Optional[asyncio.Future] = None  # set while queued
+        self.granted = False
+        self.granted_at = 0.0
+        self.released = False
+
+    async def wait(self):
+        if self.granted:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(self.future), max(0.0, self.deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if not self.future.done():
+                raise self.limiter._timed_out(self) from None
+        except BaseException:
+            if not self.future.done():
+                self.limiter._abandon(self)
+            raise
+        # the slot may have been handed over just as the deadline passed; keep it then
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        if self.granted:
+            self.limiter._release(self)
+        elif self.future is not None and not self.future.done():
+            self.limiter._abandon(self)
+
+    async def __aenter__(self):
+        try:
+            await self.wait()
+        except BaseException:
+            self.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class _Unlimited(Ticket):
+    async def wait(self):
+        return
+
+    def release(self):
+        return
+
+
+class Limiter:
+    def __init__(self, name: str, limit: int, max_queue: int, timeouts: Dict[str, float]):
+        self.name = name
+        self.limit = limit  # 0 = unlimited
+        self.max_queue = max_queue  # waiters per lane
+        self.timeouts = timeouts  # seconds a request of each lane may wait
+        self.in_flight = 0
+        self.rejected = 0  # lane queue full
+        self.timeouts_total = 0  # deadline passed while queued
+        self.wait_seconds = HistogramFamily("lane", STAGE_SECONDS_BUCKETS)
+        self.hold_seconds = 0.0  # moving average of how long a slot is held, for Retry-After
+        self._queue = []  # heap of (lane rank, seq, ticket)
+        self._queued = {lane: 0 for lane in LANES}
+        self._seq = itertools.count()
+
+    def queue_depth(self, lane: Optional[str] = None) -> int:
+        return self._queued[lane] if lane else sum(self._queued.values())
+
+    def retry_after(self, lane: str) -> int:
+        ahead = sum(self._queued[l] for l in LANES[:LANES.index(lane) + 1])
+        hold = self.hold_seconds or 1.0
+        return max(1, math.ceil(hold * (ahead + 1) / max(self.limit, 1)))
+
+    def check(self, lane: Optional[str] = None):
+        """Raise Overloaded (429) when reserve() would, without taking a place in the queue."""
+        lane = lane or current_lane()
+        if self.limit <= 0 or self.in_flight < self.limit and self.queue_depth() == 0:
+            return
+        if self._queued[lane] >= self.max_queue:
+            self.rejected += 1
+            raise Overloaded(429, f"{self.name} is overloaded ({self.queue_depth()} requests queued), retry later",
+                             self.retry_after(lane))
+
+    def reserve(self, lane: Optional[str] = None) -> Ticket:
+        """A slot now, or a place in the lane's queue; raises Overloaded (429) when that queue is full."""
+        lane = lane or current_lane()
+        self.check(lane)
+        if self.limit <= 0:
+            return _Unlimited(self, lane, 0.0)
+        ticket = Ticket(self, lane, time.monotonic() + self.timeouts[lane])
+        if self.in_flight < self.limit and self.queue_depth() == 0:
+            self._grant(ticket)
+            return ticket
+        ticket.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (LANES.index(lane), next(self._seq), ticket))
+        self._queued[lane] += 1
+        self._dispatch()
+        return ticket
+
+    def _grant(self, ticket: Ticket):
+        self.in_flight += 1
+        ticket.granted = True
+        ticket.granted_at = time.perf_counter()
+        self.wait_seconds.labels(ticket.lane).observe(ticket.granted_at - ticket.enqueued)
+        if ticket.future is not None:
+            ticket.future.set_result(None)
+
+    def _release(self, ticket: Ticket):
+        self.in_flight -= 1
+        held = time.perf_counter() - ticket.granted_at
+        self.hold_seconds = held if not self.hold_seconds else 0.9 * self.hold_seconds + 0.1 * held
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queue and self.in_flight < self.limit:
+            _, _, ticket = heapq.heappop(self._queue)
+            if ticket.future.done():
+                continue  # abandoned or timed out, already uncounted
+            self._queued[ticket.lane] -= 1
+            self._grant(ticket)
+
+    def _abandon(self, ticket: Ticket):
+        """A queued ticket whose request went away; its heap entry is skipped later."""
+        self._queued[ticket.lane] -= 1
+        ticket.future.cancel()
+
+    def _timed_out(self, ticket: Ticket) -> Overloaded:
+        self._abandon(ticket)
+        ticket.released = True
+        self.timeouts_total += 1
+        self.wait_seconds.labels(ticket.lane).observe(time.perf_counter() - ticket.enqueued)
+        return Overloaded(503, f"{self.name} is overloaded, waited {self.timeouts[ticket.lane]:.0f}s for a slot",
+                         self.retry_after(ticket.lane))
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": dict(self._queued),
+                "rejected": self.rejected, "timeouts": self.timeouts_total,
+                "hold_seconds": round(self.hold_seconds, 3)}
@@ -1,48 +1,254 @@
 # app.py
 import os
 import json
-from typing import List
+import time
+import asyncio
+import itertools
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 import numpy as np
 import faiss
 import openai
+import chunk_store as cs
+import meta_store as ms
+import snapshots
+import kb_collections as kbc
+import file_lock
+from snapshots import Snapshot
+from embedding_cache import EmbeddingCache
+import incremental as inc
+import ingest_jobs as ij
+import doc_loader as dl
+import chunkers
+from upstream import create_http_client, with_retries
+from embedders import RemoteEmbedder, LocalEmbedder
+import index_factory as ix
+import bm25
+import page_context as pc
+import prompt_builder as pb
+from query_batcher import QueryBatcher
+import metrics
+import sse
+import result_cache as rc
+import page_sessions as ps
+import admission
 
 load_dotenv()
 
 # LLM Configuration - Fuelix API with Gemini 2.5 Pro
-LLM_BASE_URL_EXPERT = "YOUR_FUELIX_API_ENDPOINT"
-LLM_API_KEY_EXPERT = "YOUR_FUELIX_API_KEY"
+LLM_BASE_URL_EXPERT = os.getenv("LLM_BASE_URL", "YOUR_FUELIX_API_ENDPOINT")
+LLM_API_KEY_EXPERT = os.getenv("LLM_API_KEY", "YOUR_FUELIX_API_KEY")
 LLM_MODEL_EXPERT = 'gemini-2.5-pro'
 LLM_TEMPERATURE_EXPERT = 0.1
 LLM_MAX_TOKENS_EXPERT = 4096
 
-# Embedding Configuration - Fuelix API with OpenAI embeddings
-EMBEDDING_API_KEY = "YOUR_FUELIX_API_KEY"
-EMBEDDING_MODEL = "gemini-embedding-001"
-EMBEDDING_BASE_URL = "YOUR_FUELIX_API_ENDPOINT"
+# Embedding Configuration - "remote" (Fuelix API with OpenAI embeddings) or "local" (sentence-transformers on CPU)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+# (base URL / key can be pointed at a local stand-in, see fake_upstream.py)
+EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY", "YOUR_FUELIX_API_KEY")
+REMOTE_EMBEDDING_MODEL = "gemini-embedding-001"
+REMOTE_EMBEDDING_DIM = 3072  # gemini-embedding-001 dimension
+EMBEDDING_BASE_URL = os.getenv("EMBEDDING_BASE_URL", "YOUR_FUELIX_API_ENDPOINT")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_CACHE_DIR = "cache"  # bundled HF cache
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))  # 0 = torch default (all cores)
+
+# Both clients share one pooled http client (limits in upstream.py); retries go through with_retries()
+http_client = create_http_client()
 
 # Initialize OpenAI client with Fuelix API for LLM
-llm_client = openai.OpenAI(
+llm_client = openai.AsyncOpenAI(
     base_url=LLM_BASE_URL_EXPERT,
     api_key=LLM_API_KEY_EXPERT,
+    http_client=http_client,
+    max_retries=0,
 )
 
 # Initialize OpenAI client with Fuelix API for embeddings
-embedding_client = openai.OpenAI(
+embedding_client = openai.AsyncOpenAI(
     base_url=EMBEDDING_BASE_URL,
     api_key=EMBEDDING_API_KEY,
+    http_client=http_client,
+    max_retries=0,
 )
 
+if EMBEDDING_BACKEND == "local":
+    embedder = LocalEmbedder(LOCAL_EMBEDDING_MODEL, LOCAL_EMBEDDING_CACHE_DIR, LOCAL_EMBEDDING_THREADS)
+else:
+    embedder = RemoteEmbedder(embedding_client, REMOTE_EMBEDDING_MODEL, REMOTE_EMBEDDING_DIM)
+
 # Config
-EMBED_DIM = 3072  # gemini-embedding-001 dimension
+EMBEDDING_MODEL = embedder.name
+EMBED_DIM = embedder.dim
 INDEX_PATH = "faiss_index.bin"
-DOCS_META_PATH = "docs_meta.json"
+DOCS_META_PATH = "docs_meta.json"  # only read from indexes built before meta_store.py's columnar format
+WRITE_DOCS_META_JSON = os.getenv("WRITE_DOCS_META_JSON", "false").lower() in ("1", "true", "yes")  # debugging copy
+INDEX_INFO_PATH = "index_info.json"  # embedding model / dimension / index type the index was built with
+# each ingest publishes an immutable snapshot directory under SNAPSHOTS_DIR (see snapshots.py);
+# the file names above are relative to it
+SNAPSHOTS_DIR = os.getenv("SNAPSHOTS_DIR", snapshots.SNAPSHOTS_DIR)
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))  # published versions kept on disk
+SNAPSHOT_POLL_SECONDS = float(os.getenv("SNAPSHOT_POLL_SECONDS", "2"))  # how often workers look for a new version
+# named collections (see kb_collections.py): the default one uses SNAPSHOTS_DIR, others COLLECTIONS_DIR/<name>
+COLLECTIONS_DIR = os.getenv("COLLECTIONS_DIR", "collections")
+COLLECTIONS_MEMORY_BUDGET_MB = int(os.getenv("COLLECTIONS_MEMORY_BUDGET_MB", "2048"))  # loaded snapshots per worker
+# Read-only serving: the index and metadata are memory-mapped instead of read into the heap, so uvicorn
+# workers share one page-cache copy; /ingest is refused and must run in a separate (writer) process,
+# whose snapshots the workers pick up without a restart
+SERVE_READ_ONLY = os.getenv("SERVE_READ_ONLY", "false").lower() in ("1", "true", "yes")
+
+# ANN index (see index_factory.py): flat | ivf_flat | ivf_pq | hnsw
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+INDEX_NLIST = int(os.getenv("INDEX_NLIST", "0"))  # IVF lists, 0 = derived from corpus size
+INDEX_PQ_M = int(os.getenv("INDEX_PQ_M", "64"))  # PQ sub-quantizers
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))  # HNSW graph degree
+INDEX_EF_CONSTRUCTION = int(os.getenv("INDEX_EF_CONSTRUCTION", "200"))
+INDEX_NPROBE = int(os.getenv("INDEX_NPROBE", "16"))  # default IVF lists probed per query
+INDEX_EF_SEARCH = int(os.getenv("INDEX_EF_SEARCH", "64"))  # default HNSW candidate list per query
+# Compressed vector storage: codec float32 | float16 | sq8, reduce none | truncate | pca to INDEX_REDUCE_DIM
+INDEX_CODEC = os.getenv("INDEX_CODEC", "float32")
+INDEX_REDUCE = os.getenv("INDEX_REDUCE", "none")
+INDEX_REDUCE_DIM = int(os.getenv("INDEX_REDUCE_DIM", "0"))
+
+# Retrieval: dense (FAISS) | lexical (BM25) | hybrid (both, fused with reciprocal-rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RRF_K = 60  # standard RRF damping constant
+RRF_CANDIDATES = 20  # results taken from each retriever before fusion
+QUERY_EMBED_TIMEOUT = float(os.getenv("QUERY_EMBED_TIMEOUT", "3.0"))  # seconds before hybrid falls back to BM25
+
+# Webpage context: pages longer than the budget are cut into passages and only the most relevant are sent
+PAGE_CONTEXT_TOKEN_BUDGET = int(os.getenv("PAGE_CONTEXT_TOKEN_BUDGET", "2000"))
+PAGE_CHUNK_CHARS = 800
+MIN_PAGE_CONTENT_CHARS = 50  # less page text than this is answered from the knowledge base alone
+SUPPLEMENTARY_TOP_K = 2  # knowledge-base chunks added to a webpage prompt
+NO_ANSWER = "No response generated"
+PAGE_CACHE_MAX_PAGES = int(os.getenv("PAGE_CACHE_MAX_PAGES", "256"))  # pages whose passage embeddings are kept
+# Pages registered with POST /pages, see page_sessions.py
+PAGE_SESSIONS_MAX = int(os.getenv("PAGE_SESSIONS_MAX", "512"))
+PAGE_SESSION_TTL_SECONDS = float(os.getenv("PAGE_SESSION_TTL_SECONDS", "1800"))  # since last use
+PAGE_SESSIONS_DIR = os.getenv("PAGE_SESSIONS_DIR", "page_sessions")  # shared by the worker processes, "" = per process only
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))  # whole prompt, trimmed by section priority
+EMBED_CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "embedding_cache")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "20000"))  # 0 disables the cache
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "8"))  # embedding batches in flight during ingest
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "256"))  # chunks read, embedded and committed per step
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or dl.default_workers()  # processes reading and chunking files
+# default file patterns under docs_dir (comma-separated, see doc_loader.py), overridable per request
+INGEST_INCLUDE = [p for p in os.getenv("INGEST_INCLUDE", ",".join(dl.DEFAULT_INCLUDE)).split(",") if p]
+INGEST_EXCLUDE = [p for p in os.getenv("INGEST_EXCLUDE", ",".join(dl.DEFAULT_EXCLUDE)).split(",") if p]
+INGEST_CHUNKER = os.getenv("INGEST_CHUNKER", "markdown")  # "chars" or "markdown", see chunkers.py and bench_chunkers.py
+INGEST_JOBS_DIR = os.getenv("INGEST_JOBS_DIR", ij.JOBS_DIR)  # job state and scratch files, see ingest_jobs.py
+INGEST_JOBS_KEEP = int(os.getenv("INGEST_JOBS_KEEP", "20"))  # finished jobs kept for the status endpoints
+# Query embeddings from concurrent requests are coalesced into one call: wait up to QUERY_BATCH_WAIT_MS, at most QUERY_BATCH_MAX
+QUERY_BATCH_WAIT_MS = float(os.getenv("QUERY_BATCH_WAIT_MS", "5"))  # 0 disables batching
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "5"))  # SSE comment sent while /chat/stream waits
+# POST /chat/batch: items per request, LLM calls in flight per batch, queries per embedding call
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "1000"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+CHAT_BATCH_EMBED_MAX = int(os.getenv("CHAT_BATCH_EMBED_MAX", "256"))
+# Admission control, see admission.py: upstream calls in flight per worker (0 = unlimited), waiters per
+# priority lane, and how long a request of each lane may wait for a slot
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "16"))
+EMBED_MAX_QUEUE = int(os.getenv("EMBED_MAX_QUEUE", "256"))
+ADMISSION_TIMEOUTS = {
+    admission.INTERACTIVE: float(os.getenv("ADMISSION_TIMEOUT_INTERACTIVE", "10")),
+    admission.BATCH: float(os.getenv("ADMISSION_TIMEOUT_BATCH", "120")),
+    admission.INGEST: float(os.getenv("ADMISSION_TIMEOUT_INGEST", "600")),
+}
+# Repeated questions, see result_cache.py; 0 entries disables a tier
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "4096"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "900"))
+
+# persistent embedding cache, so repeated texts (re-ingest, repeated questions) skip the API
+embedding_cache = (
+    EmbeddingCache(EMBED_CACHE_DIR, EMBEDDING_MODEL, EMBED_DIM, EMBED_CACHE_MAX_ENTRIES)
+    if EMBED_CACHE_MAX_ENTRIES > 0 else None
+)
 
-app = FastAPI(title="Tool Assistant Backend")
+# looked up at call time: get_embeddings is defined further down
+query_batcher = QueryBatcher(lambda texts: get_embeddings(texts), QUERY_BATCH_MAX, QUERY_BATCH_WAIT_MS) if QUERY_BATCH_WAIT_MS > 0 else None
+
+retrieval_cache = (
+    rc.TTLCache(RETRIEVAL_CACHE_MAX_ENTRIES, RETRIEVAL_CACHE_TTL_SECONDS) if RETRIEVAL_CACHE_MAX_ENTRIES > 0 else None
+)
+answer_cache = rc.TTLCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS) if ANSWER_CACHE_MAX_ENTRIES > 0 else None
+
+llm_limiter = admission.Limiter("LLM", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, ADMISSION_TIMEOUTS)
+embed_limiter = admission.Limiter("Embedder", EMBED_MAX_CONCURRENCY, EMBED_MAX_QUEUE, ADMISSION_TIMEOUTS)
+
+# Prometheus metrics on /metrics (see metrics.py); the stage timings of a /chat call are also sent back
+# in its Server-Timing header
+registry = metrics.Registry()
+stage_seconds = registry.histogram(
+    "learnmate_stage_seconds", "Time spent in each stage of a chat request "
+    "(embed, search, bm25, page_context, excerpts, prompt, stream_metadata, llm_ttft, llm_total)",
+    metrics.STAGE_SECONDS_BUCKETS, label="stage")
+prompt_tokens_hist = registry.histogram(
+    "learnmate_prompt_tokens", "Estimated prompt tokens per section (total = whole prompt)",
+    metrics.TOKEN_BUCKETS, label="section")
+stream_tokens_per_s = registry.histogram(
+    "learnmate_llm_stream_tokens_per_second", "Streamed completion speed after the first token (one chunk ~ one token)",
+    metrics.TOKENS_PER_S_BUCKETS)
+registry.gauge("learnmate_index_vectors", "Vectors in the served index", lambda: snapshot.index.ntotal)
+registry.gauge("learnmate_index_bytes", "Size of the served index file",
+               lambda: os.path.getsize(os.path.join(snapshot.path, INDEX_PATH)) if snapshot.path else 0)
+registry.gauge("learnmate_chunks", "Chunks in the served snapshot", lambda: len(snapshot.docs_meta))
+registry.gauge("learnmate_collections_loaded", "Collections loaded by this worker", lambda: len(collections.loaded()))
+registry.gauge("learnmate_collections_loaded_bytes", "Estimated size of the loaded collections",
+               lambda: collections.loaded_bytes())
+registry.gauge("learnmate_page_sessions", "Registered pages held by this worker", lambda: len(page_sessions.sessions))
+if embedding_cache is not None:
+    registry.counter("learnmate_embedding_cache_hits_total", "Embedding cache hits", lambda: embedding_cache.hits)
+    registry.counter("learnmate_embedding_cache_misses_total", "Embedding cache misses", lambda: embedding_cache.misses)
+for tier, cache in (("retrieval", retrieval_cache), ("answer", answer_cache)):
+    if cache is not None:
+        for stat in ("hits", "misses", "evictions", "expirations"):
+            registry.counter(f"learnmate_{tier}_cache_{stat}_total", f"{tier.capitalize()} cache {stat}",
+                             lambda cache=cache, stat=stat: getattr(cache, stat))
+        registry.gauge(f"learnmate_{tier}_cache_entries", f"Entries in the {tier} cache", lambda cache=cache: len(cache))
+for name, limiter in (("llm", llm_limiter), ("embed", embed_limiter)):
+    registry.gauge(f"learnmate_{name}_in_flight", f"{limiter.name} calls in flight", lambda limiter=limiter: limiter.in_flight)
+    registry.gauge(f"learnmate_{name}_queue_depth", f"Requests waiting for an {limiter.name} slot",
+                   lambda limiter=limiter: limiter.queue_depth())
+    registry.register(f"learnmate_{name}_queue_wait_seconds", f"Time waited for an {limiter.name} slot, per priority lane",
+                      limiter.wait_seconds)
+    registry.counter(f"learnmate_{name}_rejected_total", f"Requests refused with 429 because the {limiter.name} queue was full",
+                     lambda limiter=limiter: limiter.rejected)
+    registry.counter(f"learnmate_{name}_queue_timeouts_total", f"Requests refused with 503 after waiting too long for {limiter.name}",
+                     lambda limiter=limiter: limiter.timeouts_total)
+if query_batcher is not None:
+    registry.register("learnmate_query_batch_size", "Distinct queries per batched embedding call", query_batcher.batch_sizes)
+    registry.register("learnmate_query_batch_wait_ms", "Time a query waited for its batch", query_batcher.wait_ms)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    watcher = asyncio.create_task(watch_snapshots())
+    try:
+        yield
+    finally:
+        watcher.cancel()
+        # running ingest jobs stop at their last committed batch, release their locks and are left resumable
+        running = [job.task for job in running_jobs.values() if not job.task.done()]
+        for task in running:
+            task.cancel()
+        await asyncio.gather(watcher, *running, return_exceptions=True)
+        await http_client.aclose()
+        if embedding_cache is not None:
+            await run_in_threadpool(embedding_cache.flush)
+
+app = FastAPI(title="Tool Assistant Backend", lifespan=lifespan)
 
 # Add CORS middleware to allow requests from frontend
 app.add_middleware(
@@ -53,396 +259,1082 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
-# in-memory structures (persist to disk)
-index = None
-docs_meta = []  # list of dicts: {'id': int, 'text': "...", 'title': "...", 'source': "docs/..."}
+# the index currently served for the default collection; requests read this once and keep using that
+# Snapshot until they finish. Other collections are loaded on first use into `collections`.
+snapshot = None
+collections = kbc.Collections(COLLECTIONS_DIR, SNAPSHOTS_DIR, COLLECTIONS_MEMORY_BUDGET_MB * 2**20)
+collection_loads = {}  # name -> task loading it, so concurrent first requests load it once
+ingest_locks = {}  # collection -> asyncio.Lock: one ingest at a time per collection, each building on its latest snapshot
+running_jobs = {}  # job id -> IngestJob run by this process; the others are read from INGEST_JOBS_DIR
+page_cache = pc.PageCache(PAGE_CACHE_MAX_PAGES)
+media_cache = pb.MediaSectionCache(PAGE_CACHE_MAX_PAGES)
+page_sessions = ps.PageSessionStore(PAGE_SESSIONS_MAX, PAGE_SESSION_TTL_SECONDS, PAGE_SESSIONS_DIR or None)
 
-def create_index():
-    global index
-    index = faiss.IndexFlatIP(EMBED_DIM)  # cosine via normalized vectors with inner product
-    print("Created new faiss IndexFlatIP")
+def empty_snapshot() -> Snapshot:
+    # cosine via normalized vectors with inner product, id-mapped so incremental ingest can remove vectors
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(EMBED_DIM))
+    print("Created new faiss IndexIDMap2(IndexFlatIP)")
+    return Snapshot(None, None, index, [], {}, {})
 
-def load_index():
-    global index, docs_meta
-    if os.path.exists(INDEX_PATH) and os.path.exists(DOCS_META_PATH):
-        index = faiss.read_index(INDEX_PATH)
-        with open(DOCS_META_PATH, 'r', encoding='utf-8') as f:
+def index_matches_embedder(loaded_index, info: dict) -> bool:
+    """An index built with another embedding model would return meaningless neighbours."""
+    if info:
+        if info.get("embedding_model") != EMBEDDING_MODEL or info.get("dim") != EMBED_DIM:
+            print(f"Index was built with {info.get('embedding_model')} ({info.get('dim')} dims), "
+                  f"current embedder is {EMBEDDING_MODEL} ({EMBED_DIM} dims); ignoring it until the next /ingest")
+            return False
+    elif loaded_index.d != EMBED_DIM:
+        print(f"Index has {loaded_index.d} dims, current embedder has {EMBED_DIM}; ignoring it until the next /ingest")
+        return False
+    return True
+
+def open_snapshot(path: str, version: Optional[str]) -> Optional[Snapshot]:
+    """Load the index files in path; None if they are missing or were built for another embedder."""
+    index_path = os.path.join(path, INDEX_PATH)
+    docs_meta_path = os.path.join(path, DOCS_META_PATH)
+    if not (os.path.exists(index_path) and (ms.exists(path) or os.path.exists(docs_meta_path))):
+        return None
+    if SERVE_READ_ONLY:
+        index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    else:
+        index = faiss.read_index(index_path)
+    info = {}
+    if os.path.exists(os.path.join(path, INDEX_INFO_PATH)):
+        with open(os.path.join(path, INDEX_INFO_PATH), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    if not index_matches_embedder(index, info):
+        return None
+    if ms.exists(path):
+        docs_meta = ms.MetaStore(path)
+        id_to_row = ms.IdLookup(docs_meta)
+    else:
+        print("No columnar metadata found, loading docs_meta.json into memory until the next /ingest")
+        with open(docs_meta_path, 'r', encoding='utf-8') as f:
             docs_meta = json.load(f)
-        print("Loaded index and docs meta from disk")
+        id_to_row = {m['id']: row for row, m in enumerate(docs_meta)}
+    chunk_paths = (os.path.join(path, cs.CHUNKS_PATH), os.path.join(path, cs.CHUNKS_INDEX_PATH))
+    chunk_store = None
+    if cs.exists(*chunk_paths):
+        chunk_store = cs.ChunkStore(*chunk_paths)
     else:
-        create_index()
+        print("No chunk store found, excerpts will be read from source files until the next /ingest")
+    bm25_index = bm25.BM25Index(os.path.join(path, bm25.BM25_DIR)) if bm25.exists(os.path.join(path, bm25.BM25_DIR)) else None
+    snap = Snapshot(version, path, index, docs_meta, id_to_row, info, chunk_store, bm25_index)
+    # measured here (in the threadpool) for the collections' memory budget; a pre-snapshot index in the
+    # working directory only counts its index file
+    snap.nbytes = kbc.snapshot_bytes(path) if version is not None else os.path.getsize(index_path)
+    return snap
+
+def load_index():
+    """Serve the CURRENT snapshot, or the index files in the working directory from before snapshots existed."""
+    version = snapshots.current_version(SNAPSHOTS_DIR)
+    loaded = None
+    if version is not None:
+        loaded = open_snapshot(os.path.join(SNAPSHOTS_DIR, version), version)
+    elif os.path.exists(INDEX_PATH):
+        loaded = open_snapshot(".", None)
+    if loaded is not None:
+        print(f"Loaded index and docs meta from disk (snapshot {loaded.version})")
+    set_snapshot(kbc.DEFAULT, loaded or empty_snapshot())
+
+def set_snapshot(name: str, snap: Snapshot):
+    """Serve snap for collection name from now on."""
+    global snapshot
+    if name == kbc.DEFAULT:
+        snapshot = snap
+    collections.put(name, snap)
+
+async def watch_snapshots():
+    """Swap in snapshots published by this or another process (for every loaded collection); loading happens off the event loop."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL_SECONDS)
+        for name, served in collections.loaded().items():
+            try:
+                root = collections.root(name)
+                version = snapshots.current_version(root)
+                if version is None or version == served.version:
+                    continue
+                loaded = await run_in_threadpool(open_snapshot, os.path.join(root, version), version)
+                if loaded is not None and snapshots.current_version(root) == version and collections.get(name) is not None:
+                    set_snapshot(name, loaded)
+                    print(f"Switched collection {name!r} to snapshot {version}")
+            except Exception as e:
+                print(f"Checking for a new snapshot of {name!r} failed: {e!r}")
+
+async def collection_snapshot(name: Optional[str], create: bool = False) -> Snapshot:
+    """
+    The served snapshot of a collection (None = default), loaded on first use. An unknown collection
+    is a 404, or an empty snapshot to ingest into when create is set.
+    """
+    try:
+        name = kbc.validate_name(name)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    if name == kbc.DEFAULT:
+        return snapshot
+    snap = collections.get(name)
+    if snap is not None:
+        return snap
+    task = collection_loads.get(name)
+    if task is None:
+        task = collection_loads[name] = asyncio.ensure_future(load_collection(name))
+        task.add_done_callback(lambda _: collection_loads.pop(name, None))
+    snap = await asyncio.shield(task)
+    if snap is None:
+        if not create:
+            raise HTTPException(404, detail=f"Unknown collection {name!r}; ingest into it first")
+        return empty_snapshot()
+    return snap
+
+async def load_collection(name: str) -> Optional[Snapshot]:
+    root = collections.root(name)
+    version = snapshots.current_version(root)
+    if version is None:
+        return None
+    loaded = await run_in_threadpool(open_snapshot, os.path.join(root, version), version)
+    if loaded is not None:
+        set_snapshot(name, loaded)
+        print(f"Loaded collection {name!r} (snapshot {version})")
+    return loaded
 
 load_index()
 
 class IngestRequest(BaseModel):
-    docs_dir: str  # path on server containing .txt/.md files
-    chunk_size: int = 500
-    overlap: int = 50
+    docs_dir: str  # path on server containing .txt/.md files, searched recursively
+    include: Optional[List[str]] = None  # file patterns to ingest, defaults to INGEST_INCLUDE
+    exclude: Optional[List[str]] = None  # file/directory patterns to skip, defaults to INGEST_EXCLUDE
+    chunker: Optional[str] = None  # "chars" or "markdown", defaults to INGEST_CHUNKER
+    chunk_size: Optional[int] = None  # characters for "chars", tokens for "markdown"; defaults per chunker
+    overlap: Optional[int] = None  # same unit as chunk_size
+    incremental: bool = False  # only embed new/changed chunks, keep vectors of unchanged ones
+    index_type: Optional[str] = None  # overrides INDEX_TYPE for this build
+    codec: Optional[str] = None  # overrides INDEX_CODEC
+    reduce: Optional[str] = None  # overrides INDEX_REDUCE
+    reduce_dim: Optional[int] = None  # overrides INDEX_REDUCE_DIM
+    collection: Optional[str] = None  # knowledge base to build, defaults to the default collection
 
 class ChatRequest(BaseModel):
     query: str
     page_context: dict = {}
     top_k: int = 4
+    nprobe: Optional[int] = None  # IVF search breadth, defaults to INDEX_NPROBE
+    ef_search: Optional[int] = None  # HNSW search breadth, defaults to INDEX_EF_SEARCH
+    retrieval: Optional[str] = None  # dense | lexical | hybrid, defaults to RETRIEVAL_MODE
+    page_id: Optional[str] = None  # from POST /pages, replaces page_context
+    collection: Optional[str] = None  # knowledge base to search, defaults to the default collection
+
+class ChatBatchRequest(BaseModel):
+    requests: List[ChatRequest]
+    concurrency: Optional[int] = None  # LLM calls in flight, defaults to CHAT_BATCH_CONCURRENCY
 
 def normalize(vecs):
     norms = np.linalg.norm(vecs, axis=1, keepdims=True)
     norms[norms == 0] = 1.0
     return vecs / norms
 
-def get_embeddings(texts: List[str]) -> np.ndarray:
-    """Get embeddings using Fuelix API with OpenAI text-embedding-3-small model"""
+def search_index(snap: Snapshot, q_emb: np.ndarray, k: int, req: ChatRequest):
+    return ix.search(snap.index, q_emb, k, req.nprobe or INDEX_NPROBE, req.ef_search or INDEX_EF_SEARCH)
+
+async def dense_search(snap: Snapshot, req: ChatRequest, k: int) -> List[int]:
+    q_emb = normalize(await embed_query(req.query)).astype('float32')
+    with metrics.timed(stage_seconds, "search"):
+        D, I = search_index(snap, q_emb, k, req)
+    return [snap.id_to_row[idx] for idx in I[0].tolist() if idx in snap.id_to_row]
+
+def retrieval_mode(req: ChatRequest) -> str:
+    mode = req.retrieval or RETRIEVAL_MODE
+    if mode not in ("dense", "lexical", "hybrid"):
+        raise HTTPException(400, detail=f"Unknown retrieval mode {mode!r}, expected dense, lexical or hybrid")
+    return mode
+
+async def retrieve(snap: Snapshot, req: ChatRequest, k: int) -> List[int]:
+    """
+    Rows of docs_meta for the top-k chunks. "dense" searches the FAISS index, "lexical" the BM25
+    index (no embedding call), "hybrid" fuses both with reciprocal-rank fusion and falls back to
+    lexical results when the query embedding fails or takes longer than QUERY_EMBED_TIMEOUT.
+    Results are cached per snapshot version (the degraded BM25-only fallback is not).
+    """
+    mode = retrieval_mode(req)
+    key = None
+    if retrieval_cache is not None:
+        key = rc.retrieval_key(req.query, snap.version, mode, k, req.nprobe, req.ef_search)
+        rows = retrieval_cache.get(key)
+        if rows is not None:
+            return list(rows)
+    rows, complete = await search_rows(snap, req, k, mode)
+    if key is not None and complete:
+        retrieval_cache.put(key, tuple(rows))
+    return rows
+
+async def search_rows(snap: Snapshot, req: ChatRequest, k: int, mode: str):
+    """(rows, False when hybrid fell back to BM25 only)."""
+    if snap.bm25_index is None or mode == "dense":
+        return await dense_search(snap, req, k), True
+    if mode == "lexical":
+        with metrics.timed(stage_seconds, "bm25"):
+            return snap.bm25_index.search(req.query, k), True
+
+    n_candidates = max(k, RRF_CANDIDATES)
+    with metrics.timed(stage_seconds, "bm25"):
+        lexical = snap.bm25_index.search(req.query, n_candidates)
+    try:
+        dense = await asyncio.wait_for(dense_search(snap, req, n_candidates), QUERY_EMBED_TIMEOUT)
+    except Exception as e:
+        print(f"Dense retrieval unavailable ({e!r}), answering from BM25 only")
+        return lexical[:k], False
+    return bm25.rrf([dense, lexical], RRF_K)[:k], True
+
+async def retrieve_many(snap: Snapshot, reqs: List[ChatRequest], ks: List[int]) -> List[Optional[List[int]]]:
+    """
+    retrieve() for many requests at once: the queries are embedded together (CHAT_BATCH_EMBED_MAX per
+    call) and searched with one index.search per distinct (k, nprobe, ef_search). Entries are None
+    where dense retrieval failed, so the caller can retry that request on its own.
+    """
+    results: List[Optional[List[int]]] = [None] * len(reqs)
+    todo = []  # (i, req, k, mode, cache key)
+    for i, (req, k) in enumerate(zip(reqs, ks)):
+        mode = retrieval_mode(req)
+        key = rc.retrieval_key(req.query, snap.version, mode, k, req.nprobe, req.ef_search) if retrieval_cache is not None else None
+        cached = retrieval_cache.get(key) if key is not None else None
+        if cached is not None:
+            results[i] = list(cached)
+        else:
+            todo.append((i, req, k, mode, key))
+
+    def only_dense(mode):
+        return snap.bm25_index is None or mode == "dense"
+
+    dense = {}
+    need_dense = [t for t in todo if only_dense(t[3]) or t[3] == "hybrid"]
+    if need_dense:
+        queries = list(dict.fromkeys(t[1].query for t in need_dense))
+        try:
+            with metrics.timed(stage_seconds, "embed"):
+                vecs = await asyncio.gather(*(get_embeddings(queries[j:j + CHAT_BATCH_EMBED_MAX])
+                                              for j in range(0, len(queries), CHAT_BATCH_EMBED_MAX)))
+            by_query = dict(zip(queries, normalize(np.vstack(vecs)).astype('float32')))
+            groups = {}
+            for t in need_dense:
+                n = t[2] if only_dense(t[3]) else max(t[2], RRF_CANDIDATES)
+                groups.setdefault((n, t[1].nprobe, t[1].ef_search), []).append(t)
+            for (n, _, _), group in groups.items():
+                q_embs = np.stack([by_query[t[1].query] for t in group])
+                with metrics.timed(stage_seconds, "search"):
+                    D, I = await run_in_threadpool(search_index, snap, q_embs, n, group[0][1])
+                for t, ids in zip(group, I.tolist()):
+                    dense[t[0]] = [snap.id_to_row[idx] for idx in ids if idx in snap.id_to_row]
+        except Exception as e:
+            print(f"Batched dense retrieval failed ({e!r}), items fall back to per-request retrieval")
+
+    for i, req, k, mode, key in todo:
+        if only_dense(mode):
+            rows = dense.get(i)
+            if rows is None:
+                continue
+        elif mode == "lexical":
+            with metrics.timed(stage_seconds, "bm25"):
+                rows = snap.bm25_index.search(req.query, k)
+        else:
+            if i not in dense:
+                continue
+            with metrics.timed(stage_seconds, "bm25"):
+                lexical = snap.bm25_index.search(req.query, max(k, RRF_CANDIDATES))
+            rows = bm25.rrf([dense[i], lexical], RRF_K)[:k]
+        rows = list(rows)
+        if key is not None:
+            retrieval_cache.put(key, tuple(rows))
+        results[i] = rows
+    return results
+
+async def select_page_content(req: ChatRequest, content: str, session: Optional[ps.PageSession] = None) -> str:
+    """The passages of the page most relevant to the query, within PAGE_CONTEXT_TOKEN_BUDGET."""
+    if pc.estimate_tokens(content) <= PAGE_CONTEXT_TOKEN_BUDGET:
+        return content
+    key = pc.page_key(req.page_context.get('url', ''), content)
+    cached = page_cache.get(key) if session is None else (session.passages, session.embeddings)
+    if cached is not None:
+        passages, embs = cached
+    else:
+        passages, embs = await run_in_threadpool(pc.chunk_page, content, PAGE_CHUNK_CHARS), None
     try:
-        response = embedding_client.embeddings.create(
-            model=EMBEDDING_MODEL,
-            input=texts
-        )
-        embeddings = [item.embedding for item in response.data]
-        return np.array(embeddings)
+        if embs is None:
+            embs = await embed_chunks(passages)
+            if session is not None:
+                session.embeddings = embs
+            else:
+                page_cache.put(key, passages, embs)
+        q_emb = normalize(await embed_query(req.query)).astype('float32')
+        scores = embs @ q_emb[0]
+    except Exception as e:
+        print(f"Ranking page passages by embedding failed ({e!r}), ranking them lexically")
+        scores = pc.lexical_scores(req.query, passages)
+    return pc.select_passages(passages, scores, PAGE_CONTEXT_TOKEN_BUDGET)
+
+def hit_title(meta: dict) -> str:
+    """File name plus the Markdown heading path of the chunk, when it has one."""
+    title = meta.get('title', '')
+    return f"{title}{chunkers.HEADING_SEP}{meta['heading_path']}" if meta.get('heading_path') else title
+
+def get_excerpt(snap: Snapshot, row: int, limit: int) -> str:
+    """Text of the chunk at position row, from the chunk store when available."""
+    try:
+        if snap.chunk_store is not None:
+            text = snap.chunk_store.text(row)
+        else:
+            # index built before the chunk store existed: fall back to the source file
+            with open(snap.docs_meta[row]['source'], 'r', encoding='utf-8') as fh:
+                text = fh.read()
+        return text[:limit].replace('\n', ' ')
+    except Exception:
+        return ""
+
+async def get_embeddings(texts: List[str]) -> np.ndarray:
+    """Get embeddings for texts, serving what we can from the embedding cache and sending only the misses upstream"""
+    if embedding_cache is None:
+        return await fetch_embeddings(texts)
+    cached = await run_in_threadpool(embedding_cache.get_many, texts)
+    misses = list(dict.fromkeys(t for t, v in zip(texts, cached) if v is None))
+    if misses:
+        fresh = await fetch_embeddings(misses)
+        fresh = await run_in_threadpool(embedding_cache.put_many, misses, fresh)
+        by_text = dict(zip(misses, fresh))
+        cached = [v if v is not None else by_text[t] for t, v in zip(texts, cached)]
+    return np.stack(cached).astype('float32')
+
+async def embed_query(query: str) -> np.ndarray:
+    """(1, dim) embedding of a chat query, batched with concurrent queries when enabled"""
+    with metrics.timed(stage_seconds, "embed"):
+        if query_batcher is None:
+            return await get_embeddings([query])
+        return (await query_batcher.embed(query))[None, :]
+
+async def fetch_embeddings(texts: List[str]) -> np.ndarray:
+    """Get embeddings from the configured embedder (remote API or local model)"""
+    try:
+        async with embed_limiter.reserve():
+            return await embedder.embed(texts)
+    except HTTPException:
+        raise  # admission.Overloaded: 429/503 with Retry-After
     except Exception as e:
         raise HTTPException(500, detail=f"Embedding error: {e}")
 
+async def embed_chunks(chunks: List[str]) -> np.ndarray:
+    """Embed chunks in batches, up to INGEST_EMBED_CONCURRENCY batches in flight, and return normalized float32 vectors."""
+    if not chunks:
+        return np.zeros((0, EMBED_DIM), dtype='float32')
+    # compute embeddings in batches using Fuelix API
+    batch_size = 20  # Smaller batch size for API calls
+    sem = asyncio.Semaphore(INGEST_EMBED_CONCURRENCY)
+
+    async def embed_batch(batch):
+        async with sem:
+            return await get_embeddings(batch)
+
+    all_embs = await asyncio.gather(*(
+        embed_batch(chunks[i:i+batch_size]) for i in range(0, len(chunks), batch_size)
+    ))
+    all_embs = np.vstack(all_embs)
+    return normalize(all_embs).astype('float32')
+
+def publish_snapshot(new_index, layout: dict, manifest: dict, write_rows, collection: str = kbc.DEFAULT,
+                     base: Optional[str] = snapshots.ANY_VERSION) -> Snapshot:
+    """
+    Publish a freshly built index as a new snapshot of collection and swap it in. write_rows(path)
+    writes the row-aligned files (columnar metadata, chunk store, BM25 postings) into path.
+    base is the version it was built on, see snapshots.publish().
+    """
+    root = collections.root(collection)
+    info = {"embedding_model": EMBEDDING_MODEL, "dim": EMBED_DIM, **layout}
+    os.makedirs(root, exist_ok=True)
+    path = snapshots.staging_dir(root)
+    faiss.write_index(new_index, os.path.join(path, INDEX_PATH))
+    with open(os.path.join(path, INDEX_INFO_PATH), 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    inc.save_manifest(manifest, os.path.join(path, inc.MANIFEST_PATH))
+    write_rows(path)
+    version = snapshots.publish(path, root, base)
+    path = os.path.join(root, version)
+
+    # the writer already has the index in memory; the row-aligned stores are opened memory-mapped
+    docs_meta = ms.MetaStore(path)
+    published = Snapshot(version, path, new_index, docs_meta, ms.IdLookup(docs_meta), info,
+                         cs.ChunkStore(os.path.join(path, cs.CHUNKS_PATH), os.path.join(path, cs.CHUNKS_INDEX_PATH)),
+                         bm25.BM25Index(os.path.join(path, bm25.BM25_DIR)))
+    published.nbytes = kbc.snapshot_bytes(path)
+    set_snapshot(collection, published)
+    snapshots.prune(SNAPSHOT_KEEP, root)
+    print(f"Published snapshot {version}" + (f" of collection {collection!r}" if collection != kbc.DEFAULT else ""))
+    return published
+
+def save_ingest(new_index, metas, chunks, spans, manifest, layout, collection: str = kbc.DEFAULT,
+                base: Optional[str] = snapshots.ANY_VERSION) -> Snapshot:
+    """Publish an index whose metadata and chunks are held in memory (incremental ingest)."""
+    def write_rows(path):
+        ms.write_meta_store(metas, path)
+        if WRITE_DOCS_META_JSON:
+            ms.write_json(metas, os.path.join(path, DOCS_META_PATH))
+        cs.write_chunk_store(chunks, spans, os.path.join(path, cs.CHUNKS_PATH), os.path.join(path, cs.CHUNKS_INDEX_PATH))
+        bm25.build_bm25(chunks, os.path.join(path, bm25.BM25_DIR))
+    return publish_snapshot(new_index, layout, manifest, write_rows, collection, base)
+
+def ingest_files(req: IngestRequest):
+    """Validated (files, layout) for an ingest request; raises 400 on bad input."""
+    if SERVE_READ_ONLY:
+        raise HTTPException(403, detail="Server is in read-only serving mode (SERVE_READ_ONLY); run /ingest on a writer process")
+    try:
+        req.collection = kbc.validate_name(req.collection)
+    except ValueError as e:
+        raise HTTPException(400, detail=str(e))
+    if not os.path.isdir(req.docs_dir):
+        raise HTTPException(400, detail=f"docs_dir {req.docs_dir!r} is not a directory")
+    include = req.include or INGEST_INCLUDE
+    files = dl.find_files(req.docs_dir, include, req.exclude if req.exclude is not None else INGEST_EXCLUDE)
+    if not files:
+        raise HTTPException(400, detail=f"No files matching {include} found in docs_dir")
+    req.chunker = req.chunker or INGEST_CHUNKER
+    if req.chunker not in chunkers.CHUNKERS:
+        raise HTTPException(400, detail=f"Unknown chunker {req.chunker!r}, expected one of {tuple(chunkers.CHUNKERS)}")
+    # resolved here so a resumed job cuts chunks exactly like the run it continues
+    default_size, default_overlap = chunkers.DEFAULT_SIZES[req.chunker]
+    req.chunk_size = req.chunk_size or default_size
+    req.overlap = req.overlap if req.overlap is not None else default_overlap
+    if req.chunk_size <= req.overlap:
+        raise HTTPException(400, detail="chunk_size must be larger than overlap")
+
+    layout = {
+        "index_type": req.index_type or INDEX_TYPE,
+        "codec": req.codec or INDEX_CODEC,
+        "reduce": req.reduce or INDEX_REDUCE,
+        "reduce_dim": req.reduce_dim if req.reduce_dim is not None else INDEX_REDUCE_DIM,
+    }
+    if layout["index_type"] not in ix.INDEX_TYPES:
+        raise HTTPException(400, detail=f"Unknown index_type {layout['index_type']!r}, expected one of {ix.INDEX_TYPES}")
+    if layout["codec"] not in ix.CODECS:
+        raise HTTPException(400, detail=f"Unknown codec {layout['codec']!r}, expected one of {tuple(ix.CODECS)}")
+    if layout["reduce"] not in ix.REDUCTIONS:
+        raise HTTPException(400, detail=f"Unknown reduce {layout['reduce']!r}, expected one of {ix.REDUCTIONS}")
+    if layout["reduce"] != "none" and not 0 < layout["reduce_dim"] < EMBED_DIM:
+        raise HTTPException(400, detail=f"reduce_dim must be between 1 and {EMBED_DIM - 1} with reduce={layout['reduce']!r}, "
+                                        f"got {layout['reduce_dim']}")
+    # find_files() sorts, so a resumed job walks the files in the same order
+    return files, layout
+
+async def start_ingest_job(req: IngestRequest) -> ij.IngestJob:
+    files, layout = await run_in_threadpool(ingest_files, req)
+    job = await run_in_threadpool(ij.IngestJob.create, req.dict(), layout, files, INGEST_JOBS_DIR)
+    running_jobs[job.id] = job
+    job.task = asyncio.create_task(run_ingest_job(job))
+    return job
+
+async def run_ingest_job(job: ij.IngestJob):
+    """
+    Run (or resume) a job: chunks are read, embedded and committed INGEST_BATCH_CHUNKS at a time,
+    then the index is built and published as a snapshot. With incremental=True only new or changed
+    chunks are embedded; see ingest_incremental().
+    """
+    admission.set_lane(admission.INGEST)  # embedding batches yield to chat and batch requests
+    req = IngestRequest(**job.state["request"])
+    req.chunker = req.chunker or "chars"  # jobs created before chunkers.py always cut by characters
+    layout = job.state["layout"]
+    files = job.state["files"]
+    collection = kbc.validate_name(req.collection)  # jobs created before collections have none
+    root = collections.root(collection)
+    os.makedirs(root, exist_ok=True)
+    # one ingest per collection across all worker processes, held from reading the base to publishing
+    lock = file_lock.FileLock(os.path.join(root, snapshots.LOCK_FILE))
+    try:
+        async with ingest_locks.setdefault(collection, asyncio.Lock()):
+            await lock.acquire_async()
+            current = snapshots.current_version(root)
+            base = await collection_snapshot(collection, create=True)
+            if current is not None and current != base.version:
+                # published by another worker since this one last polled
+                base = await run_in_threadpool(open_snapshot, os.path.join(root, current), current) or base
+                if base.version == current:
+                    set_snapshot(collection, base)
+            if req.incremental and job.state["chunks_done"] == 0:
+                # keep the base's index layout for whatever the request leaves unset, for the
+                # incremental update and for a full rebuild alike
+                for k in layout:
+                    if getattr(req, k) is None and base.info.get(k) is not None:
+                        layout[k] = base.info[k]
+                manifest = inc.load_manifest(os.path.join(base.path, inc.MANIFEST_PATH)) if base.path else None
+                job.state["rebuild_reason"] = incremental_blocker(base, req, layout, manifest)
+                if job.state["rebuild_reason"] is None:
+                    job.set_status("running", "incremental")
+                    job.state["result"] = {**await ingest_incremental(base, req, files, manifest), "collection": collection}
+                    job.set_status("done")
+                    return
+
+            job.set_status("running", "embedding")
+            # reading, scratch writes and closing run on one thread of their own, in order: a step that
+            # is still running when the job is cancelled finishes before the reader and scratch files
+            # are closed (closing a generator another thread is inside raises)
+            io = ThreadPoolExecutor(1, thread_name_prefix=f"ingest-{job.id}")
+            loop = asyncio.get_running_loop()
+            loaded = None
+
+            def close_reader():
+                try:
+                    if loaded is not None:
+                        loaded.close()  # shuts down the doc_loader process pool
+                finally:
+                    job.close_scratch()
+
+            try:
+                await loop.run_in_executor(io, job.open_scratch)
+                loaded = dl.load_files(files, req.chunker, req.chunk_size, req.overlap, INGEST_WORKERS)
+                chunks = ij.iter_chunks(loaded, job.state["chunks_done"], job.add_error)
+                while True:
+                    # files are read and chunked ahead on the process pool while a batch is embedded
+                    batch = await loop.run_in_executor(io, lambda: list(itertools.islice(chunks, INGEST_BATCH_CHUNKS)))
+                    if not batch:
+                        break
+                    embs = await embed_chunks([item[0] for item in batch])
+                    await loop.run_in_executor(io, job.commit_batch, batch, embs)
+            finally:
+                closed = io.submit(close_reader)
+                io.shutdown(wait=False)
+                try:
+                    await asyncio.shield(asyncio.wrap_future(closed))
+                except asyncio.CancelledError:
+                    pass  # cancelled again while closing: the close still runs on the job's thread
+
+            job.set_status("finalizing", "indexing")
+            job.state["result"] = await run_in_threadpool(finalize_ingest_job, job, current)
+            job.set_status("done")
+    except asyncio.CancelledError:
+        # shutdown or a cancelled task: the committed batches stay, the job can be resumed
+        job.set_status("interrupted", job.state["stage"])
+        raise
+    except Exception as e:
+        job.add_error(str(e) or repr(e))
+        job.set_status("failed", job.state["stage"])
+    finally:
+        lock.release()
+        job.release()
+        running_jobs.pop(job.id, None)
+        ij.prune_jobs(INGEST_JOBS_DIR, INGEST_JOBS_KEEP)
+
+def finalize_ingest_job(job: ij.IngestJob, base: Optional[str]) -> dict:
+    """
+    Build the index from the job's committed vectors and publish it on top of version base; returns
+    the ingest result.
+    """
+    req = IngestRequest(**job.state["request"])
+    layout = job.state["layout"]
+    n = job.state["chunks_done"]
+    if n == 0:
+        raise ValueError("No chunks could be read from docs_dir")
+    vectors = job.vectors()
+    # create new index (trained on a sample of the corpus if the type needs it); ids are stable across incremental re-ingests
+    new_index = ix.build_index(layout["index_type"], EMBED_DIM, vectors, nlist=INDEX_NLIST, pq_m=INDEX_PQ_M,
+                               hnsw_m=INDEX_HNSW_M, ef_construction=INDEX_EF_CONSTRUCTION, codec=layout["codec"],
+                               reduce=layout["reduce"], reduce_dim=layout["reduce_dim"])
+    ids = np.arange(n, dtype='int64')
+    for start in range(0, n, INGEST_BATCH_CHUNKS):
+        new_index.add_with_ids(np.ascontiguousarray(vectors[start:start + INGEST_BATCH_CHUNKS]),
+                               ids[start:start + INGEST_BATCH_CHUNKS])
+    manifest = job.manifest(inc.new_manifest(req.chunk_size, req.overlap, EMBEDDING_MODEL, req.chunker))
+
+    def write_rows(path):
+        ms.write_meta_store(job.iter_metas(), path)
+        if WRITE_DOCS_META_JSON:
+            ms.write_json(job.iter_metas(), os.path.join(path, DOCS_META_PATH))
+        job.move_chunk_store(os.path.join(path, cs.CHUNKS_PATH), os.path.join(path, cs.CHUNKS_INDEX_PATH))
+        store = cs.ChunkStore(os.path.join(path, cs.CHUNKS_PATH), os.path.join(path, cs.CHUNKS_INDEX_PATH))
+        bm25.build_bm25((store.text(i) for i in range(len(store))), os.path.join(path, bm25.BM25_DIR))
+        store.close()
+
+    collection = kbc.validate_name(req.collection)
+    published = publish_snapshot(new_index, layout, manifest, write_rows, collection, base)
+    result = {"status": "ok", "num_chunks": n, "index_type": layout["index_type"], "snapshot": published.version,
+              "collection": collection}
+    if not (layout["codec"] == "float32" and layout["reduce"] == "none" and layout["index_type"] != "ivf_pq"):
+        result["compression"] = ix.compression_report(new_index, vectors, ids,
+                                                      os.path.getsize(os.path.join(published.path, INDEX_PATH)),
+                                                      nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+        print(f"Compressed index: {result['compression']}")
+    del vectors
+    job.remove_scratch()
+    return result
+
 @app.post("/ingest")
-def ingest(req: IngestRequest):
+async def ingest(req: IngestRequest):
     """
     Ingest all text files from a directory, chunk them, create embeddings, and build FAISS index.
+    Runs as an ingest job (see /ingest/jobs) and waits for it to finish.
     """
-    import glob, os
-    global index, docs_meta
+    job = await start_ingest_job(req)
+    # shielded: a client that disconnects does not cancel the job
+    await asyncio.shield(job.task)
+    if job.state["status"] != "done":
+        raise HTTPException(500, detail=f"Ingest job {job.id} failed: {job.state['errors'][-1]}")
+    return {**job.state["result"], "job_id": job.id}
 
-    files = []
-    exts = ("*.txt", "*.md")
-    for e in exts:
-        files.extend(glob.glob(os.path.join(req.docs_dir, e)))
-    if not files:
-        raise HTTPException(400, detail="No txt or md files found in docs_dir")
+@app.post("/ingest/jobs", status_code=202)
+async def create_ingest_job(req: IngestRequest):
+    """Start an ingest in the background; poll GET /ingest/jobs/{job_id} for progress."""
+    return (await start_ingest_job(req)).progress()
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs():
+    return [running_jobs.get(job.id, job).progress() for job in ij.list_jobs(INGEST_JOBS_DIR)]
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = running_jobs.get(job_id) or ij.find_job(job_id, INGEST_JOBS_DIR)
+    if job is None:
+        raise HTTPException(404, detail=f"No ingest job {job_id}")
+    return job.progress()
+
+@app.post("/ingest/jobs/{job_id}/resume", status_code=202)
+async def resume_ingest_job(job_id: str):
+    """Continue an interrupted or failed job from its last committed batch."""
+    if SERVE_READ_ONLY:
+        raise HTTPException(403, detail="Server is in read-only serving mode (SERVE_READ_ONLY); run /ingest on a writer process")
+    job = ij.find_job(job_id, INGEST_JOBS_DIR)
+    if job is None:
+        raise HTTPException(404, detail=f"No ingest job {job_id}")
+    # whoever holds the job's lock runs it, so two workers never resume the same job
+    if not job.claim():
+        raise HTTPException(409, detail=f"Ingest job {job_id} is running, only interrupted or failed jobs can be resumed")
+    if job.state["status"] not in ("interrupted", "failed"):
+        job.release()
+        raise HTTPException(409, detail=f"Ingest job {job_id} is {job.state['status']}, only interrupted or failed jobs can be resumed")
+    running_jobs[job.id] = job
+    job.set_status("queued")
+    job.task = asyncio.create_task(run_ingest_job(job))
+    return job.progress()
+
+def incremental_blocker(base: Snapshot, req: IngestRequest, layout: dict, manifest: Optional[dict]) -> Optional[str]:
+    """Why an incremental ingest cannot build on base (so a full rebuild is done instead), None when it can."""
+    if manifest is None:
+        return "the current snapshot has no ingest manifest"
+    if not inc.is_compatible(manifest, req.chunk_size, req.overlap, EMBEDDING_MODEL, req.chunker):
+        return "chunker, chunk_size, overlap or embedding model differ from the current snapshot"
+    if not isinstance(base.index, faiss.IndexIDMap2) or base.chunk_store is None:
+        return "the current snapshot predates stable vector ids"
+    changed = [k for k, v in layout.items() if base.info.get(k) != v]
+    if changed:
+        return f"the index layout differs from the current snapshot ({', '.join(changed)})"
+    if not ix.supports_removal(base.index):
+        return f"{ix.index_type_of(base.index)} indexes cannot remove vectors"
+    return None
 
+async def ingest_incremental(base: Snapshot, req: IngestRequest, files: List[str], manifest: dict):
+    """
+    Re-ingest against the manifest of the previous run: unchanged files keep their chunks and
+    vectors, changed files only embed chunks whose hash is new, and vectors of chunks that
+    disappeared are removed by id.
+    """
+    plan = await run_in_threadpool(plan_incremental, base, req, files, manifest)
+    chunks, spans, metas, new_files, embed_positions, embed_ids, next_id = plan
+
+    stale = inc.stale_ids(manifest["files"], new_files)
+    added, changed, removed = inc.diff_summary(manifest["files"], new_files)
+    if not embed_ids and not stale and not (added or changed or removed):
+        return {"status": "ok", "num_chunks": len(chunks), "embedded": 0, "removed": 0}
+
+    new_embs = await embed_chunks([chunks[i] for i in embed_positions])
+
+    manifest["files"] = new_files
+    manifest["next_id"] = next_id
+    await run_in_threadpool(apply_incremental, base, new_embs, embed_ids, stale, metas, chunks, spans, manifest,
+                            kbc.validate_name(req.collection))
+    print(f"Incremental ingest: {added} added, {changed} changed, {removed} removed files; "
+          f"embedded {len(embed_ids)} chunks, removed {len(stale)} vectors")
+
+    return {"status": "ok", "num_chunks": len(chunks), "embedded": len(embed_ids), "removed": len(stale)}
+
+def plan_incremental(base: Snapshot, req: IngestRequest, files: List[str], manifest: dict):
     chunks = []
+    spans = []
     metas = []
-    id_counter = 0
+    new_files = {}
+    embed_positions = []  # positions in chunks that need a fresh embedding
+    embed_ids = []
+    next_id = manifest["next_id"]
+
+    def carry_over(old):
+        # unchanged file: carry its chunks over from the current chunk store
+        for cid, _ in old["chunks"]:
+            row = base.id_to_row[cid]
+            chunks.append(base.chunk_store.text(row))
+            spans.append(base.chunk_store.span(row))
+            metas.append(base.docs_meta[row])
+
+    # files whose size and mtime match the manifest are not even opened; the rest are read on the process pool
+    stats = {}
     for fpath in files:
-        with open(fpath, 'r', encoding='utf-8') as fh:
-            text = fh.read()
-        # simple chunking by characters to keep things simple.
-        L = len(text)
-        i = 0
-        while i < L:
-            chunk = text[i:i+req.chunk_size]
-            chunks.append(chunk)
-            metas.append({"id": id_counter, "title": os.path.basename(fpath), "source": fpath})
-            id_counter += 1
-            i += req.chunk_size - req.overlap
+        try:
+            stats[fpath] = dl.file_stat(fpath)
+        except OSError:
+            stats[fpath] = None
+    unchanged = {fpath for fpath in files
+                 if fpath in manifest["files"] and stats[fpath] is not None
+                 and (manifest["files"][fpath].get("mtime_ns"), manifest["files"][fpath].get("size")) == stats[fpath]}
+    loaded = dl.load_files([f for f in files if f not in unchanged], req.chunker, req.chunk_size, req.overlap, INGEST_WORKERS)
+    try:
+        for fpath in files:
+            old = manifest["files"].get(fpath)
+            if fpath in unchanged:
+                carry_over(old)
+                new_files[fpath] = old
+                continue
 
-    # compute embeddings in batches using Fuelix API
-    batch_size = 20  # Smaller batch size for API calls
-    all_embs = []
-    for i in range(0, len(chunks), batch_size):
-        batch = chunks[i:i+batch_size]
-        embs = get_embeddings(batch)
-        all_embs.append(embs)
-    all_embs = np.vstack(all_embs)
-    all_embs = normalize(all_embs)
+            f = next(loaded)
+            if f["error"] is not None:
+                print(f"Skipping {f['error']}")
+                if old is not None:  # keep what was ingested before rather than dropping it on a read error
+                    carry_over(old)
+                    new_files[fpath] = old
+                continue
+            if old is not None and old["hash"] == f["hash"]:
+                carry_over(old)
+                new_files[fpath] = {**old, "mtime_ns": f["mtime_ns"], "size": f["size"]}
+                continue
 
-    # create new index
-    index = faiss.IndexFlatIP(EMBED_DIM)
-    index.add(all_embs.astype('float32'))
+            reusable = inc.reusable_ids(old)
+            entry = {"hash": f["hash"], "mtime_ns": f["mtime_ns"], "size": f["size"], "chunks": []}
+            for chunk, start, end, chash, headings in f["chunks"]:
+                if reusable.get(chash):
+                    cid = reusable[chash].pop(0)
+                else:
+                    cid = next_id
+                    next_id += 1
+                    embed_positions.append(len(chunks))
+                    embed_ids.append(cid)
+                chunks.append(chunk)
+                spans.append((start, end))
+                metas.append({"id": cid, "title": os.path.basename(fpath), "source": fpath,
+                              "start": start, "end": end, "heading_path": headings})
+                entry["chunks"].append([cid, chash])
+            new_files[fpath] = entry
+    finally:
+        loaded.close()  # shuts the process pool down on errors too
 
-    docs_meta = metas
-    faiss.write_index(index, INDEX_PATH)
-    with open(DOCS_META_PATH, 'w', encoding='utf-8') as f:
-        json.dump(docs_meta, f, ensure_ascii=False, indent=2)
+    return chunks, spans, metas, new_files, embed_positions, embed_ids, next_id
 
-    return {"status": "ok", "num_chunks": len(chunks)}
+def apply_incremental(base: Snapshot, new_embs, embed_ids, stale, metas, chunks, spans, manifest, collection: str):
+    # update a copy so requests searching the live index never see a half-applied diff
+    new_index = faiss.clone_index(base.index)
+    if stale:
+        new_index.remove_ids(np.array(stale, dtype='int64'))
+    if embed_ids:
+        new_index.add_with_ids(new_embs, np.array(embed_ids, dtype='int64'))
+    layout = {k: base.info[k] for k in ("index_type", "codec", "reduce", "reduce_dim")}
+    save_ingest(new_index, metas, chunks, spans, manifest, layout, collection, base.version)
 
-@app.post("/chat")
-def chat(req: ChatRequest):
+async def kb_excerpts(snap: Snapshot, req: ChatRequest, k: int, max_chars: int, rows: Optional[List[int]] = None):
+    """(hits, [(title, excerpt)]) for the top-k knowledge-base chunks (retrieved unless rows are given)."""
+    if rows is None:
+        rows = await retrieve(snap, req, k)
+    hits, excerpts = [], []
+    with metrics.timed(stage_seconds, "excerpts"):
+        for row in rows:
+            h = snap.docs_meta[row]
+            hits.append(h)
+            excerpts.append((hit_title(h), get_excerpt(snap, row, max_chars)))
+    return hits, excerpts
+
+def webpage_content_of(req: ChatRequest, session: Optional[ps.PageSession] = None) -> str:
+    return session.content if session is not None else req.page_context.get('content', '').strip()
+
+def kb_top_k(req: ChatRequest, session: Optional[ps.PageSession] = None) -> int:
+    """Knowledge-base chunks build_prompt() retrieves for req."""
+    if len(webpage_content_of(req, session)) > MIN_PAGE_CONTENT_CHARS:
+        return min(req.top_k, SUPPLEMENTARY_TOP_K)  # Fewer chunks since we have webpage content
+    return req.top_k
+
+async def build_prompt(req: ChatRequest, session: Optional[ps.PageSession] = None,
+                       snap: Optional[Snapshot] = None, rows: Optional[List[int]] = None):
     """
-    Accepts a query, prioritizes webpage content if available, falls back to FAISS retrieval,
-    and calls the LLM to produce an answer grounded in the most relevant context.
+    Prioritizes webpage content if available and falls back to knowledge-base retrieval.
+    session is the registered page of req.page_id, whose passages, embeddings and media are reused.
+    rows, when given, are the already retrieved kb_top_k() rows of snap (see retrieve_many()).
+    Returns (system_prompt, user_prompt, hits, prompt token counts per section).
     """
     # Check if webpage content is available
-    webpage_content = req.page_context.get('content', '').strip()
-    code_blocks = req.page_context.get('codeBlocks', [])
-    images = req.page_context.get('images', [])
-    videos = req.page_context.get('videos', [])
-    has_webpage_content = len(webpage_content) > 50  # Minimum content threshold
-    
-    context_parts = []
+    webpage_content = webpage_content_of(req, session)
+    has_webpage_content = len(webpage_content) > MIN_PAGE_CONTENT_CHARS
+    snap = snap or snapshot  # pinned for the whole request, even if a new snapshot is swapped in meanwhile
+    sections = []
     hits = []
-    
+    kb_section = None
+
     if has_webpage_content:
-        # Use webpage content as primary source
-        page_title = req.page_context.get('title', 'Current Webpage')
-        page_url = req.page_context.get('url', '')
-        
-        context_parts.append(f"=== CURRENT WEBPAGE CONTENT ===")
-        context_parts.append(f"Title: {page_title}")
-        context_parts.append(f"URL: {page_url}")
-        context_parts.append(f"Content: {webpage_content}")
-        
-        # Add code blocks if available
-        if code_blocks:
-            context_parts.append(f"\n=== CODE BLOCKS ON PAGE ({len(code_blocks)} found) ===")
-            for i, block in enumerate(code_blocks[:5]):  # Limit to first 5 code blocks
-                context_parts.append(f"Code Block {i+1} ({block.get('language', 'text')}):")
-                context_parts.append(f"Context: {block.get('context', 'No context')}")
-                context_parts.append(f"Code:\n{block.get('code', '')}\n---")
-        
-        # Add images if available
-        if images:
-            context_parts.append(f"\n=== IMAGES ON PAGE ({len(images)} found) ===")
-            for i, img in enumerate(images[:3]):  # Limit to first 3 images
-                context_parts.append(f"Image {i+1}:")
-                context_parts.append(f"Alt text: {img.get('alt', 'No alt text')}")
-                context_parts.append(f"Caption: {img.get('caption', 'No caption')}")
-                context_parts.append(f"Source: {img.get('src', 'No source')}")
-                context_parts.append(f"Context: {img.get('context', 'No context')}\n---")
-        
-        # Add videos if available
-        if videos:
-            context_parts.append(f"\n=== VIDEOS ON PAGE ({len(videos)} found) ===")
-            for i, video in enumerate(videos[:3]):  # Limit to first 3 videos
-                context_parts.append(f"Video {i+1}:")
-                context_parts.append(f"Title: {video.get('title', 'No title')}")
-                context_parts.append(f"Caption: {video.get('caption', 'No caption')}")
-                context_parts.append(f"Source: {video.get('src', 'No source')}")
-                context_parts.append(f"Context: {video.get('context', 'No context')}\n---")
-        
-        context_parts.append(f"=== END WEBPAGE CONTENT ===\n")
-        
-        # Also get some relevant chunks from knowledge base as supplementary context
-        if index is not None and len(docs_meta) > 0:
+        # Use webpage content as primary source. Selecting page passages and the supplementary KB search
+        # are independent, so they run concurrently (both embed the same query, which the query batcher
+        # and embedding cache share)
+        async def page_content():
+            with metrics.timed(stage_seconds, "page_context"):
+                return await select_page_content(req, webpage_content, session)
+
+        async def supplementary():
+            if len(snap.docs_meta) == 0:
+                return None
             try:
-                q_emb = get_embeddings([req.query])
-                q_emb = normalize(q_emb).astype('float32')
-                D, I = index.search(q_emb, min(req.top_k, 2))  # Fewer chunks since we have webpage content
-                I = I[0].tolist()
-                
-                context_parts.append("=== SUPPLEMENTARY KNOWLEDGE BASE ===")
-                for idx in I:
-                    if idx >= 0 and idx < len(docs_meta):
-                        h = docs_meta[idx]
-                        hits.append(h)
-                        try:
-                            with open(h['source'], 'r', encoding='utf-8') as fh:
-                                text = fh.read()
-                            excerpt = text[:300].replace('\n', ' ')
-                        except Exception:
-                            excerpt = ""
-                        context_parts.append(f"Title: {h.get('title','')}\nExcerpt: {excerpt}\n---")
-                context_parts.append("=== END KNOWLEDGE BASE ===")
+                return await kb_excerpts(snap, req, kb_top_k(req, session), 300, rows)
             except Exception:
-                pass  # Continue without knowledge base if there's an error
-        
-        system_prompt = (
-            "You are a helpful and conversational AI assistant that answers questions about webpages in a natural, human-friendly way. "
-            "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, code blocks (```), and other Markdown formatting. "
-            "PRIORITIZE the webpage content provided above all other sources. Use the supplementary knowledge base only if the webpage content doesn't contain the answer. "
-            "When relevant to the user's question, include and reference code blocks, images, or videos from the webpage. "
-            "For code blocks, use proper syntax highlighting with language tags (```javascript, ```python, etc.). "
-            "For images, describe them and mention their purpose when relevant. "
-            "For videos, reference their titles and content when applicable. "
-            "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
-            "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
-        )
-        
+                return None  # Continue without knowledge base if there's an error
+
+        page_text, kb = await asyncio.gather(page_content(), supplementary())
+        media = session.media if session is not None else media_cache.get(req.page_context)
+        sections.extend(pb.webpage_sections(req.page_context, page_text, media))
+        if kb is not None:
+            hits, excerpts = kb
+            kb_section = pb.knowledge_base_section(excerpts, supplementary=True)
+            sections.append(kb_section)
+
+        system_prompt = pb.SYSTEM_PROMPT_WEBPAGE
+
     else:
         # Fall back to knowledge base only
-        if index is None or len(docs_meta) == 0:
+        if len(snap.docs_meta) == 0:
             raise HTTPException(500, detail="No webpage content available and index not initialized. Call /ingest first or visit a webpage.")
 
-        q_emb = get_embeddings([req.query])
-        q_emb = normalize(q_emb).astype('float32')
+        hits, excerpts = await kb_excerpts(snap, req, kb_top_k(req, session), 800, rows)  # a whole chunk at either chunker's default size
+        kb_section = pb.knowledge_base_section(excerpts, supplementary=False)
+        sections.append(kb_section)
 
-        D, I = index.search(q_emb, req.top_k)
-        I = I[0].tolist()
-        
-        for idx in I:
-            if idx < 0 or idx >= len(docs_meta):
-                continue
-            h = docs_meta[idx]
-            hits.append(h)
-            try:
-                with open(h['source'], 'r', encoding='utf-8') as fh:
-                    text = fh.read()
-                excerpt = text[:500].replace('\n', ' ')
-            except Exception:
-                excerpt = ""
-            context_parts.append(f"Title: {h.get('title','')}\nExcerpt: {excerpt}\n---\n")
-
-        system_prompt = (
-            "You are a helpful and conversational AI assistant that answers questions using the provided knowledge base. "
-            "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, and other Markdown formatting. "
-            "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
-            "Use the context provided below and do NOT hallucinate facts. If the answer is not in the context, say you don't know and optionally give general guidance. "
-            "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
-        )
-
-    combined_context = "\n".join(context_parts)
-    
-    # Build user prompt
-    page_info = f"Page: {req.page_context.get('title', 'Unknown')} ({req.page_context.get('url', 'No URL')})"
-    user_prompt = f"Page Info: {page_info}\n\nContext:\n{combined_context}\n\nQuestion: {req.query}"
+        system_prompt = pb.SYSTEM_PROMPT_KB
+
+    with metrics.timed(stage_seconds, "prompt"):
+        user_prompt, prompt_tokens = pb.assemble(system_prompt, sections, req.page_context, req.query, PROMPT_TOKEN_BUDGET)
+    for section, tokens in prompt_tokens.items():
+        if isinstance(tokens, int) and section != "budget":
+            prompt_tokens_hist.labels(section).observe(tokens)
+    if kb_section is not None:
+        hits = hits[:len(kb_section.items)]  # only report the excerpts that fit in the prompt
+    return system_prompt, user_prompt, hits, prompt_tokens
+
+async def register_page(page_context: dict) -> ps.PageSession:
+    """The session of a page context, chunked and embedded (or served from the store when already registered)."""
+    page_id = rc.page_hash(page_context)
+    session = page_sessions.get(page_id)
+    if session is not None:
+        return session
+    session = ps.PageSession(page_id, page_context)
+    session.media = await run_in_threadpool(pb.media_items, page_context)
+    if pc.estimate_tokens(session.content) > PAGE_CONTEXT_TOKEN_BUDGET:
+        session.passages = await run_in_threadpool(pc.chunk_page, session.content, PAGE_CHUNK_CHARS)
+        try:
+            session.embeddings = await embed_chunks(session.passages)
+        except Exception as e:
+            print(f"Embedding page passages failed ({e!r}), they are embedded on the first question instead")
+    page_sessions.put(session)
+    return session
 
+async def resolve_page(req: ChatRequest) -> Optional[ps.PageSession]:
+    """The registered page of req.page_id (its context replaces req.page_context); 404 when unknown or expired."""
+    if not req.page_id:
+        return None
+    session = page_sessions.get(req.page_id)
+    if session is None:
+        page_context = await run_in_threadpool(page_sessions.load, req.page_id)  # registered on another worker
+        if page_context is None:
+            raise HTTPException(404, detail=f"Unknown or expired page_id {req.page_id!r}, register the page with POST /pages again")
+        session = await register_page(page_context)
+    req.page_context = session.page_context
+    return session
+
+def answer_key(req: ChatRequest, session: Optional[ps.PageSession], snap: Snapshot) -> Optional[tuple]:
+    """
+    Answer cache key: the question, the page, the snapshot of the request's collection and everything
+    that shapes the prompt or the answer.
+    """
+    if answer_cache is None:
+        return None
+    page = session.page_id if session is not None else rc.page_hash(req.page_context)
+    return rc.answer_key(req.query, page, snap.version, kbc.validate_name(req.collection), LLM_MODEL_EXPERT,
+                         LLM_TEMPERATURE_EXPERT, LLM_MAX_TOKENS_EXPERT, retrieval_mode(req), req.top_k, req.nprobe, req.ef_search,
+                         PROMPT_TOKEN_BUDGET, PAGE_CONTEXT_TOKEN_BUDGET)
+
+async def replay_answer(cached: dict):
+    """A cached answer as the same events a live /chat/stream sends."""
+    yield sse.OPEN
+    yield sse.event("metadata", retrieved=cached["retrieved"], prompt_tokens=cached["prompt_tokens"])
+    for piece in rc.replay_pieces(cached["answer"]):
+        yield sse.event("content", content=piece)
+    yield sse.event("done")
+
+async def complete(system_prompt: str, user_prompt: str) -> str:
+    """The LLM's answer to a prompt (non-streaming), in an LLM slot held only for the call."""
     # Call LLM using Fuelix API with Gemini 2.5 Pro
+    async with llm_limiter.reserve():
+        with metrics.timed(stage_seconds, "llm_total"):
+            chat_completion = await with_retries(
+                llm_client.chat.completions.create,
+                model=LLM_MODEL_EXPERT,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=LLM_TEMPERATURE_EXPERT,
+                max_tokens=LLM_MAX_TOKENS_EXPERT,
+            )
+
+    # Handle response safely
+    if chat_completion.choices and len(chat_completion.choices) > 0:
+        content = chat_completion.choices[0].message.content
+        return content.strip() if content else NO_ANSWER
+    return NO_ANSWER
+
+@app.post("/chat")
+async def chat(req: ChatRequest, response: Response):
+    """
+    Accepts a query, prioritizes webpage content if available, falls back to FAISS retrieval,
+    and calls the LLM to produce an answer grounded in the most relevant context.
+    """
+    timings = metrics.begin_request()
+    snap = await collection_snapshot(req.collection)
+    session = await resolve_page(req)
+    key = answer_key(req, session, snap)
+    cached = answer_cache.get(key) if key is not None else None
+    if cached is not None:
+        response.headers["Server-Timing"] = "answer_cache;desc=hit"
+        return dict(cached)
+    # a full LLM queue is a 429 before any work is done; the slot itself is only taken in complete(),
+    # so it is not held while retrieval and embedding run
+    llm_limiter.check()
+    system_prompt, user_prompt, hits, prompt_tokens = await build_prompt(req, session, snap)
     try:
-        chat_completion = llm_client.chat.completions.create(
-            model=LLM_MODEL_EXPERT,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=LLM_TEMPERATURE_EXPERT,
-            max_tokens=LLM_MAX_TOKENS_EXPERT,
-        )
-        
-        # Handle response safely
-        if chat_completion.choices and len(chat_completion.choices) > 0:
-            content = chat_completion.choices[0].message.content
-            answer = content.strip() if content else "No response generated"
-        else:
-            answer = "No response generated"
-            
+        answer = await complete(system_prompt, user_prompt)
+    except HTTPException:
+        raise  # admission.Overloaded: 429/503 with Retry-After
     except Exception as e:
         raise HTTPException(500, detail=f"LLM error: {e}")
 
-    return {
+    response.headers["Server-Timing"] = metrics.server_timing(timings)
+    result = {
         "answer": answer,
-        "retrieved": hits
+        "retrieved": hits,
+        "prompt_tokens": prompt_tokens
     }
+    if key is not None and answer != NO_ANSWER:
+        answer_cache.put(key, result)
+    return result
 
-@app.post("/chat/stream")
-def chat_stream(req: ChatRequest):
+@app.post("/chat/batch")
+async def chat_batch(batch: ChatBatchRequest):
     """
-    Streaming version of the chat endpoint that returns Server-Sent Events (SSE)
+    Answers many questions in one request, for offline question sets. Retrieval is batched (see
+    retrieve_many()), LLM calls run concurrently under a limit, and results stream back as NDJSON in
+    completion order: {"index", "answer", "retrieved", "prompt_tokens"} or {"index", "error", "status"}.
+    A failing item never fails the batch.
     """
-    # Check if webpage content is available
-    webpage_content = req.page_context.get('content', '').strip()
-    code_blocks = req.page_context.get('codeBlocks', [])
-    images = req.page_context.get('images', [])
-    videos = req.page_context.get('videos', [])
-    has_webpage_content = len(webpage_content) > 50  # Minimum content threshold
-    
-    context_parts = []
-    hits = []
-    
-    if has_webpage_content:
-        # Use webpage content as primary source
-        page_title = req.page_context.get('title', 'Current Webpage')
-        page_url = req.page_context.get('url', '')
-        
-        context_parts.append(f"=== CURRENT WEBPAGE CONTENT ===")
-        context_parts.append(f"Title: {page_title}")
-        context_parts.append(f"URL: {page_url}")
-        context_parts.append(f"Content: {webpage_content}")
-        
-        # Add code blocks if available
-        if code_blocks:
-            context_parts.append(f"\n=== CODE BLOCKS ON PAGE ({len(code_blocks)} found) ===")
-            for i, block in enumerate(code_blocks[:5]):  # Limit to first 5 code blocks
-                context_parts.append(f"Code Block {i+1} ({block.get('language', 'text')}):")
-                context_parts.append(f"Context: {block.get('context', 'No context')}")
-                context_parts.append(f"Code:\n{block.get('code', '')}\n---")
-        
-        # Add images if available
-        if images:
-            context_parts.append(f"\n=== IMAGES ON PAGE ({len(images)} found) ===")
-            for i, img in enumerate(images[:3]):  # Limit to first 3 images
-                context_parts.append(f"Image {i+1}:")
-                context_parts.append(f"Alt text: {img.get('alt', 'No alt text')}")
-                context_parts.append(f"Caption: {img.get('caption', 'No caption')}")
-                context_parts.append(f"Source: {img.get('src', 'No source')}")
-                context_parts.append(f"Context: {img.get('context', 'No context')}\n---")
-        
-        # Add videos if available
-        if videos:
-            context_parts.append(f"\n=== VIDEOS ON PAGE ({len(videos)} found) ===")
-            for i, video in enumerate(videos[:3]):  # Limit to first 3 videos
-                context_parts.append(f"Video {i+1}:")
-                context_parts.append(f"Title: {video.get('title', 'No title')}")
-                context_parts.append(f"Caption: {video.get('caption', 'No caption')}")
-                context_parts.append(f"Source: {video.get('src', 'No source')}")
-                context_parts.append(f"Context: {video.get('context', 'No context')}\n---")
-        
-        context_parts.append(f"=== END WEBPAGE CONTENT ===\n")
-        
-        # Also get some relevant chunks from knowledge base as supplementary context
-        if index is not None and len(docs_meta) > 0:
-            try:
-                q_emb = get_embeddings([req.query])
-                q_emb = normalize(q_emb).astype('float32')
-                D, I = index.search(q_emb, min(req.top_k, 2))  # Fewer chunks since we have webpage content
-                I = I[0].tolist()
-                
-                context_parts.append("=== SUPPLEMENTARY KNOWLEDGE BASE ===")
-                for idx in I:
-                    if idx >= 0 and idx < len(docs_meta):
-                        h = docs_meta[idx]
-                        hits.append(h)
-                        try:
-                            with open(h['source'], 'r', encoding='utf-8') as fh:
-                                text = fh.read()
-                            excerpt = text[:300].replace('\n', ' ')
-                        except Exception:
-                            excerpt = ""
-                        context_parts.append(f"Title: {h.get('title','')}\nExcerpt: {excerpt}\n---")
-                context_parts.append("=== END KNOWLEDGE BASE ===")
-            except Exception:
-                pass  # Continue without knowledge base if there's an error
-        
-        system_prompt = (
-            "You are a helpful and conversational AI assistant that answers questions about webpages in a natural, human-friendly way. "
-            "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, code blocks (```), and other Markdown formatting. "
-            "PRIORITIZE the webpage content provided above all other sources. Use the supplementary knowledge base only if the webpage content doesn't contain the answer. "
-            "When relevant to the user's question, include and reference code blocks, images, or videos from the webpage. "
-            "For code blocks, use proper syntax highlighting with language tags (```javascript, ```python, etc.). "
-            "For images, describe them and mention their purpose when relevant. "
-            "For videos, reference their titles and content when applicable. "
-            "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
-            "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
-        )
-        
-    else:
-        # Fall back to knowledge base only
-        if index is None or len(docs_meta) == 0:
-            raise HTTPException(500, detail="No webpage content available and index not initialized. Call /ingest first or visit a webpage.")
+    if len(batch.requests) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(400, detail=f"At most {CHAT_BATCH_MAX_ITEMS} requests per batch, got {len(batch.requests)}")
+    concurrency = max(1, min(batch.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY))
 
-        q_emb = get_embeddings([req.query])
-        q_emb = normalize(q_emb).astype('float32')
+    def error_line(i: int, e: Exception) -> str:
+        status = e.status_code if isinstance(e, HTTPException) else 500
+        detail = e.detail if isinstance(e, HTTPException) else f"LLM error: {e}"
+        return json.dumps({"index": i, "error": detail, "status": status}) + "\n"
 
-        D, I = index.search(q_emb, req.top_k)
-        I = I[0].tolist()
-        
-        for idx in I:
-            if idx < 0 or idx >= len(docs_meta):
+    async def generate():
+        admission.set_lane(admission.BATCH)  # behind interactive chat for LLM and embedder slots
+        results: asyncio.Queue = asyncio.Queue()
+        snaps, sessions, keys, pending = {}, {}, {}, []  # snaps: one snapshot per item, the same for a collection
+        to_retrieve = {}  # collection -> items to answer
+        for i, req in enumerate(batch.requests):
+            try:  # everything that can reject a single item, so it never fails the rest of the batch
+                retrieval_mode(req)
+                snaps[i] = await collection_snapshot(req.collection)
+                sessions[i] = await resolve_page(req)
+                keys[i] = answer_key(req, sessions[i], snaps[i])
+            except Exception as e:
+                results.put_nowait(error_line(i, e))
                 continue
-            h = docs_meta[idx]
-            hits.append(h)
+            cached = answer_cache.get(keys[i]) if keys[i] is not None else None
+            if cached is not None:
+                results.put_nowait(json.dumps({"index": i, **cached}) + "\n")
+            else:
+                to_retrieve.setdefault(kbc.validate_name(req.collection), []).append(i)
+
+        rows = {}
+        for collection, items in list(to_retrieve.items()):
+            snap = snaps[items[0]]
+            if len(snap.docs_meta) > 0:
+                try:
+                    found = await retrieve_many(snap, [batch.requests[i] for i in items],
+                                                [kb_top_k(batch.requests[i], sessions[i]) for i in items])
+                except Exception as e:
+                    # the response has started: fail this collection's items, not the stream
+                    error = e if isinstance(e, HTTPException) else HTTPException(500, detail=f"Retrieval error: {e}")
+                    for i in items:
+                        results.put_nowait(error_line(i, error))
+                    del to_retrieve[collection]
+                    continue
+                rows.update(zip(items, found))
+
+        sem = asyncio.Semaphore(concurrency)
+
+        async def answer(i: int):
+            req = batch.requests[i]
             try:
-                with open(h['source'], 'r', encoding='utf-8') as fh:
-                    text = fh.read()
-                excerpt = text[:500].replace('\n', ' ')
-            except Exception:
-                excerpt = ""
-            context_parts.append(f"Title: {h.get('title','')}\nExcerpt: {excerpt}\n---\n")
-
-        system_prompt = (
-            "You are a helpful and conversational AI assistant that answers questions using the provided knowledge base. "
-            "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, and other Markdown formatting. "
-            "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
-            "Use the context provided below and do NOT hallucinate facts. If the answer is not in the context, say you don't know and optionally give general guidance. "
-            "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
-        )
-
-    combined_context = "\n".join(context_parts)
-    
-    # Build user prompt
-    page_info = f"Page: {req.page_context.get('title', 'Unknown')} ({req.page_context.get('url', 'No URL')})"
-    user_prompt = f"Page Info: {page_info}\n\nContext:\n{combined_context}\n\nQuestion: {req.query}"
-
-    def generate_stream():
+                async with sem:
+                    system_prompt, user_prompt, hits, prompt_tokens = await build_prompt(req, sessions[i], snaps[i], rows.get(i))
+                    text = await complete(system_prompt, user_prompt)
+                result = {"answer": text, "retrieved": hits, "prompt_tokens": prompt_tokens}
+                if keys[i] is not None and text != NO_ANSWER:
+                    answer_cache.put(keys[i], result)
+                results.put_nowait(json.dumps({"index": i, **result}) + "\n")
+            except Exception as e:
+                results.put_nowait(error_line(i, e))
+
+        pending.extend(asyncio.ensure_future(answer(i)) for items in to_retrieve.values() for i in items)
+        try:
+            for _ in range(len(batch.requests)):
+                yield await results.get()
+        finally:
+            # a client that disconnects closes the generator: stop the remaining items
+            for task in pending:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Streaming version of the chat endpoint that returns Server-Sent Events (SSE).
+    Headers go out at once; retrieval runs inside the stream, the metadata event is sent as soon as
+    the prompt is built and the LLM request is already in flight by then. Errors after that point
+    arrive as an error event.
+    """
+    retrieval_mode(req)  # rejected with a 400 before the stream starts
+    received = time.perf_counter()
+    snap = await collection_snapshot(req.collection)  # an unknown collection is a 404 before the stream starts
+    session = await resolve_page(req)  # an unknown page_id is a 404, so the client can register the page again
+    key = answer_key(req, session, snap)
+    cached = answer_cache.get(key) if key is not None else None
+    if cached is not None:
+        return StreamingResponse(replay_answer(cached), media_type=sse.MEDIA_TYPE, headers=sse.HEADERS)
+    llm_limiter.check()  # a full LLM queue is a 429 before the stream starts, see chat()
+
+    async def generate_stream():
+        yield sse.OPEN
+        pending = []
+        ticket = llm_task = stream = None
         try:
-            # Call LLM with streaming enabled
-            stream = llm_client.chat.completions.create(
+            prompt_task = asyncio.ensure_future(build_prompt(req, session, snap))
+            pending.append(prompt_task)
+            async for beat in sse.heartbeats(prompt_task, STREAM_HEARTBEAT_SECONDS):
+                yield beat
+            system_prompt, user_prompt, hits, prompt_tokens = prompt_task.result()
+            ticket = llm_limiter.reserve()
+            slot = asyncio.ensure_future(ticket.wait())
+            pending.append(slot)
+            async for beat in sse.heartbeats(slot, STREAM_HEARTBEAT_SECONDS):
+                yield beat
+            slot.result()  # a 503 from admission control becomes an error event
+
+            # Call LLM with streaming enabled (only establishing the stream is retried); the request is
+            # sent while the metadata event goes out
+            started = time.perf_counter()
+            llm_task = asyncio.ensure_future(with_retries(
+                llm_client.chat.completions.create,
                 model=LLM_MODEL_EXPERT,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -451,35 +1343,82 @@ def chat_stream(req: ChatRequest):
                 temperature=LLM_TEMPERATURE_EXPERT,
                 max_tokens=LLM_MAX_TOKENS_EXPERT,
                 stream=True,  # Enable streaming
-            )
-            
-            # Send metadata first
-            yield f"data: {json.dumps({'type': 'metadata', 'retrieved': hits})}\n\n"
-            
+            ))
+            pending.append(llm_task)
+            metrics.record(stage_seconds, "stream_metadata", time.perf_counter() - received)
+            yield sse.event("metadata", retrieved=hits, prompt_tokens=prompt_tokens)
+
+            async for beat in sse.heartbeats(llm_task, STREAM_HEARTBEAT_SECONDS):
+                yield beat
+            stream = llm_task.result()
+
+            first_token_at = None
+            n_chunks = 0
+            pieces = []
             # Stream the response
-            for chunk in stream:
+            async for chunk in sse.with_heartbeats(stream, STREAM_HEARTBEAT_SECONDS):
+                if chunk is sse.HEARTBEAT:
+                    yield chunk
+                    continue
                 if chunk.choices and len(chunk.choices) > 0:
                     delta = chunk.choices[0].delta
                     if hasattr(delta, 'content') and delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            metrics.record(stage_seconds, "llm_ttft", first_token_at - started)
+                        n_chunks += 1
+                        pieces.append(delta.content)
                         # Send content chunk
-                        yield f"data: {json.dumps({'type': 'content', 'content': delta.content})}\n\n"
-            
+                        yield sse.event("content", content=delta.content)
+
+            finished = time.perf_counter()
+            metrics.record(stage_seconds, "llm_total", finished - started)
+            if n_chunks > 1 and finished > first_token_at:
+                stream_tokens_per_s.observe((n_chunks - 1) / (finished - first_token_at))
+            answer = "".join(pieces).strip()
+            if key is not None and answer:
+                answer_cache.put(key, {"answer": answer, "retrieved": hits, "prompt_tokens": prompt_tokens})
             # Send completion signal
-            yield f"data: {json.dumps({'type': 'done'})}\n\n"
-            
+            yield sse.event("done")
+
         except Exception as e:
-            # Send error
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
-
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/plain",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Content-Type": "text/plain; charset=utf-8",
-        }
-    )
+            # Send error (the status line is already sent, so HTTPExceptions end up here too)
+            yield sse.event("error", error=e.detail if isinstance(e, HTTPException) else str(e))
+        finally:
+            # a client that disconnects closes the generator: stop work nobody will read
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+            if stream is None and llm_task is not None and llm_task.done() and not llm_task.cancelled() \
+                    and llm_task.exception() is None:
+                stream = llm_task.result()  # established just as the client went away
+            if ticket is not None:
+                ticket.release()
+            if stream is not None:
+                # frees the pooled connection and stops the upstream generation; shielded, so it still
+                # finishes when the response's cancellation interrupts this await
+                closing = asyncio.ensure_future(stream.close())
+                try:
+                    await asyncio.shield(closing)
+                except BaseException:
+                    pass
+
+    return StreamingResponse(generate_stream(), media_type=sse.MEDIA_TYPE, headers=sse.HEADERS)
+
+@app.post("/pages")
+async def register_page_endpoint(page_context: dict):
+    """
+    Registers a page (the page_context the extension would send with every question) and returns
+    its page_id; follow-up /chat and /chat/stream requests send only the query and the page_id.
+    """
+    session = await register_page(page_context)
+    await run_in_threadpool(page_sessions.save, session.page_id, session.page_context)
+    return {
+        "page_id": session.page_id,
+        "ttl_seconds": PAGE_SESSION_TTL_SECONDS,
+        "passages": len(session.passages) if session.passages is not None else 0,
+        "embedded": session.embeddings is not None,
+    }
 
 @app.get("/")
 def root():
@@ -489,11 +1428,38 @@ def root():
             "health": "/health",
             "ingest": "/ingest (POST)",
             "chat": "/chat (POST)",
+            "chat_batch": "/chat/batch (POST, NDJSON results)",
+            "pages": "/pages (POST, register a page for follow-up questions by page_id)",
+            "collections": "/collections (named knowledge bases, pass collection to /ingest and /chat)",
+            "metrics": "/metrics (Prometheus)",
             "docs": "/docs (API documentation)"
         },
         "status": "running"
     }
 
+@app.get("/collections")
+def list_collections():
+    """Collections with a published snapshot; loaded ones with their version and estimated size."""
+    loaded = collections.stats()["loaded"]
+    return {"collections": [{"name": name, "loaded": name in loaded, **loaded.get(name, {})}
+                            for name in collections.names()]}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health():
-    return {"status":"ok"}
+    return {
+        "status": "ok",
+        "read_only": SERVE_READ_ONLY,
+        "snapshot": snapshot.version,
+        "embedder": {"backend": EMBEDDING_BACKEND, "model": EMBEDDING_MODEL, "dim": EMBED_DIM},
+        "embedding_cache": embedding_cache.stats() if embedding_cache is not None else None,
+        "query_batcher": query_batcher.stats() if query_batcher is not None else None,
+        "retrieval_cache": retrieval_cache.stats() if retrieval_cache is not None else None,
+        "answer_cache": answer_cache.stats() if answer_cache is not None else None,
+        "page_sessions": page_sessions.stats(),
+        "collections": collections.stats(),
+        "admission": {"llm": llm_limiter.stats(), "embed": embed_limiter.stats()},
+    }
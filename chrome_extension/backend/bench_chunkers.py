@@ -0,0 +1,133 @@
+# bench_chunkers.py
+"""
+Compares the chunkers in chunkers.py on a docs folder (the bundled docs/ by default).
+
+Per configuration it reports chunk count, embedding calls (at the batch size
+embed_chunks() uses), estimated tokens embedded, chunk size spread, fragments
+(chunks under --fragment-tokens), chunks that start or end mid-word or cut a
+code fence, and the retrieval hit rate.
+
+Hit rate needs no embedding API: queries are built from sentences of the docs
+(a seeded random subset of each sentence's words), ranked with BM25 over the
+chunks of each configuration, and a query counts as a hit when one of the top-k
+chunks contains its whole source sentence, i.e. the answer is in the prompt.
+"prompt tokens" is the estimated size of those top-k chunks.
+
+Usage:
+    python bench_chunkers.py
+    python bench_chunkers.py --configs chars:500:50,markdown:128:16,markdown:192:24 --json bench_chunkers.json
+    python bench_chunkers.py --docs-dir ../some/docs --queries 500 --k 3
+"""
+import argparse
+import json
+import random
+import re
+import shutil
+import tempfile
+import numpy as np
+import bm25
+import chunkers
+import doc_loader as dl
+from page_context import estimate_tokens, SENTENCE_END_RE
+
+EMBED_BATCH = 20  # batch_size in app.embed_chunks()
+FENCE_LINE_RE = re.compile(r"^ {0,3}(```|~~~)", re.M)
+
+
+def sample_queries(docs, n: int, min_words: int, seed: int):
+    """[(file index, sentence start, sentence end, query)] from sentences of at least min_words words."""
+    sentences = []
+    for d, text in enumerate(docs):
+        pos = 0
+        for part in SENTENCE_END_RE.split(text):
+            start = text.index(part, pos)
+            pos = start + len(part)
+            words = bm25.tokenize(part)
+            if len(words) >= min_words and not FENCE_LINE_RE.search(part):
+                sentences.append((d, start, pos, words))
+    rng = random.Random(seed)
+    picked = rng.sample(sentences, min(n, len(sentences)))
+    queries = []
+    for d, start, end, words in picked:
+        keep = sorted(rng.sample(range(len(words)), max(3, len(words) // 2)))
+        queries.append((d, start, end, " ".join(words[i] for i in keep)))
+    return queries
+
+
+def mid_word(text: str, start: int, end: int) -> bool:
+    cut_start = 0 < start < len(text) and text[start - 1].isalnum() and text[start].isalnum()
+    cut_end = 0 < end < len(text) and text[end - 1].isalnum() and text[end].isalnum()
+    return cut_start or cut_end
+
+
+def bench_one(name, chunk_size, overlap, docs, queries, k, fragment_tokens):
+    chunks = []  # (file index, chunk, start, end, heading_path)
+    for d, text in enumerate(docs):
+        chunks.extend((d, *c) for c in chunkers.chunk(name, text, chunk_size, overlap))
+    tokens = np.array([estimate_tokens(c[1]) for c in chunks])
+
+    out_dir = tempfile.mkdtemp(prefix="bench_chunkers_")
+    try:
+        bm25.build_bm25((c[1] for c in chunks), out_dir)
+        index = bm25.BM25Index(out_dir)
+        hits = 0
+        prompt_tokens = []
+        for d, start, end, query in queries:
+            top = index.search(query, k)
+            prompt_tokens.append(int(tokens[top].sum()) if len(top) else 0)
+            hits += any(chunks[r][0] == d and chunks[r][2] <= start and end <= chunks[r][3] for r in top)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    return {
+        "chunker": name,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "chunks": len(chunks),
+        "embedding_calls": -(-len(chunks) // EMBED_BATCH),
+        "tokens_embedded": int(tokens.sum()),
+        "tokens_p50": int(np.percentile(tokens, 50)),
+        "tokens_max": int(tokens.max()),
+        "fragments": int((tokens < fragment_tokens).sum()),
+        "mid_word_cuts": sum(mid_word(docs[d], s, e) for d, _, s, e, _ in chunks),
+        "split_code_fences": sum(len(FENCE_LINE_RE.findall(c[1])) % 2 for c in chunks),
+        "with_heading_path": sum(1 for c in chunks if c[4]),
+        f"hit@{k}": round(hits / max(len(queries), 1), 4),
+        "prompt_tokens_mean": round(float(np.mean(prompt_tokens)), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs-dir", default="docs")
+    parser.add_argument("--configs", default="chars:500:50,markdown:128:16,markdown:192:24,markdown:256:32",
+                        help="comma-separated chunker:chunk_size:overlap")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--min-words", type=int, default=8)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--fragment-tokens", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    docs = []
+    for path in dl.find_files(args.docs_dir):
+        with open(path, 'r', encoding='utf-8') as fh:
+            docs.append(fh.read())
+    queries = sample_queries(docs, args.queries, args.min_words, args.seed)
+    print(f"{len(docs)} files, {sum(len(d) for d in docs)} characters, {len(queries)} queries")
+
+    results = []
+    for config in args.configs.split(","):
+        name, size, overlap = config.split(":")
+        result = bench_one(name, int(size), int(overlap), docs, queries, args.k, args.fragment_tokens)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"docs_dir": args.docs_dir, "queries": len(queries), "k": args.k, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
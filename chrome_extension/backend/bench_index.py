@@ -0,0 +1,112 @@
+# bench_index.py
+"""
+Recall vs latency benchmark for the index types in index_factory.py.
+
+Builds every index type on synthetic clustered, L2-normalized corpora and reports,
+per corpus size and index type: build time, serialized size, recall@k against the
+exact flat index, and p50/p99 single-query search latency.
+
+Usage:
+    python bench_index.py                                  # 10k, 100k, 1M vectors at 384 dims
+    python bench_index.py --sizes 10000 --dim 3072 --json bench_index.json
+    python bench_index.py --types flat,hnsw --ef-search 128
+"""
+import argparse
+import json
+import time
+import numpy as np
+import faiss
+import index_factory as ix
+
+
+def synthetic_corpus(n: int, dim: int, n_clusters: int, seed: int = 0) -> np.ndarray:
+    """Gaussian blobs around random centers, so IVF partitions have structure to find."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype('float32')
+    out = np.empty((n, dim), dtype='float32')
+    step = 100000
+    for i in range(0, n, step):
+        m = min(step, n - i)
+        labels = rng.integers(0, n_clusters, m)
+        out[i:i+m] = centers[labels] + 0.6 * rng.standard_normal((m, dim)).astype('float32')
+    faiss.normalize_L2(out)
+    return out
+
+
+def queries_from(corpus: np.ndarray, nq: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    q = corpus[rng.choice(len(corpus), nq, replace=False)] + 0.05 * rng.standard_normal((nq, corpus.shape[1])).astype('float32')
+    faiss.normalize_L2(q)
+    return q
+
+
+def percentile_ms(samples, p):
+    return float(np.percentile(samples, p) * 1000)
+
+
+def bench_one(index_type, corpus, queries, ground_truth, k, args):
+    t0 = time.perf_counter()
+    index = ix.build_index(index_type, corpus.shape[1], corpus, nlist=args.nlist, pq_m=args.pq_m,
+                           hnsw_m=args.hnsw_m, ef_construction=args.ef_construction)
+    index.add_with_ids(corpus, np.arange(len(corpus), dtype='int64'))
+    build_s = time.perf_counter() - t0
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        t = time.perf_counter()
+        _, I = ix.search(index, queries[i:i+1], k, args.nprobe, args.ef_search)
+        latencies.append(time.perf_counter() - t)
+        found[i] = I[0]
+
+    recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / k for i in range(len(queries))])
+    return {
+        "index_type": index_type,
+        "n": len(corpus),
+        "dim": corpus.shape[1],
+        "build_s": round(build_s, 3),
+        "size_mb": round(len(faiss.serialize_index(index)) / 2**20, 2),
+        f"recall@{k}": round(float(recall), 4),
+        "p50_ms": round(percentile_ms(latencies, 50), 3),
+        "p99_ms": round(percentile_ms(latencies, 99), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--types", default=",".join(ix.INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-construction", type=int, default=200)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for n in [int(s) for s in args.sizes.split(",")]:
+        corpus = synthetic_corpus(n, args.dim, n_clusters=max(10, int(np.sqrt(n))))
+        queries = queries_from(corpus, min(args.queries, n))
+        flat = faiss.IndexFlatIP(args.dim)
+        flat.add(corpus)
+        _, ground_truth = flat.search(queries, args.k)
+        del flat
+
+        for index_type in args.types.split(","):
+            r = bench_one(index_type, corpus, queries, ground_truth, args.k, args)
+            results.append(r)
+            print(f"n={n:>8} {index_type:>9}  build {r['build_s']:>8.2f}s  size {r['size_mb']:>9.2f}MB  "
+                  f"recall@{args.k} {r[f'recall@{args.k}']:.3f}  p50 {r['p50_ms']:.3f}ms  p99 {r['p99_ms']:.3f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+# bench_load.py
+"""
+Load and latency benchmark for /ingest, /chat and /chat/stream, runnable offline.
+
+By default it starts fake_upstream.py (embeddings + chat) and the backend under
+uvicorn with --workers processes in a scratch directory, ingests the bundled docs,
+then drives each scenario at every concurrency level, once with caching defeated
+and once with it. Uncached runs suffix every query with its request number, so each
+one misses the answer, retrieval and embedding caches and pays for embedding,
+search and the LLM call; cached runs cycle through a few fixed queries, so after the
+first round they mostly measure cache hits. It reports per run:
+requests/s, p50/p95/p99 latency, errors, time to first streamed token (TTFT) for
+/chat/stream, and the resident memory of every uvicorn worker (Linux /proc).
+
+Results are written as JSON (--json) together with the git commit and all
+settings, so runs can be compared across commits.
+
+Usage:
+    python bench_load.py
+    python bench_load.py --concurrency 1,16,64 --requests 400 --workers 4 --json bench_load.json
+    python bench_load.py --chat-latency-ms 800 --tokens-per-s 30 --chat-failure-rate 0.05
+    python bench_load.py --url http://localhost:8000 --scenarios chat,chat_stream   # an already running server
+    python bench_load.py --cache uncached
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+QUERIES = [
+    "How do I label a point cloud with cuboids?",
+    "What is the difference between 3D Point Cloud and Episodes?",
+    "How does ground segmentation work?",
+    "How can I track cuboids across frames?",
+    "How do I get started?",
+    "What should I do if the extension does not respond?",
+    "How do I project 2D annotations to 3D?",
+    "Which keyboard shortcuts does the cuboid tool have?",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status", 'r') as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def child_pids(pid: int) -> list:
+    pids = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", 'r') as f:
+                pids.extend(int(p) for p in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+def worker_memory(server_pid) -> dict:
+    """RSS in MB of every uvicorn worker (or of the server itself when it runs without workers)."""
+    if server_pid is None or not os.path.exists("/proc"):
+        return {}
+    # with --workers, uvicorn's workers are children of the supervisor, next to multiprocessing's resource tracker
+    pids = []
+    for pid in child_pids(server_pid):
+        try:
+            with open(f"/proc/{pid}/cmdline", 'rb') as f:
+                if b"resource_tracker" not in f.read():
+                    pids.append(pid)
+        except OSError:
+            pass
+    try:
+        return {str(p): round(rss_mb(p), 1) for p in pids or [server_pid]}
+    except OSError:
+        return {}
+
+
+def summarize(latencies, ttfts, errors, elapsed) -> dict:
+    ms = np.array(latencies) * 1000
+    out = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+    }
+    for p in (50, 95, 99):
+        out[f"p{p}_ms"] = round(float(np.percentile(ms, p)), 1) if len(ms) else None
+    if ttfts is not None:
+        t = np.array(ttfts) * 1000
+        for p in (50, 95, 99):
+            out[f"ttft_p{p}_ms"] = round(float(np.percentile(t, p)), 1) if len(t) else None
+    return out
+
+
+async def chat_once(client: httpx.AsyncClient, query: str):
+    r = await client.post("/chat", json={"query": query})
+    r.raise_for_status()
+    return None
+
+
+async def chat_stream_once(client: httpx.AsyncClient, query: str):
+    """Seconds until the first content event; raises if the stream reports an error."""
+    start = time.perf_counter()
+    ttft = None
+    async with client.stream("POST", "/chat/stream", json={"query": query}) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if event.get("type") == "content" and ttft is None:
+                ttft = time.perf_counter() - start
+            elif event.get("type") == "error":
+                raise RuntimeError(event.get("error"))
+    if ttft is None:
+        raise RuntimeError("stream ended without content")
+    return ttft
+
+
+async def drive(base_url: str, scenario: str, concurrency: int, total: int, timeout: float,
+                cached: bool = True) -> dict:
+    """Send `total` requests with `concurrency` in flight and collect their latencies; see the module docstring for `cached`."""
+    once = chat_stream_once if scenario == "chat_stream" else chat_once
+    latencies, ttfts, errors = [], [], 0
+    sent = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            nonlocal sent, errors
+            while sent < total:
+                query = QUERIES[sent % len(QUERIES)]
+                if not cached:
+                    query = f"{query} (request {sent})"
+                sent += 1
+                start = time.perf_counter()
+                try:
+                    ttft = await once(client, query)
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if ttft is not None:
+                    ttfts.append(ttft)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, ttfts if scenario == "chat_stream" else None, errors, elapsed)
+
+
+def run_ingest(base_url: str, docs_dir: str, runs: int, timeout: float) -> dict:
+    latencies, errors, chunks = [], 0, None
+    for _ in range(runs):
+        start = time.perf_counter()
+        r = httpx.post(base_url + "/ingest", json={"docs_dir": docs_dir}, timeout=timeout)
+        if r.status_code != 200:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        chunks = r.json().get("num_chunks")
+    out = summarize(latencies, None, errors, sum(latencies))
+    out["num_chunks"] = chunks
+    out["chunks_per_s"] = round(chunks / np.mean(latencies), 1) if chunks and latencies else None
+    return out
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_servers(args, workdir):
+    """Start fake_upstream.py and the backend; returns (base_url, server process, fake process)."""
+    fake_port, app_port = free_port(), free_port()
+    fake_args = [sys.executable, os.path.join(HERE, "fake_upstream.py"), "--port", str(fake_port)]
+    for key in ("chat_latency_ms", "tokens_per_s", "completion_tokens", "chat_failure_rate",
+                "embed_latency_ms", "embed_failure_rate"):
+        fake_args += ["--" + key.replace("_", "-"), str(getattr(args, key))]
+    fake = subprocess.Popen(fake_args, cwd=workdir)
+    wait_for(f"http://127.0.0.1:{fake_port}/stats")
+
+    env = dict(os.environ, EMBEDDING_BASE_URL=f"http://127.0.0.1:{fake_port}/v1",
+               LLM_BASE_URL=f"http://127.0.0.1:{fake_port}/v1", PYTHONPATH=HERE)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1",
+                               "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+                              cwd=workdir, env=env)
+    base_url = f"http://127.0.0.1:{app_port}"
+    wait_for(base_url + "/health", timeout=120)
+    return base_url, server, fake
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running backend instead of starting one (no memory numbers "
+                                      "unless --server-pid is given)")
+    parser.add_argument("--server-pid", type=int)
+    parser.add_argument("--scenarios", default="ingest,chat,chat_stream")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--cache", default="uncached,cached", help="which chat runs to report: uncached, cached or both")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and concurrency level")
+    parser.add_argument("--ingest-runs", type=int, default=3)
+    parser.add_argument("--docs-dir", default=os.path.join(HERE, "docs"))
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--chat-latency-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--chat-failure-rate", type=float, default=0.0)
+    parser.add_argument("--embed-latency-ms", type=float, default=20.0)
+    parser.add_argument("--embed-failure-rate", type=float, default=0.0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    levels = [int(c) for c in args.concurrency.split(",")]
+    cache_modes = args.cache.split(",")
+    workdir = None
+    server = fake = None
+    if args.url:
+        base_url, server_pid = args.url.rstrip("/"), args.server_pid
+        docs_dir = args.docs_dir
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench_load_")
+        docs_dir = os.path.join(workdir, "docs")
+        shutil.copytree(args.docs_dir, docs_dir)
+        base_url, server, fake = start_servers(args, workdir)
+        server_pid = server.pid
+
+    results = {"commit": git_commit(), "started_at": time.time(), "settings": vars(args), "runs": []}
+    try:
+        if workdir and "ingest" not in scenarios:
+            run_ingest(base_url, docs_dir, 1, args.timeout)  # a fresh server has nothing to chat about
+        if "ingest" in scenarios:
+            run = {"scenario": "ingest", **run_ingest(base_url, docs_dir, args.ingest_runs, args.timeout)}
+            run["worker_rss_mb"] = worker_memory(server_pid)
+            results["runs"].append(run)
+            print(json.dumps(run))
+        if workdir:
+            time.sleep(float(os.getenv("SNAPSHOT_POLL_SECONDS", "2")) + 1)  # let the other workers swap in the snapshot
+        for scenario in (s for s in scenarios if s in ("chat", "chat_stream")):
+            for cache in cache_modes:
+                for concurrency in levels:
+                    run = {"scenario": scenario, "cache": cache, "concurrency": concurrency,
+                           **asyncio.run(drive(base_url, scenario, concurrency, args.requests, args.timeout,
+                                               cached=cache == "cached"))}
+                    run["worker_rss_mb"] = worker_memory(server_pid)
+                    results["runs"].append(run)
+                    print(json.dumps(run))
+    finally:
+        for proc in (server, fake):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
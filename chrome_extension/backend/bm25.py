@@ -0,0 +1,210 @@
+# bm25.py
+"""
+Memory-mapped BM25 inverted index over the ingested chunks.
+
+Built next to the FAISS index at ingest time (postings are sorted in runs of
+RUN_ROWS chunks spilled to disk, then merged) and persisted under BM25_DIR:
+  terms.npy        - uint8 UTF-8 bytes of every term, sorted, back to back
+  term_starts.npy  - int64 (V+1,) start of each sorted term in terms.npy
+  term_ids.npy     - int32 (V,) term id of each sorted term
+  offsets.npy  - int64 (V+1,) start of each term id's postings
+  docs.npy     - int32 postings: chunk rows (positions in docs_meta), sorted per term
+  tfs.npy      - uint16 term frequency for each posting
+  doclens.npy  - int32 token count of each chunk
+
+The arrays are memory-mapped on load, vocabulary included (terms are found by
+binary search), so worker processes share the pages and a query only touches its
+own terms and postings; scores are accumulated over those postings only.
+Indexes built before the sorted vocabulary have a vocab.json (term -> term id)
+instead, which is still read. Tokens keep identifiers whole (error codes, config.keys,
+snake_case names) and also index their parts, so both "ERR_TIMEOUT" and
+"timeout" match.
+"""
+import os
+import re
+import json
+import shutil
+import itertools
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from numpy.lib.format import open_memmap
+
+BM25_DIR = "bm25"
+RUN_ROWS = 16384  # chunks whose postings are sorted and spilled together while building
+TOKEN_RE = re.compile(r"\w+(?:[.\-/:]\w+)*")
+PART_RE = re.compile(r"[._\-/:]+")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        tokens.append(tok)
+        parts = [p for p in PART_RE.split(tok) if p]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def rrf(rankings: Sequence[Sequence[int]], k: int = 60) -> List[int]:
+    """Reciprocal-rank fusion of several ranked lists of rows."""
+    scores = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            scores[row] = scores.get(row, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def build_bm25(texts: Iterable[str], out_dir: str = BM25_DIR, run_rows: int = RUN_ROWS):
+    """
+    Tokenize chunk texts (any iterable, consumed once) and write the postings arrays. Postings of
+    run_rows chunks at a time are sorted by term and spilled to scratch files in out_dir, then merged
+    into the memory-mapped outputs, so only the vocabulary and one run are held in memory.
+    """
+    texts = iter(texts)
+    os.makedirs(out_dir, exist_ok=True)
+    scratch = os.path.join(out_dir, ".runs")
+    os.makedirs(scratch, exist_ok=True)
+    vocab = {}
+    runs = []  # scratch file prefixes, in row order
+    n_rows = 0
+    try:
+        with open(os.path.join(scratch, "doclens.i32"), 'wb') as doclens_file:
+            batch = list(itertools.islice(texts, run_rows))
+            while batch:
+                tids, rows, tfs, doclens = array('i'), array('i'), array('i'), array('i')
+                for row, text in enumerate(batch, n_rows):
+                    tokens = tokenize(text)
+                    doclens.append(len(tokens))
+                    counts = {}
+                    for tok in tokens:
+                        counts[tok] = counts.get(tok, 0) + 1
+                    for tok, tf in counts.items():
+                        tid = vocab.get(tok)
+                        if tid is None:
+                            tid = vocab[tok] = len(vocab)
+                        tids.append(tid)
+                        rows.append(row)
+                        tfs.append(tf)
+                doclens_file.write(doclens.tobytes())
+                tids = np.frombuffer(tids, dtype=np.int32)
+                order = np.argsort(tids, kind='stable')  # by term, rows stay ascending within a term
+                prefix = os.path.join(scratch, f"run{len(runs)}")
+                np.save(prefix + ".tids.npy", tids[order])
+                np.save(prefix + ".rows.npy", np.frombuffer(rows, dtype=np.int32)[order])
+                np.save(prefix + ".tfs.npy", np.minimum(np.frombuffer(tfs, dtype=np.int32)[order], 65535).astype(np.uint16))
+                runs.append(prefix)
+                n_rows += len(batch)
+                batch = list(itertools.islice(texts, run_rows))
+
+        n_terms = len(vocab)
+        counts = np.zeros(n_terms, dtype=np.int64)
+        for prefix in runs:
+            counts += np.bincount(np.load(prefix + ".tids.npy", mmap_mode='r'), minlength=n_terms)
+        offsets = np.zeros(n_terms + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        docs = open_memmap(os.path.join(out_dir, "docs.npy"), mode='w+', dtype=np.int32, shape=(int(offsets[-1]),))
+        tfs = open_memmap(os.path.join(out_dir, "tfs.npy"), mode='w+', dtype=np.uint16, shape=(int(offsets[-1]),))
+        cursor = offsets[:-1].copy()  # next free posting of each term
+        for prefix in runs:
+            run_tids = np.load(prefix + ".tids.npy")
+            if len(run_tids) == 0:
+                continue
+            # position of each posting within its term's group in this run
+            group_start = np.searchsorted(run_tids, run_tids, side='left')
+            pos = cursor[run_tids] + (np.arange(len(run_tids)) - group_start)
+            docs[pos] = np.load(prefix + ".rows.npy")
+            tfs[pos] = np.load(prefix + ".tfs.npy")
+            cursor += np.bincount(run_tids, minlength=n_terms)
+        docs.flush()
+        tfs.flush()
+        del docs, tfs
+
+        write_vocab(vocab, out_dir)
+        np.save(os.path.join(out_dir, "offsets.npy"), offsets)
+        np.save(os.path.join(out_dir, "doclens.npy"),
+                np.fromfile(os.path.join(scratch, "doclens.i32"), dtype=np.int32))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def write_vocab(vocab: Dict[str, int], out_dir: str):
+    """The vocabulary as sorted UTF-8 terms with their term ids, see the module docstring."""
+    terms = sorted((term.encode('utf-8'), tid) for term, tid in vocab.items())
+    starts = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term) for term, _ in terms], out=starts[1:])
+    np.save(os.path.join(out_dir, "terms.npy"), np.frombuffer(b"".join(term for term, _ in terms), dtype=np.uint8))
+    np.save(os.path.join(out_dir, "term_starts.npy"), starts)
+    np.save(os.path.join(out_dir, "term_ids.npy"), np.array([tid for _, tid in terms], dtype=np.int32))
+
+
+class BM25Index:
+    def __init__(self, in_dir: str = BM25_DIR, k1: float = 1.2, b: float = 0.75):
+        def load(name):
+            # a plain ndarray over the mapping: indexing np.memmap is slow in the binary search
+            return np.load(os.path.join(in_dir, name), mmap_mode='r').view(np.ndarray)
+
+        self.vocab = None  # term -> term id, only for indexes with a vocab.json
+        if os.path.exists(os.path.join(in_dir, "terms.npy")):
+            self.terms = load("terms.npy")
+            self.term_starts = load("term_starts.npy")
+            self.term_ids = load("term_ids.npy")
+        else:
+            with open(os.path.join(in_dir, "vocab.json"), 'r', encoding='utf-8') as f:
+                self.vocab = json.load(f)
+        self.offsets = load("offsets.npy")
+        self.docs = load("docs.npy")
+        self.tfs = load("tfs.npy")
+        self.doclens = load("doclens.npy")
+        self.n = len(self.doclens)
+        self.avgdl = max(float(self.doclens.mean()), 1.0) if self.n else 1.0
+        self.k1 = k1
+        self.b = b
+
+    def term_id(self, term: str) -> Optional[int]:
+        if self.vocab is not None:
+            return self.vocab.get(term)
+        key = term.encode('utf-8')
+        lo, hi = 0, len(self.term_ids)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.terms[self.term_starts[mid]:self.term_starts[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.term_ids) and self.terms[self.term_starts[lo]:self.term_starts[lo + 1]].tobytes() == key:
+            return int(self.term_ids[lo])
+        return None
+
+    def search(self, query: str, k: int) -> List[int]:
+        """Rows of the top-k chunks by BM25 score; chunks sharing no term with the query are not returned."""
+        if self.n == 0:
+            return []
+        all_rows, all_scores = [], []
+        for tok in set(tokenize(query)):
+            tid = self.term_id(tok)
+            if tid is None:
+                continue
+            a, b = self.offsets[tid], self.offsets[tid + 1]
+            rows = self.docs[a:b]
+            tf = self.tfs[a:b].astype(np.float32)
+            idf = np.log(1 + (self.n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doclens[rows] / self.avgdl)
+            all_rows.append(rows)
+            all_scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not all_rows:
+            return []
+        # sum per row over the matched postings only, not over an array of every chunk
+        hits, where = np.unique(np.concatenate(all_rows), return_inverse=True)
+        scores = np.bincount(where, weights=np.concatenate(all_scores), minlength=len(hits))
+        if len(hits) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            hits, scores = hits[top], scores[top]
+            order = np.lexsort((hits, -scores))  # ties by row, like a full scan
+        else:
+            order = np.argsort(-scores, kind='stable')
+        return [int(r) for r in hits[order]]
+
+
+def exists(in_dir: str = BM25_DIR) -> bool:
+    return os.path.exists(os.path.join(in_dir, "doclens.npy"))
@@ -0,0 +1,65 @@
+# chunk_store.py
+"""
+Memory-mapped store for the chunk text produced by /ingest.
+
+Layout on disk:
+  chunks.bin        - utf-8 text of every chunk, concatenated
+  chunks_index.npy  - int64 array of shape (n, 4):
+                      [blob_start, blob_end, source_char_start, source_char_end]
+
+Both files are opened read-only and memory-mapped, so fetching the text of a
+search hit is an offset lookup into the page cache - no source file is opened.
+"""
+import os
+import mmap
+from typing import List, Tuple
+import numpy as np
+
+CHUNKS_PATH = "chunks.bin"
+CHUNKS_INDEX_PATH = "chunks_index.npy"
+
+
+def write_chunk_store(chunks: List[str], spans: List[Tuple[int, int]],
+                      data_path: str = CHUNKS_PATH, index_path: str = CHUNKS_INDEX_PATH):
+    """Write chunk texts and their (start, end) char offsets in the source file."""
+    offsets = np.zeros((len(chunks), 4), dtype=np.int64)
+    pos = 0
+    with open(data_path, 'wb') as f:
+        for i, chunk in enumerate(chunks):
+            data = chunk.encode('utf-8')
+            f.write(data)
+            offsets[i] = (pos, pos + len(data), spans[i][0], spans[i][1])
+            pos += len(data)
+    np.save(index_path, offsets)
+
+
+class ChunkStore:
+    """Read-only view over a chunk store written by write_chunk_store()."""
+
+    def __init__(self, data_path: str = CHUNKS_PATH, index_path: str = CHUNKS_INDEX_PATH):
+        self.offsets = np.load(index_path, mmap_mode='r')
+        self._file = open(data_path, 'rb')
+        # mmap refuses zero-length files, so an empty store keeps an empty buffer
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buf = b""
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def text(self, i: int) -> str:
+        start, end = int(self.offsets[i, 0]), int(self.offsets[i, 1])
+        return self._buf[start:end].decode('utf-8')
+
+    def span(self, i: int) -> Tuple[int, int]:
+        return int(self.offsets[i, 2]), int(self.offsets[i, 3])
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+
+def exists(data_path: str = CHUNKS_PATH, index_path: str = CHUNKS_INDEX_PATH) -> bool:
+    return os.path.exists(data_path) and os.path.exists(index_path)
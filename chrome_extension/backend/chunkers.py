@@ -0,0 +1,200 @@
+# chunkers.py
+"""
+Chunkers used by /ingest, selected by name (IngestRequest.chunker / INGEST_CHUNKER).
+
+Every chunker takes (text, chunk_size, overlap) and returns [(chunk, start, end, heading_path), ...]
+where chunk == text[start:end] and heading_path is the " > "-joined Markdown headings the chunk
+sits under ("" when there are none).
+
+  chars     - fixed windows of chunk_size characters, overlap characters shared (the original chunker)
+  markdown  - chunks of at most chunk_size tokens that follow the document structure: a chunk never
+              spans two sections unless the first one is tiny, code fences and list items are kept
+              whole when they fit, and longer blocks are cut at sentence, then line/word boundaries.
+              overlap tokens of trailing sentences are repeated at the start of the next chunk of the
+              same section. Works on plain text too (paragraphs and sentences).
+"""
+import re
+from typing import List, Tuple
+from page_context import estimate_tokens, SENTENCE_END_RE
+
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)[ \t#]*$")
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+LIST_ITEM_RE = re.compile(r"^[ \t]*(?:[*+-]|\d+[.)])[ \t]+")
+WORD_END_RE = re.compile(r"\s+")
+HEADING_SEP = " > "
+
+
+def chunk_chars(text: str, chunk_size: int, overlap: int) -> List[Tuple[str, int, int, str]]:
+    """Split text into overlapping character windows."""
+    # simple chunking by characters to keep things simple.
+    out = []
+    L = len(text)
+    i = 0
+    while i < L:
+        chunk = text[i:i+chunk_size]
+        out.append((chunk, i, i + len(chunk), ""))
+        i += chunk_size - overlap
+    return out
+
+
+def _lines(text: str):
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        yield pos, pos + len(line.rstrip("\r\n")), line.rstrip("\r\n")
+        pos += len(line)
+
+
+def markdown_blocks(text: str) -> List[Tuple[int, int, str, str]]:
+    """
+    [(start, end, kind, heading_path), ...] for the blocks of a Markdown document.
+    kind is "heading", "code", "front_matter", "item" (a list item) or "text" (a paragraph).
+    """
+    blocks = []
+    headings = []  # [(level, title), ...] of the current section
+    path = ""
+    block = None  # [start, end, kind] being collected
+    fence = None  # opening marker of the code fence we are in
+
+    def close():
+        nonlocal block
+        if block is not None:
+            blocks.append((block[0], block[1], block[2], path))
+            block = None
+
+    lines = list(_lines(text))
+    i = 0
+    if lines and lines[0][2].strip() == "---":  # YAML front matter
+        for j in range(1, len(lines)):
+            if lines[j][2].strip() in ("---", "..."):
+                blocks.append((lines[0][0], lines[j][1], "front_matter", ""))
+                i = j + 1
+                break
+
+    for start, end, line in lines[i:]:
+        if fence is not None:
+            block[1] = end
+            m = FENCE_RE.match(line)
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) and not line.strip()[len(m.group(1)):]:
+                close()
+                fence = None
+            continue
+        m = FENCE_RE.match(line)
+        if m:
+            close()
+            fence = m.group(1)
+            block = [start, end, "code"]
+            continue
+        m = HEADING_RE.match(line)
+        if m:
+            close()
+            level = len(m.group(1))
+            while headings and headings[-1][0] >= level:
+                headings.pop()
+            headings.append((level, m.group(2).strip()))
+            path = HEADING_SEP.join(title for _, title in headings if title)
+            blocks.append((start, end, "heading", path))
+            continue
+        if not line.strip():
+            close()
+            continue
+        if LIST_ITEM_RE.match(line):
+            close()
+            block = [start, end, "item"]
+        elif block is None:
+            block = [start, end, "text"]
+        else:
+            block[1] = end  # continuation line of a paragraph or list item
+    close()  # also closes an unterminated code fence
+    return blocks
+
+
+def _split_at(text: str, start: int, end: int, pattern: re.Pattern) -> List[Tuple[int, int]]:
+    """(start, end) spans of text[start:end] cut after every match of pattern, separators dropped."""
+    spans = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        if m.start() > pos:
+            spans.append((pos, m.start()))
+        pos = m.end()
+    if pos < end:
+        spans.append((pos, end))
+    return spans
+
+
+def _pieces(text: str, start: int, end: int, kind: str, max_tokens: int) -> List[Tuple[int, int]]:
+    """A block cut into spans of at most max_tokens: sentences (lines for code), then words, then characters."""
+    if estimate_tokens(text[start:end]) <= max_tokens:
+        return [(start, end)]
+    out = []
+    for s, e in _split_at(text, start, end, re.compile(r"\n") if kind == "code" else SENTENCE_END_RE):
+        if estimate_tokens(text[s:e]) <= max_tokens:
+            out.append((s, e))
+            continue
+        for ws, we in _split_at(text, s, e, WORD_END_RE):
+            step = max_tokens * 4
+            out.extend((p, min(p + step, we)) for p in range(ws, we, step))
+    return out
+
+
+def chunk_markdown(text: str, chunk_size: int, overlap: int) -> List[Tuple[str, int, int, str]]:
+    """Structure-aware chunks of at most chunk_size (estimated) tokens; see the module docstring."""
+    min_tokens = chunk_size // 4  # smaller sections are merged into the next one
+    units = []  # (start, end, kind, heading_path)
+    for start, end, kind, path in markdown_blocks(text):
+        units.extend((s, e, kind, path) for s, e in _pieces(text, start, end, kind, chunk_size))
+
+    def tokens(group):
+        return estimate_tokens(text[group[0][0]:group[-1][1]]) if group else 0
+
+    out = []
+    current = []
+    for unit in units:
+        heading = unit[2] == "heading"
+        if current and heading and tokens(current) >= min_tokens:
+            out.append(current)
+            current = []
+        if current and tokens(current + [unit]) > chunk_size:
+            # never end a chunk on a heading: it moves to the next chunk with its content
+            lead = []
+            while current and current[-1][2] == "heading":
+                lead.insert(0, current.pop())
+            carried = []
+            if current and not lead and not heading:
+                for prev in reversed(current[1:]):
+                    if prev[3] != unit[3] or tokens([prev] + carried) > overlap \
+                            or tokens([prev] + carried + [unit]) > chunk_size:
+                        break
+                    carried.insert(0, prev)
+            if current:
+                out.append(current)
+            current = carried or lead
+            if tokens(current + [unit]) > chunk_size:  # a heading followed by a block that fills a chunk alone
+                out.append(current)
+                current = []
+        current.append(unit)
+    if current:
+        out.append(current)
+
+    chunks = []
+    for group in out:
+        start, end = group[0][0], group[-1][1]
+        path = next((u[3] for u in group if u[3]), "")
+        chunks.append((text[start:end], start, end, path))
+    return chunks
+
+
+CHUNKERS = {
+    "chars": chunk_chars,
+    "markdown": chunk_markdown,
+}
+
+# chunk_size / overlap when a request does not set them: characters for "chars", tokens for "markdown"
+DEFAULT_SIZES = {
+    "chars": (500, 50),
+    "markdown": (192, 24),
+}
+
+
+def chunk(chunker: str, text: str, chunk_size: int, overlap: int) -> List[Tuple[str, int, int, str]]:
+    return CHUNKERS[chunker](text, chunk_size, overlap)
+
@@ -0,0 +1,95 @@
+# doc_loader.py
+"""
+Document discovery, reading and chunking for /ingest (chunkers live in chunkers.py).
+
+find_files() walks docs_dir recursively with include/exclude patterns. Reading,
+hashing and chunking run in a process pool (load_files), and results come back
+in the order the files were submitted, with a bounded number of files in flight,
+so ingest sees a deterministic stream no matter how many workers produced it.
+
+Patterns follow .gitignore habits: a pattern without "/" matches the file or
+directory name at any depth ("*.md", "node_modules"), a pattern with "/" matches
+the path relative to docs_dir ("api/*.md", "drafts/*").
+"""
+import os
+import fnmatch
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Sequence, Tuple
+from incremental import content_hash
+import chunkers
+
+DEFAULT_INCLUDE = ("*.txt", "*.md")
+DEFAULT_EXCLUDE = (".*",)  # hidden files and directories (.git, .venv, ...)
+
+
+def matches(rel_path: str, patterns: Sequence[str]) -> bool:
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatchcase(rel_path if "/" in p else name, p) for p in patterns)
+
+
+def find_files(docs_dir: str, include: Sequence[str] = DEFAULT_INCLUDE,
+               exclude: Sequence[str] = DEFAULT_EXCLUDE) -> List[str]:
+    """Paths of all files under docs_dir matching include and not exclude, sorted."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(docs_dir):
+        rel_dir = os.path.relpath(dirpath, docs_dir).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = [d for d in dirnames if not matches(rel_dir + d, exclude)]  # prune excluded trees
+        for name in filenames:
+            rel = rel_dir + name
+            if matches(rel, include) and not matches(rel, exclude):
+                found.append(os.path.join(dirpath, name))
+    return sorted(found)
+
+
+def file_stat(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def read_file(path: str, chunker: str, chunk_size: int, overlap: int) -> dict:
+    """Read, hash and chunk one file (runs in a pool worker)."""
+    try:
+        mtime_ns, size = file_stat(path)
+        with open(path, 'r', encoding='utf-8') as fh:
+            text = fh.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return {"path": path, "error": f"{path}: {e}"}
+    return {
+        "path": path, "error": None, "hash": content_hash(text), "mtime_ns": mtime_ns, "size": size,
+        "chunks": [(chunk, start, end, content_hash(chunk), headings)
+                   for chunk, start, end, headings in chunkers.chunk(chunker, text, chunk_size, overlap)],
+    }
+
+
+def _ordered_map(fn, paths: List[str], args: tuple, workers: int) -> Iterator:
+    """fn(path, *args) for every path, in order, with at most a few files per worker in flight."""
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield fn(path, *args)
+        return
+    # spawned workers only import this module (and incremental, chunkers), never the FastAPI app (and forking a threaded server is unsafe)
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        todo = iter(paths)
+        pending = deque(pool.submit(fn, path, *args) for path in itertools.islice(todo, workers * 4))
+        while pending:
+            result = pending.popleft().result()
+            path = next(todo, None)
+            if path is not None:
+                pending.append(pool.submit(fn, path, *args))
+            yield result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def load_files(paths: List[str], chunker: str, chunk_size: int, overlap: int, workers: int) -> Iterator[dict]:
+    """read_file() results for paths, in order, read and chunked on `workers` processes."""
+    return _ordered_map(read_file, paths, (chunker, chunk_size, overlap), workers)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
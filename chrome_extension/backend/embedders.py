@@ -0,0 +1,65 @@
+# embedders.py
+"""
+Embedding backends behind one interface.
+
+  RemoteEmbedder - OpenAI-compatible embeddings API (Fuelix / gemini-embedding-001)
+  LocalEmbedder  - in-process sentence-transformers model on CPU, loaded from the
+                   bundled HF cache in ./cache (all-MiniLM-L6-v2, 384 dims)
+
+app.py picks one with EMBEDDING_BACKEND and takes the model name and dimension from
+it, so the index, manifest and embedding cache always agree with the embedder.
+"""
+import asyncio
+from typing import List
+import numpy as np
+from upstream import with_retries
+
+
+class Embedder:
+    name: str
+    dim: int
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class RemoteEmbedder(Embedder):
+    def __init__(self, client, model: str, dim: int):
+        # the API does not report the dimension up front, so it is configured
+        self.client = client
+        self.name = model
+        self.dim = dim
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        response = await with_retries(
+            self.client.embeddings.create,
+            model=self.name,
+            input=texts
+        )
+        return np.array([item.embedding for item in response.data], dtype='float32')
+
+
+class LocalEmbedder(Embedder):
+    def __init__(self, model: str, cache_dir: str = "cache", threads: int = 0, batch_size: int = 64):
+        # imported here so the remote backend does not pull in torch
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads > 0:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model, cache_folder=cache_dir, device="cpu")
+        self.name = model
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+
+    def embed_sync(self, texts: List[str]) -> np.ndarray:
+        # sort by length so each batch pads to similar lengths, then restore input order
+        order = np.argsort([len(t) for t in texts], kind='stable')
+        embs = self.model.encode([texts[i] for i in order], batch_size=self.batch_size,
+                                 convert_to_numpy=True, show_progress_bar=False)
+        out = np.empty_like(embs, dtype='float32')
+        out[order] = embs
+        return out
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        # torch releases the GIL, so encoding in a thread keeps the event loop free
+        return await asyncio.to_thread(self.embed_sync, texts)
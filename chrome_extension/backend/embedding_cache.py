@@ -0,0 +1,178 @@
+# embedding_cache.py
+"""
+On-disk, content-addressed cache for embeddings.
+
+Entries are keyed by sha256(model, dimension, normalized text) and stored in
+fixed-capacity memory-mapped arrays under <cache_dir>/<model>-<dim>/:
+  vectors.npy  - float16 (capacity, dim) embedding rows
+  keys.npy     - uint8 (capacity, 16) truncated key digests
+  ticks.npy    - int64 (capacity,) last-use time in ns, 0 marks a free slot
+  generation.npy - int64 (1,) bumped by every write
+
+When the cache is full the least recently used slots are overwritten.
+max_entries must be positive; callers disable the cache by not creating one.
+Vectors are stored as float16, and put_many() returns what it stored, so callers
+get the same vector for a text whether it was a hit or a miss.
+
+The arrays are shared by every worker process using the directory. Writes take an
+exclusive file lock (see file_lock.py), reads a shared one. Each process keeps a
+key -> slot map and rebuilds it from keys/ticks when another process changed the
+generation; a hit is only returned when keys[slot] still holds the key. Dirty pages
+are written back in a background thread at most every flush_seconds (the arrays
+are shared through the page cache, flushing is only for durability). Both
+get_many() and put_many() wait for the file lock, so async callers run them in a
+thread pool.
+"""
+import os
+import time
+import hashlib
+import threading
+from typing import List, Optional
+import numpy as np
+import file_lock
+
+KEY_BYTES = 16
+LOCK_FILE = "lock"
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def _open_array(path: str, shape, dtype):
+    if os.path.exists(path):
+        arr = np.load(path, mmap_mode='r+')
+        if arr.shape == shape and arr.dtype == np.dtype(dtype):
+            return arr, True
+    # created under a temporary name and renamed into place, so another worker process starting at the
+    # same time never np.load()s a file whose header is not written yet
+    tmp = f"{path}.{os.getpid()}.tmp"
+    arr = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    arr.flush()
+    os.replace(tmp, path)
+    return arr, False
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model: str, dim: int, max_entries: int, flush_seconds: float = 5.0):
+        self.model = model
+        self.dim = dim
+        self.max_entries = max_entries
+        self.flush_seconds = flush_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flushed_at = time.monotonic()
+        self._flusher: Optional[threading.Thread] = None
+
+        path = os.path.join(cache_dir, f"{model.replace('/', '_')}-{dim}")
+        os.makedirs(path, exist_ok=True)
+        self._lock_path = os.path.join(path, LOCK_FILE)
+        with file_lock.locked(self._lock_path):
+            self.vectors, ok_v = _open_array(os.path.join(path, "vectors.npy"), (max_entries, dim), np.float16)
+            self.keys, ok_k = _open_array(os.path.join(path, "keys.npy"), (max_entries, KEY_BYTES), np.uint8)
+            self.ticks, ok_t = _open_array(os.path.join(path, "ticks.npy"), (max_entries,), np.int64)
+            self.generation, ok_g = _open_array(os.path.join(path, "generation.npy"), (1,), np.int64)
+            if not (ok_v and ok_k and ok_t):
+                # new cache or a resized one: start empty
+                self.ticks[:] = 0
+                self.generation[0] += 1
+            self._sync()
+
+    def _sync(self):
+        """Rebuild the key -> slot map from the shared arrays (called with the file lock held)."""
+        used = np.nonzero(self.ticks)[0]
+        digests = np.ascontiguousarray(self.keys[used]).view(f"V{KEY_BYTES}").ravel().tolist()
+        self._slots = dict(zip(digests, used.tolist()))
+        self._free = np.nonzero(self.ticks == 0)[0][::-1].tolist()
+        self._generation = int(self.generation[0])
+
+    def key(self, text: str) -> bytes:
+        h = hashlib.sha256(f"{self.model}\0{self.dim}\0{normalize_text(text)}".encode('utf-8'))
+        return h.digest()[:KEY_BYTES]
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached float32 vector for each text, or None for a miss."""
+        out = []
+        with self._lock, file_lock.locked(self._lock_path, shared=True):
+            if self.generation[0] != self._generation:
+                self._sync()
+            now = time.time_ns()
+            for text in texts:
+                k = self.key(text)
+                slot = self._slots.get(k)
+                if slot is None or self.ticks[slot] == 0 or self.keys[slot].tobytes() != k:
+                    self.misses += 1
+                    out.append(None)
+                    continue
+                self.hits += 1
+                self.ticks[slot] = now
+                out.append(np.asarray(self.vectors[slot], dtype=np.float32))
+        return out
+
+    def put_many(self, texts: List[str], vecs: np.ndarray) -> np.ndarray:
+        """Store vecs (one row per text) and return them as float32 rounded like a cache hit."""
+        vecs = np.asarray(vecs, dtype=np.float16)
+        with self._lock, file_lock.locked(self._lock_path):
+            if self.generation[0] != self._generation:
+                self._sync()  # slots another worker filled or evicted since
+            keys = []
+            for text in texts:
+                k = self.key(text)
+                if k not in self._slots and k not in keys:
+                    keys.append(k)
+            rows = {k: i for i, k in enumerate(self.key(t) for t in texts)}
+            keys = keys[-self.max_entries:]
+            self._evict(len(keys) - len(self._free))
+            now = time.time_ns()
+            for k in keys:
+                slot = self._free.pop()
+                self.vectors[slot] = vecs[rows[k]]
+                self.keys[slot] = np.frombuffer(k, dtype=np.uint8)
+                self.ticks[slot] = now
+                self._slots[k] = slot
+            self.generation[0] += 1
+            self._generation = int(self.generation[0])
+            self._dirty = True
+            self._maybe_flush()
+        return vecs.astype(np.float32)
+
+    def _evict(self, n: int):
+        if n <= 0:
+            return
+        used = np.nonzero(self.ticks)[0]
+        oldest = used[np.argpartition(self.ticks[used], n - 1)[:n]]
+        for slot in oldest:
+            self._slots.pop(self.keys[slot].tobytes(), None)
+            self.ticks[slot] = 0
+            self._free.append(int(slot))
+        self.evictions += n
+
+    def _maybe_flush(self):
+        """Write dirty pages back in a background thread, at most every flush_seconds."""
+        if time.monotonic() - self._flushed_at < self.flush_seconds:
+            return
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._flushed_at = time.monotonic()
+        self._flusher = threading.Thread(target=self.flush, name="embedding-cache-flush", daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+        self.vectors.flush()
+        self.keys.flush()
+        self.ticks.flush()
+        self.generation.flush()
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "max_entries": self.max_entries, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
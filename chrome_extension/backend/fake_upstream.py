@@ -0,0 +1,165 @@
+# fake_upstream.py
+"""
+Local stand-in for the OpenAI-compatible embedding and chat APIs, for offline testing and benchmarks.
+
+Embeddings are deterministic pseudo-random vectors seeded by the input text, and
+every call is counted so cache hit rates can be checked against /stats.
+
+Chat completions (plain and stream=True) answer with canned text after a
+configurable time to first token, then produce tokens at a configurable rate.
+A configurable fraction of calls fails with an HTTP error (failure injection), so
+retries and error handling can be exercised. Settings come from the command line
+and can be changed while running with POST /config (see DEFAULT_CONFIG).
+
+Run:
+    python fake_upstream.py --port 9000 --dim 3072 --chat-latency-ms 300 --tokens-per-s 40
+    EMBEDDING_BASE_URL=http://localhost:9000/v1 LLM_BASE_URL=http://localhost:9000/v1 uvicorn app:app --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import uvicorn
+
+app = FastAPI(title="Fake upstream")
+DEFAULT_CONFIG = {
+    "dim": 3072,
+    "embed_latency_ms": 0.0,  # per embeddings call
+    "embed_failure_rate": 0.0,  # fraction of embeddings calls that fail
+    "chat_latency_ms": 200.0,  # time to first token
+    "tokens_per_s": 50.0,  # completion tokens per second after the first one, 0 = all at once
+    "completion_tokens": 64,  # tokens per answer (capped by the request's max_tokens)
+    "chat_failure_rate": 0.0,  # fraction of chat calls that fail
+    "failure_status": 503,  # status code of injected failures
+    "seed": 0,
+}
+config = dict(DEFAULT_CONFIG)
+stats = {"embedding_calls": 0, "embedding_inputs": 0, "embedding_failures": 0,
+         "chat_calls": 0, "chat_stream_calls": 0, "chat_failures": 0, "completion_tokens": 0}
+rng = random.Random(config["seed"])
+WORDS = ("the point cloud labeling tool supports object detection and segmentation across scenes "
+         "with cuboids tracking and synchronized photo context images for every frame").split()
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    return np.random.default_rng(seed).standard_normal(dim).astype('float32').tolist()
+
+
+def injected_failure(rate: float, counter: str):
+    if rate > 0 and rng.random() < rate:
+        stats[counter] += 1
+        return JSONResponse({"error": {"message": "injected failure", "type": "server_error"}},
+                            status_code=int(config["failure_status"]))
+    return None
+
+
+def completion_tokens(body: dict) -> list:
+    n = int(config["completion_tokens"])
+    if body.get("max_tokens"):
+        n = min(n, int(body["max_tokens"]))
+    return [("" if i == 0 else " ") + WORDS[i % len(WORDS)] for i in range(n)]
+
+
+@app.post("/v1/embeddings")
+async def embeddings(body: dict):
+    texts = body.get("input", [])
+    if isinstance(texts, str):
+        texts = [texts]
+    stats["embedding_calls"] += 1
+    if config["embed_latency_ms"] > 0:
+        await asyncio.sleep(config["embed_latency_ms"] / 1000)
+    failure = injected_failure(config["embed_failure_rate"], "embedding_failures")
+    if failure is not None:
+        return failure
+    stats["embedding_inputs"] += len(texts)
+    vectors = await run_in_threadpool(lambda: [fake_embedding(t, config["dim"]) for t in texts])
+    return {
+        "object": "list",
+        "model": body.get("model", "fake"),
+        "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: dict):
+    stats["chat_calls"] += 1
+    failure = injected_failure(config["chat_failure_rate"], "chat_failures")
+    if failure is not None:
+        return failure
+    tokens = completion_tokens(body)
+    stats["completion_tokens"] += len(tokens)
+    delay = 1 / config["tokens_per_s"] if config["tokens_per_s"] > 0 else 0
+    model = body.get("model", "fake")
+    created = int(time.time())
+
+    if body.get("stream"):
+        stats["chat_stream_calls"] += 1
+
+        async def events():
+            await asyncio.sleep(config["chat_latency_ms"] / 1000)
+            for i, token in enumerate(tokens):
+                if i and delay:
+                    await asyncio.sleep(delay)
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(config["chat_latency_ms"] / 1000 + delay * max(len(tokens) - 1, 0))
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+    }
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    for k in stats:
+        stats[k] = 0
+    return stats
+
+
+@app.get("/config")
+def get_config():
+    return config
+
+
+@app.post("/config")
+def set_config(body: dict):
+    """Update settings at runtime; unknown keys are rejected."""
+    unknown = set(body) - set(DEFAULT_CONFIG)
+    if unknown:
+        return JSONResponse({"error": f"unknown settings {sorted(unknown)}"}, status_code=400)
+    config.update({k: type(DEFAULT_CONFIG[k])(v) for k, v in body.items()})
+    if "seed" in body:
+        rng.seed(config["seed"])
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    for key, default in DEFAULT_CONFIG.items():
+        parser.add_argument("--" + key.replace("_", "-"), type=type(default), default=default)
+    args = parser.parse_args()
+    config.update({key: getattr(args, key) for key in DEFAULT_CONFIG})
+    rng.seed(config["seed"])
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
@@ -0,0 +1,76 @@
+# file_lock.py
+"""
+Advisory file locks shared by the uvicorn worker processes (and any other process
+working in the same directory): flock() on a lock file next to the data it guards.
+
+    with locked(os.path.join(root, ".lock")):            # exclusive
+        ...
+    with locked(path, shared=True):                     # readers
+        ...
+
+    lock = FileLock(path)                               # held across awaits
+    await lock.acquire_async()
+    try:
+        ...
+    finally:
+        lock.release()
+
+Where fcntl is not available (Windows) the lock is a no-op, so only one process
+should write there.
+"""
+import os
+import asyncio
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def _lock(self, flags: int) -> bool:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, flags)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def acquire(self, shared: bool = False):
+        self._lock(0 if fcntl is None else fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+    def try_acquire(self) -> bool:
+        """Take the exclusive lock if it is free."""
+        return self._lock(0 if fcntl is None else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    async def acquire_async(self, poll_seconds: float = 0.2):
+        """Exclusive lock without blocking the event loop; cancelling the wait leaves nothing held."""
+        while not self.try_acquire():
+            await asyncio.sleep(poll_seconds)
+
+    def release(self):
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor releases the lock
+            self._fd = None
+
+
+@contextmanager
+def locked(path: str, shared: bool = False):
+    """Hold a lock on path (created if missing) for the duration of the block."""
+    lock = FileLock(path)
+    lock.acquire(shared)
+    try:
+        yield
+    finally:
+        lock.release()
@@ -0,0 +1,76 @@
+# incremental.py
+"""
+Content-hash bookkeeping for incremental /ingest.
+
+The manifest records, for every ingested file, the hash of its content and the
+(vector id, content hash) pair of each chunk it produced. A re-ingest compares
+against it so that only new or changed chunks are embedded, stale vector ids are
+removed, and vectors of unchanged chunks are left alone.
+"""
+import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_PATH = "ingest_manifest.json"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def new_manifest(chunk_size: int, overlap: int, embedding_model: str, chunker: str = "chars") -> dict:
+    return {
+        "chunker": chunker,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "embedding_model": embedding_model,
+        "next_id": 0,
+        "files": {},  # path -> {"hash": str, "mtime_ns": int, "size": int, "chunks": [[id, hash], ...]}
+    }
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_PATH):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+
+def is_compatible(manifest: Optional[dict], chunk_size: int, overlap: int, embedding_model: str,
+                  chunker: str = "chars") -> bool:
+    """Vectors can only be reused when chunks are cut and embedded the same way."""
+    return (
+        manifest is not None
+        and manifest.get("chunker", "chars") == chunker  # manifests from before chunkers.py were all "chars"
+        and manifest.get("chunk_size") == chunk_size
+        and manifest.get("overlap") == overlap
+        and manifest.get("embedding_model") == embedding_model
+    )
+
+
+def reusable_ids(entry: Optional[dict]) -> Dict[str, List[int]]:
+    """Map chunk hash -> vector ids from a file's previous manifest entry."""
+    reusable = {}
+    for cid, chash in (entry["chunks"] if entry else []):
+        reusable.setdefault(chash, []).append(cid)
+    return reusable
+
+
+def stale_ids(old_files: Dict[str, dict], new_files: Dict[str, dict]) -> List[int]:
+    """Vector ids present in the old manifest that no file refers to anymore."""
+    live = {cid for entry in new_files.values() for cid, _ in entry["chunks"]}
+    return [cid for entry in old_files.values() for cid, _ in entry["chunks"] if cid not in live]
+
+
+def diff_summary(old_files: Dict[str, dict], new_files: Dict[str, dict]) -> Tuple[int, int, int]:
+    """(added, changed, removed) file counts between two manifests."""
+    added = sum(1 for p in new_files if p not in old_files)
+    changed = sum(1 for p, e in new_files.items() if p in old_files and old_files[p]["hash"] != e["hash"])
+    removed = sum(1 for p in old_files if p not in new_files)
+    return added, changed, removed
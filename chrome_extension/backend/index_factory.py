@@ -0,0 +1,169 @@
+# index_factory.py
+"""
+Builds the FAISS index used for knowledge-base retrieval.
+
+Supported INDEX_TYPE values:
+  flat      - exact inner-product scan (IndexFlatIP), no training
+  ivf_flat  - inverted lists over full vectors; search cost set by nprobe
+  ivf_pq    - inverted lists over product-quantized codes; smallest, approximate
+  hnsw      - graph index; search cost set by efSearch, no training, no removal
+
+Vectors can also be stored compressed:
+  codec   float32 (default) | float16 | sq8 (8-bit scalar quantization);
+          ivf_pq always stores PQ codes
+  reduce  none | truncate (keep the first reduce_dim dims) | pca (learned at ingest)
+The projection is part of the index, so queries go through it automatically.
+
+Every index is wrapped in IndexIDMap2 so vector ids stay stable across
+incremental ingests. Vectors are L2-normalized (again after any projection),
+so inner product = cosine.
+"""
+import math
+from typing import Optional
+import numpy as np
+import faiss
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+CODECS = {"float32": "Flat", "float16": "SQfp16", "sq8": "SQ8"}
+REDUCTIONS = ("none", "truncate", "pca")
+
+
+def auto_nlist(n: int) -> int:
+    # ~4*sqrt(n) lists, but keep >= 39 training points per centroid as faiss recommends
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def pq_params(dim: int, n: int, pq_m: int):
+    """Largest m <= pq_m dividing dim, and code bits the training set can support."""
+    m = max(d for d in range(1, min(pq_m, dim) + 1) if dim % d == 0)
+    nbits = max(1, min(8, int(math.log2(max(n, 2)))))
+    return m, nbits
+
+
+def factory_string(index_type: str, dim: int, n: int, nlist: int = 0, pq_m: int = 64, hnsw_m: int = 32,
+                   codec: str = "float32") -> str:
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {tuple(CODECS)}")
+    storage = CODECS[codec]
+    if index_type == "flat":
+        return storage
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m},{storage}"
+    nlist = nlist or auto_nlist(n)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},{storage}"
+    if index_type == "ivf_pq":
+        m, nbits = pq_params(dim, n, pq_m)
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+
+def build_index(index_type: str, dim: int, train_vectors: np.ndarray, nlist: int = 0, pq_m: int = 64,
+                hnsw_m: int = 32, ef_construction: int = 200, max_train_points: int = 100000,
+                codec: str = "float32", reduce: str = "none", reduce_dim: int = 0) -> faiss.Index:
+    """Create an empty id-mapped index of the given type, trained on train_vectors if it needs it."""
+    if reduce not in REDUCTIONS:
+        raise ValueError(f"Unknown reduce {reduce!r}, expected one of {REDUCTIONS}")
+    out_dim = reduce_dim if reduce != "none" and 0 < reduce_dim < dim else dim
+    if reduce == "pca" and out_dim < dim and len(train_vectors) < out_dim:
+        # PCA cannot learn more components than it has vectors; truncation needs no training
+        # and stays valid as later incremental ingests add vectors
+        print(f"Only {len(train_vectors)} vectors to learn PCA{out_dim} from, truncating to {out_dim} dims instead")
+        reduce = "truncate"
+    desc = factory_string(index_type, out_dim, len(train_vectors), nlist, pq_m, hnsw_m, codec)
+    metric = faiss.METRIC_INNER_PRODUCT
+    if out_dim == dim:
+        inner = faiss.index_factory(dim, desc, metric)
+    elif reduce == "pca":
+        inner = faiss.index_factory(dim, f"PCA{out_dim},L2norm,{desc}", metric)
+    else:
+        inner = faiss.IndexPreTransform(faiss.RemapDimensionsTransform(dim, out_dim, False),
+                                        faiss.index_factory(out_dim, f"L2norm,{desc}", metric))
+    if index_type == "hnsw":
+        base_index(inner).hnsw.efConstruction = ef_construction
+    if not inner.is_trained:
+        if len(train_vectors) > max_train_points:
+            sample = np.random.default_rng(0).choice(len(train_vectors), max_train_points, replace=False)
+            train_vectors = train_vectors[np.sort(sample)]
+        inner.train(train_vectors)
+    return faiss.IndexIDMap2(inner)
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    """The index that actually stores vectors, below the id map and any projection."""
+    inner = faiss.downcast_index(index)
+    while isinstance(inner, (faiss.IndexIDMap, faiss.IndexPreTransform)):
+        inner = faiss.downcast_index(inner.index)
+    return inner
+
+
+def index_type_of(index: faiss.Index) -> str:
+    inner = base_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def supports_removal(index: faiss.Index) -> bool:
+    return index_type_of(index) != "hnsw"
+
+
+def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Per-call search parameters, so one request's knobs never leak into another's."""
+    index_type = index_type_of(index)
+    if index_type in ("ivf_flat", "ivf_pq") and nprobe:
+        return faiss.SearchParametersIVF(nprobe=nprobe)
+    if index_type == "hnsw" and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=ef_search)
+    return None
+
+
+def search(index: faiss.Index, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+           ef_search: Optional[int] = None):
+    params = search_params(index, nprobe, ef_search)
+    if params is None:
+        return index.search(queries, k)
+    return index.search(queries, k, params=params)
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block: int = 65536) -> np.ndarray:
+    """Row numbers of the exact inner-product top-k, scanning vectors (possibly a memmap) block by block."""
+    best_scores = np.full((len(queries), 0), -np.inf, dtype='float32')
+    best_rows = np.zeros((len(queries), 0), dtype='int64')
+    for start in range(0, len(vectors), block):
+        scores = queries @ np.asarray(vectors[start:start + block], dtype='float32').T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1], dtype='int64'), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, rows], axis=1)
+        keep = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_rows = np.take_along_axis(rows, keep, axis=1)
+    return best_rows
+
+
+def compression_report(index: faiss.Index, vectors: np.ndarray, ids: np.ndarray, index_bytes: int, k: int = 10,
+                       n_queries: int = 200, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> dict:
+    """Memory saved against float32 flat storage, and recall@k of the index against an exact search."""
+    n = len(vectors)
+    full_bytes = vectors.shape[0] * vectors.shape[1] * 4
+    report = {
+        "full_mb": round(full_bytes / 2**20, 2),
+        "index_mb": round(index_bytes / 2**20, 2),
+        "saved_mb": round((full_bytes - index_bytes) / 2**20, 2),
+        "compression_ratio": round(full_bytes / index_bytes, 2) if index_bytes else None,
+    }
+    if n == 0:
+        return report
+    k = min(k, n)
+    rng = np.random.default_rng(0)
+    queries = np.ascontiguousarray(vectors[np.sort(rng.choice(n, min(n_queries, n), replace=False))], dtype='float32')
+    truth = exact_top_k(vectors, queries, k)
+    _, found = search(index, queries, k, nprobe, ef_search)
+    recall = np.mean([len(set(found[i]) & set(ids[truth[i]])) / k for i in range(len(queries))])
+    report[f"recall@{k}"] = round(float(recall), 4)
+    report["recall_change"] = round(float(recall) - 1.0, 4)
+    return report
@@ -0,0 +1,294 @@
+# ingest_jobs.py
+"""
+Background ingest jobs with a bounded-memory, resumable pipeline.
+
+A job streams the corpus through file reading and chunking (doc_loader.py, on a
+process pool) -> embedding in batches of a fixed number of chunks. Each batch is appended to scratch files in
+the job directory (INGEST_JOBS_DIR/<job_id>/) and then committed:
+  job.json          - status, progress, errors and the size of every scratch file at the last commit
+  vectors.f32       - raw float32 embeddings, one row per chunk
+  chunks.bin        - utf-8 chunk text, concatenated (becomes the snapshot's chunk store)
+  chunks_index.i64  - int64 rows [blob_start, blob_end, source_char_start, source_char_end]
+  metas.jsonl       - [metadata record, chunk hash] per chunk
+  files.jsonl       - [path, content hash, mtime_ns, size] of every file read
+
+After the last batch the index is built from vectors.f32 (memory-mapped, added in
+batches) and everything is published as a snapshot, so only one batch of text
+and vectors is held in memory at any time. Progress and the ETA are measured in
+bytes of the input files, known from a stat() when the job is created, so the
+corpus is read only once. A job that was killed is resumed by
+cutting the scratch files back to the sizes recorded at its last commit and
+skipping the chunks that were already committed.
+
+Jobs are shared by all worker processes: state is read from job.json on every
+lookup, and the process running a job holds an flock on its job.lock (see
+file_lock.py). A job that claims to be active while nobody holds its lock was
+left by a process that died, and is reported as interrupted; only such jobs (and
+failed ones) can be resumed, by whichever worker claims the lock first.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+from typing import Callable, Dict, Iterator, List, Optional
+import numpy as np
+from numpy.lib.format import open_memmap
+import file_lock
+
+JOBS_DIR = "ingest_jobs"
+LOCK_FILE = "job.lock"
+SCRATCH_FILES = ("vectors.f32", "chunks.bin", "chunks_index.i64", "metas.jsonl", "files.jsonl")
+ACTIVE = ("queued", "running", "finalizing")
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0  # reported when the file is loaded
+
+
+def iter_chunks(loaded: Iterator[dict], skip: int = 0, on_error: Optional[Callable[[str], None]] = None) -> Iterator[tuple]:
+    """
+    (chunk, start, end, source, file_hash, chunk_hash, mtime_ns, size, heading_path) for every chunk of
+    doc_loader.load_files() results after the first `skip`.
+    """
+    for f in loaded:
+        if f["error"] is not None:
+            if on_error is not None:
+                on_error(f["error"])
+            continue
+        if skip >= len(f["chunks"]):
+            skip -= len(f["chunks"])
+            continue
+        for chunk, start, end, chash, headings in f["chunks"][skip:]:
+            yield chunk, start, end, f["path"], f["hash"], chash, f["mtime_ns"], f["size"], headings
+        skip = 0
+
+
+class IngestJob:
+    def __init__(self, path: str, state: dict):
+        self.path = path
+        self.state = state
+        self.task = None  # asyncio.Task while this process is running the job
+        self._owner_lock = None  # file_lock.FileLock on job.lock while this process runs the job
+        self._scratch = None  # open scratch files while running
+        self._run_start = None  # (time, chunks_done) when this process started on the job, for the rate
+
+    @property
+    def id(self) -> str:
+        return self.state["job_id"]
+
+    @classmethod
+    def create(cls, request: dict, layout: dict, files: List[str], root: str = JOBS_DIR) -> "IngestJob":
+        job_id = uuid.uuid4().hex[:12]
+        path = os.path.join(root, job_id)
+        os.makedirs(path)
+        now = time.time()
+        state = {
+            "job_id": job_id, "status": "queued", "stage": None, "request": request, "layout": layout,
+            "files": files, "files_total": len(files), "files_read": 0, "last_file": None,
+            "bytes_total": sum(_file_size(path) for path in files), "bytes_read": 0, "chunks_done": 0, "batches_done": 0,
+            "dim": None, "sizes": {name: 0 for name in SCRATCH_FILES}, "errors": [], "result": None,
+            "created_at": now, "updated_at": now, "finished_at": None,
+        }
+        job = cls(path, state)
+        job.claim()  # before job.json exists, so no other process ever sees it unowned
+        job.save()
+        return job
+
+    @classmethod
+    def load(cls, path: str) -> "IngestJob":
+        """The job as last saved; an active job whose process is gone is reported as interrupted."""
+        with open(os.path.join(path, "job.json"), 'r', encoding='utf-8') as f:
+            job = cls(path, json.load(f))
+        if job.state["status"] in ACTIVE and not job.has_owner():
+            job.state["status"] = "interrupted"
+        return job
+
+    def claim(self) -> bool:
+        """Become the process running this job (until release()); False when another one is."""
+        lock = file_lock.FileLock(os.path.join(self.path, LOCK_FILE))
+        if not lock.try_acquire():
+            return False
+        self._owner_lock = lock
+        state_file = os.path.join(self.path, "job.json")
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)  # whatever the previous owner committed last
+            if self.state["status"] in ACTIVE:
+                self.state["status"] = "interrupted"
+        self.state["owner_pid"] = os.getpid()
+        return True
+
+    def release(self):
+        if self._owner_lock is not None:
+            self._owner_lock.release()
+            self._owner_lock = None
+
+    def has_owner(self) -> bool:
+        """Whether some live process (this one included) is running the job."""
+        if self._owner_lock is not None:
+            return True
+        lock = file_lock.FileLock(os.path.join(self.path, LOCK_FILE))
+        if lock.try_acquire():
+            lock.release()
+            return False
+        return True
+
+    def save(self):
+        self.state["updated_at"] = time.time()
+        tmp = os.path.join(self.path, "job.json.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, "job.json"))
+
+    def set_status(self, status: str, stage: Optional[str] = None):
+        self.state["status"] = status
+        self.state["stage"] = stage
+        if status in ("done", "failed"):
+            self.state["finished_at"] = time.time()
+        self.save()
+
+    def add_error(self, message: str):
+        print(f"Ingest job {self.id}: {message}")
+        self.state["errors"].append(message)
+        self.save()
+
+    def open_scratch(self):
+        """Open the scratch files for appending, cut back to the last committed batch."""
+        self._scratch = {}
+        for name in SCRATCH_FILES:
+            f = open(os.path.join(self.path, name), 'ab')
+            f.truncate(self.state["sizes"][name])
+            f.seek(0, os.SEEK_END)  # truncate() leaves the position where it was
+            self._scratch[name] = f
+        self._run_start = (time.time(), self.state.get("bytes_read", 0), self.state["chunks_done"])
+
+    def close_scratch(self):
+        for f in (self._scratch or {}).values():
+            f.close()
+        self._scratch = None
+
+    def commit_batch(self, items: List[tuple], embs: np.ndarray):
+        """Append one batch of iter_chunks() items and their embeddings, then record it as committed."""
+        files = self._scratch
+        pos = self.state["sizes"]["chunks.bin"]
+        first_id = self.state["chunks_done"]
+        offsets = np.zeros((len(items), 4), dtype=np.int64)
+        for i, (chunk, start, end, source, fhash, chash, mtime_ns, size, headings) in enumerate(items):
+            data = chunk.encode('utf-8')
+            files["chunks.bin"].write(data)
+            offsets[i] = (pos, pos + len(data), start, end)
+            pos += len(data)
+            meta = {"id": first_id + i, "title": os.path.basename(source), "source": source, "start": start, "end": end,
+                    "heading_path": headings}
+            files["metas.jsonl"].write((json.dumps([meta, chash], ensure_ascii=False) + "\n").encode('utf-8'))
+            if source != self.state.get("last_file"):
+                line = json.dumps([source, fhash, mtime_ns, size], ensure_ascii=False)
+                files["files.jsonl"].write((line + "\n").encode('utf-8'))
+                # a file's chunks only arrive once it has been read whole
+                self.state["last_file"] = source
+                self.state["files_read"] = self.state.get("files_read", 0) + 1
+                self.state["bytes_read"] = self.state.get("bytes_read", 0) + size
+        files["chunks_index.i64"].write(offsets.tobytes())
+        files["vectors.f32"].write(np.ascontiguousarray(embs, dtype=np.float32).tobytes())
+        for name, f in files.items():
+            f.flush()
+            os.fsync(f.fileno())
+            self.state["sizes"][name] = f.tell()
+        self.state["dim"] = int(embs.shape[1])
+        self.state["chunks_done"] += len(items)
+        self.state["batches_done"] += 1
+        self.save()
+
+    def vectors(self) -> np.ndarray:
+        n = self.state["chunks_done"]
+        if n == 0:
+            return np.zeros((0, self.state["dim"] or 0), dtype=np.float32)
+        return np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32, mode='r',
+                         shape=(n, self.state["dim"]))
+
+    def iter_metas(self) -> Iterator[dict]:
+        with open(os.path.join(self.path, "metas.jsonl"), 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)[0]
+
+    def manifest(self, manifest: dict) -> dict:
+        """Fill a fresh inc.new_manifest() with the files and chunk hashes of this job."""
+        with open(os.path.join(self.path, "files.jsonl"), 'r', encoding='utf-8') as f:
+            for line in f:
+                source, fhash, mtime_ns, size = json.loads(line)
+                manifest["files"][source] = {"hash": fhash, "mtime_ns": mtime_ns, "size": size, "chunks": []}
+        with open(os.path.join(self.path, "metas.jsonl"), 'r', encoding='utf-8') as f:
+            for line in f:
+                meta, chash = json.loads(line)
+                manifest["files"][meta["source"]]["chunks"].append([meta["id"], chash])
+        manifest["next_id"] = self.state["chunks_done"]
+        return manifest
+
+    def move_chunk_store(self, data_path: str, index_path: str):
+        """Turn the scratch text and offsets into a chunk store (chunk_store.py layout) at the given paths."""
+        n = self.state["chunks_done"]
+        # linked rather than moved, so a job that fails while finalizing can still be resumed
+        try:
+            os.link(os.path.join(self.path, "chunks.bin"), data_path)
+        except OSError:
+            shutil.copyfile(os.path.join(self.path, "chunks.bin"), data_path)
+        out = open_memmap(index_path, mode='w+', dtype=np.int64, shape=(n, 4))
+        if n:
+            out[:] = np.memmap(os.path.join(self.path, "chunks_index.i64"), dtype=np.int64, mode='r', shape=(n, 4))
+        out.flush()
+        del out
+
+    def remove_scratch(self):
+        for name in SCRATCH_FILES:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+
+    def progress(self) -> dict:
+        s = self.state
+        out = {k: s.get(k) for k in ("job_id", "status", "stage", "files_total", "files_read", "bytes_total",
+                                     "bytes_read", "chunks_done", "batches_done", "errors", "result", "rebuild_reason",
+                                     "created_at", "updated_at", "finished_at")}
+        out["chunks_per_s"] = None
+        out["eta_s"] = None
+        if self._run_start is not None and s["status"] == "running":
+            started, bytes_before, chunks_before = self._run_start
+            elapsed = time.time() - started
+            if elapsed > 0 and s["chunks_done"] > chunks_before:
+                out["chunks_per_s"] = round((s["chunks_done"] - chunks_before) / elapsed, 2)
+                bytes_rate = (s.get("bytes_read", 0) - bytes_before) / elapsed
+                if s.get("bytes_total") is not None and bytes_rate > 0:
+                    out["eta_s"] = round(max(s["bytes_total"] - s["bytes_read"], 0) / bytes_rate, 1)
+        return out
+
+
+def find_job(job_id: str, root: str = JOBS_DIR) -> Optional[IngestJob]:
+    """The job as saved by whichever process ran it, None when unknown."""
+    if not job_id.isalnum():
+        return None
+    try:
+        return IngestJob.load(os.path.join(root, job_id))
+    except (OSError, ValueError):
+        return None
+
+
+def list_jobs(root: str = JOBS_DIR) -> List[IngestJob]:
+    """All jobs of every process, newest first."""
+    if not os.path.isdir(root):
+        return []
+    jobs = [job for job in map(lambda job_id: find_job(job_id, root), os.listdir(root)) if job is not None]
+    return sorted(jobs, key=lambda j: j.state["created_at"], reverse=True)
+
+
+def prune_jobs(root: str, keep: int):
+    """Delete all but the newest `keep` finished jobs."""
+    finished = [j for j in list_jobs(root) if j.state["status"] in ("done", "failed")]
+    for job in finished[keep:]:
+        shutil.rmtree(job.path, ignore_errors=True)
@@ -3,6 +3,6 @@ import requests
 import json
 
 backend = "http://localhost:8000"
-payload = {"docs_dir": "./docs", "chunk_size": 500, "overlap": 80}
+payload = {"docs_dir": "./docs", "chunker": "markdown", "chunk_size": 192, "overlap": 24}
 r = requests.post(backend + "/ingest", json=payload)
 print(r.status_code, r.text)
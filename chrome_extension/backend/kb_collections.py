@@ -0,0 +1,115 @@
+# kb_collections.py
+"""
+Named knowledge-base collections, each with its own snapshots on disk.
+
+The default collection keeps using SNAPSHOTS_DIR, so existing deployments are
+served unchanged; every other collection lives in <collections dir>/<name>/ with
+the same layout (versioned snapshot directories and a CURRENT pointer, see
+snapshots.py), including its own incremental-ingest manifest.
+
+Loaded collections are kept in an LRU bounded by a memory budget. A snapshot's
+footprint is estimated by the size of its files (index, metadata, chunk store,
+BM25 postings). Collections are loaded on first use and the least recently used
+ones are dropped when the budget is exceeded; requests that still hold a dropped
+Snapshot keep using it until they finish. The default collection is pinned.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import snapshots
+from snapshots import Snapshot
+
+DEFAULT = "default"
+NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def validate_name(name: Optional[str]) -> str:
+    """The collection name, DEFAULT for None; raises ValueError for names unsafe as a directory."""
+    if name is None or name == DEFAULT:
+        return DEFAULT
+    if not NAME_RE.match(name) or ".." in name:
+        raise ValueError(f"Invalid collection name {name!r}: letters, digits, '_', '-' and '.', up to 64 characters")
+    return name
+
+
+def snapshot_bytes(path: str) -> int:
+    """Estimated memory footprint of the snapshot in path: the size of its files (walks the directory)."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class Collections:
+    """
+    Snapshot roots of all collections and an LRU of the loaded ones under budget_bytes, accounted
+    by Snapshot.nbytes (set by whoever opened the snapshot, off the event loop).
+    """
+
+    def __init__(self, collections_dir: str, default_root: str, budget_bytes: int):
+        self.collections_dir = collections_dir
+        self.default_root = default_root
+        self.budget_bytes = budget_bytes
+        self.loads = 0
+        self.evictions = 0
+        self._loaded = OrderedDict()  # name -> (Snapshot, bytes)
+        self._lock = threading.Lock()
+
+    def root(self, name: str) -> str:
+        return self.default_root if name == DEFAULT else os.path.join(self.collections_dir, name)
+
+    def exists(self, name: str) -> bool:
+        return snapshots.current_version(self.root(name)) is not None
+
+    def names(self) -> List[str]:
+        """Collections with a published snapshot, the default one first."""
+        names = [DEFAULT] if self.exists(DEFAULT) else []
+        if os.path.isdir(self.collections_dir):
+            names.extend(n for n in sorted(os.listdir(self.collections_dir))
+                         if NAME_RE.match(n) and n != DEFAULT and self.exists(n))
+        return names
+
+    def get(self, name: str) -> Optional[Snapshot]:
+        """The loaded snapshot of name (marked as recently used), None when it is not loaded."""
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is None:
+                return None
+            self._loaded.move_to_end(name)
+            return entry[0]
+
+    def put(self, name: str, snap: Snapshot):
+        """Keep snap as the loaded version of name, dropping cold collections beyond the budget."""
+        size = snap.nbytes
+        with self._lock:
+            if name not in self._loaded:
+                self.loads += 1
+            self._loaded[name] = (snap, size)
+            self._loaded.move_to_end(name)
+            for cold in list(self._loaded):
+                if self.loaded_bytes() <= self.budget_bytes:
+                    break
+                if cold in (name, DEFAULT):
+                    continue
+                del self._loaded[cold]
+                self.evictions += 1
+                print(f"Unloaded collection {cold!r} (memory budget {self.budget_bytes // 2**20} MB)")
+
+    def loaded(self) -> Dict[str, Snapshot]:
+        with self._lock:
+            return {name: snap for name, (snap, _) in self._loaded.items()}
+
+    def loaded_bytes(self) -> int:
+        return sum(size for _, size in self._loaded.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            loaded = {name: {"version": snap.version, "bytes": size} for name, (snap, size) in self._loaded.items()}
+        return {"loaded": loaded, "loaded_bytes": sum(v["bytes"] for v in loaded.values()),
+                "budget_bytes": self.budget_bytes, "loads": self.loads, "evictions": self.evictions}
@@ -0,0 +1,205 @@
+# meta_store.py
+"""
+Columnar, memory-mapped chunk metadata (replaces loading docs_meta.json into per-worker dicts).
+
+Layout on disk, all inside one directory (a snapshot):
+  docs_meta.npy          - one structured row per chunk (ROW_DTYPE):
+                           vector id, doc, start, end, heading, extra
+  docs_meta_ids.npy      - int64 (n, 2): [vector id, row], sorted by vector id
+  docs_meta_docs.npy     - int32 (d, 2): [source, title] string ids, one row per source file
+  docs_meta_strings.npy  - int64 (m + 1,) offsets into docs_meta_strings.bin
+  docs_meta_strings.bin  - utf-8 strings, each stored once: sources, titles, heading paths and the
+                           JSON of any keys beyond the known columns
+
+Sources, titles and heading paths are interned, so a million chunks of a few
+thousand files cost about 50 bytes each and nothing is parsed at startup. Records
+are only materialized as dicts for the rows a request actually reads, and vector
+ids are mapped to rows by binary search, so every worker process shares the same
+page-cache pages.
+
+JSON export for debugging:
+    python meta_store.py snapshots/<version> [docs_meta.json]
+"""
+import os
+import sys
+import json
+import mmap
+from array import array
+from typing import Iterable, Iterator, Optional
+import numpy as np
+
+ROWS_PATH = "docs_meta.npy"
+IDS_PATH = "docs_meta_ids.npy"
+DOCS_PATH = "docs_meta_docs.npy"
+STRINGS_INDEX_PATH = "docs_meta_strings.npy"
+STRINGS_PATH = "docs_meta_strings.bin"
+
+WRITE_BATCH_ROWS = 65536  # rows buffered while writing a store
+ROW_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("doc", "<i4"),  # row of docs_meta_docs.npy
+    ("start", "<i8"),  # character span in the source file, -1 when unknown
+    ("end", "<i8"),
+    ("heading", "<i4"),  # string id of the heading path, -1 when the record has none
+    ("extra", "<i4"),  # string id of a JSON object with any other keys, -1 when there are none
+])
+KNOWN_KEYS = ("id", "title", "source", "start", "end", "heading_path")
+
+
+class _StringTable:
+    """Interns strings while writing them to the strings blob."""
+
+    def __init__(self, f):
+        self.f = f
+        self.ids = {}
+        self.offsets = array('q', [0])
+
+    def add(self, s: str) -> int:
+        sid = self.ids.get(s)
+        if sid is None:
+            data = s.encode('utf-8')
+            self.f.write(data)
+            sid = self.ids[s] = len(self.offsets) - 1
+            self.offsets.append(self.offsets[-1] + len(data))
+        return sid
+
+
+def write_meta_store(metas: Iterable[dict], path: str = "."):
+    """
+    Write the records (any iterable, consumed once) as a columnar store in directory path. Rows are
+    written WRITE_BATCH_ROWS at a time to a scratch file, only the interned strings stay in memory.
+    """
+    docs = {}  # (source, title) -> doc
+    rows = []
+    n = 0
+    scratch = os.path.join(path, ROWS_PATH + ".tmp")
+    with open(os.path.join(path, STRINGS_PATH), 'wb') as f, open(scratch, 'wb') as rows_file:
+        strings = _StringTable(f)
+        for meta in metas:
+            source, title = meta.get('source', ''), meta.get('title', '')
+            doc = docs.get((source, title))
+            if doc is None:
+                doc = docs[(source, title)] = len(docs)
+                strings.add(source)
+                strings.add(title)
+            extra = {k: v for k, v in meta.items() if k not in KNOWN_KEYS}
+            rows.append((
+                meta['id'], doc, meta.get('start', -1), meta.get('end', -1),
+                strings.add(meta['heading_path']) if 'heading_path' in meta else -1,
+                strings.add(json.dumps(extra, ensure_ascii=False, sort_keys=True)) if extra else -1,
+            ))
+            if len(rows) == WRITE_BATCH_ROWS:
+                rows_file.write(np.array(rows, dtype=ROW_DTYPE).tobytes())
+                n += len(rows)
+                rows = []
+        rows_file.write(np.array(rows, dtype=ROW_DTYPE).tobytes())
+        n += len(rows)
+
+    table = np.lib.format.open_memmap(os.path.join(path, ROWS_PATH), mode='w+', dtype=ROW_DTYPE, shape=(n,))
+    if n:
+        table[:] = np.memmap(scratch, dtype=ROW_DTYPE, mode='r', shape=(n,))
+    os.remove(scratch)
+    vector_ids = np.array(table["id"])
+    table.flush()
+    del table
+    order = np.argsort(vector_ids, kind='stable')
+    ids = np.lib.format.open_memmap(os.path.join(path, IDS_PATH), mode='w+', dtype=np.int64, shape=(n, 2))
+    ids[:, 0] = vector_ids[order]
+    ids[:, 1] = order
+    ids.flush()
+    del ids
+    np.save(os.path.join(path, DOCS_PATH),
+            np.array([(strings.ids[s], strings.ids[t]) for s, t in docs], dtype=np.int32).reshape(-1, 2))
+    np.save(os.path.join(path, STRINGS_INDEX_PATH), np.frombuffer(strings.offsets, dtype=np.int64))
+
+
+def write_json(metas: Iterable[dict], path: str):
+    """docs_meta.json (a JSON list, one record per line) written from any iterable of records."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("[")
+        for i, meta in enumerate(metas):
+            f.write(",\n" if i else "\n")
+            f.write(json.dumps(meta, ensure_ascii=False))
+        f.write("\n]\n")
+
+
+class MetaStore:
+    """Read-only, list-like view (len, [row], iteration) over a store written by write_meta_store()."""
+
+    def __init__(self, path: str = "."):
+        self.rows = np.load(os.path.join(path, ROWS_PATH), mmap_mode='r')
+        self.ids = np.load(os.path.join(path, IDS_PATH), mmap_mode='r')
+        self.docs = np.load(os.path.join(path, DOCS_PATH), mmap_mode='r')
+        self.string_offsets = np.load(os.path.join(path, STRINGS_INDEX_PATH), mmap_mode='r')
+        self._file = open(os.path.join(path, STRINGS_PATH), 'rb')
+        # mmap refuses zero-length files, so an empty store keeps an empty buffer
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buf = b""
+
+    def __len__(self):
+        return len(self.rows)
+
+    def string(self, sid: int) -> str:
+        return self._buf[int(self.string_offsets[sid]):int(self.string_offsets[sid + 1])].decode('utf-8')
+
+    def __getitem__(self, row: int) -> dict:
+        r = self.rows[row]
+        source_id, title_id = self.docs[r["doc"]]
+        meta = {"id": int(r["id"]), "title": self.string(int(title_id)), "source": self.string(int(source_id))}
+        if r["start"] >= 0:
+            meta["start"], meta["end"] = int(r["start"]), int(r["end"])
+        if r["heading"] >= 0:
+            meta["heading_path"] = self.string(int(r["heading"]))
+        if r["extra"] >= 0:
+            meta.update(json.loads(self.string(int(r["extra"]))))
+        return meta
+
+    def __iter__(self) -> Iterator[dict]:
+        return (self[row] for row in range(len(self)))
+
+    def row_of(self, vector_id: int) -> Optional[int]:
+        sorted_ids = self.ids[:, 0]
+        i = int(np.searchsorted(sorted_ids, vector_id))
+        if i < len(sorted_ids) and sorted_ids[i] == vector_id:
+            return int(self.ids[i, 1])
+        return None
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+        self._file.close()
+
+
+class IdLookup:
+    """Dict-like `vector id -> row` backed by MetaStore.row_of, a drop-in for the id_to_row dict."""
+
+    def __init__(self, store: MetaStore):
+        self.store = store
+
+    def __contains__(self, vector_id) -> bool:
+        return self.store.row_of(vector_id) is not None
+
+    def __getitem__(self, vector_id) -> int:
+        row = self.store.row_of(vector_id)
+        if row is None:
+            raise KeyError(vector_id)
+        return row
+
+    def __len__(self):
+        return len(self.store)
+
+
+def exists(path: str = ".") -> bool:
+    return all(os.path.exists(os.path.join(path, name))
+               for name in (ROWS_PATH, IDS_PATH, DOCS_PATH, STRINGS_INDEX_PATH, STRINGS_PATH))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        sys.exit("usage: python meta_store.py <store directory> [out.json]")
+    store = MetaStore(sys.argv[1])
+    out = sys.argv[2] if len(sys.argv) == 3 else "docs_meta.json"  # never into the snapshot, it is immutable
+    write_json(store, out)
+    print(f"Wrote {len(store)} records to {out}")
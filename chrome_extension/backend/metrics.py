@@ -0,0 +1,188 @@
+# metrics.py
+"""
+Small in-process metrics used by the backend.
+
+Histogram keeps cumulative counts over fixed upper bounds (the same layout a
+Prometheus histogram uses), plus count and sum, so observing a value is O(buckets)
+with no per-sample storage. Registry renders histograms and gauges for /metrics,
+and timed()/record() feed per-stage latency histograms and the Server-Timing header.
+Every uvicorn worker keeps its own metrics; scrape each worker (or run one) to see all of them.
+"""
+import bisect
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence
+
+# milliseconds, for latencies and queue waits
+LATENCY_MS_BUCKETS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# items per batch
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest bound for +Inf)."""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            target = q * self.count
+            seen = 0
+            for i, c in enumerate(self.counts):
+                seen += c
+                if seen >= target:
+                    return self.buckets[min(i, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative = []
+            seen = 0
+            for bound, c in zip(self.buckets + (float("inf"),), self.counts):
+                seen += c
+                cumulative.append((bound, seen))
+            count, total = self.count, self.sum
+        return {
+            "count": count,
+            "mean": round(total / count, 3) if count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {("+Inf" if bound == float("inf") else str(bound)): c for bound, c in cumulative},
+        }
+
+
+# seconds, for the per-stage timings exported on /metrics
+STAGE_SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# prompt sizes, in estimated tokens
+TOKEN_BUCKETS = (16, 64, 256, 512, 1000, 2000, 4000, 8000, 16000, 32000)
+# streamed completion speed
+TOKENS_PER_S_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class HistogramFamily:
+    """One metric name with a Histogram per value of a single label."""
+
+    def __init__(self, label: str, buckets: Sequence[float]):
+        self.label = label
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            with self._lock:
+                child = self.children.setdefault(value, Histogram(self.buckets))
+        return child
+
+
+class Registry:
+    """Histograms and callback gauges rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}  # name -> (type, help, Histogram | HistogramFamily | callable)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float], label: Optional[str] = None):
+        metric = HistogramFamily(label, buckets) if label else Histogram(buckets)
+        return self.register(name, help, metric)
+
+    def register(self, name: str, help: str, metric):
+        """Export an existing Histogram / HistogramFamily under name."""
+        self._metrics[name] = ("histogram", help, metric)
+        return metric
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float]):
+        """A gauge whose value is read from fn() at scrape time."""
+        self._metrics[name] = ("gauge", help, fn)
+
+    def counter(self, name: str, help: str, fn: Callable[[], float]):
+        """A counter whose (monotonic) value is read from fn() at scrape time."""
+        self._metrics[name] = ("counter", help, fn)
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help, metric) in self._metrics.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind in ("gauge", "counter"):
+                try:
+                    value = metric()
+                except Exception:
+                    continue  # e.g. nothing loaded yet
+                lines.append(f"{name} {_number(value)}")
+            elif isinstance(metric, HistogramFamily):
+                for value, child in sorted(metric.children.items()):
+                    lines.extend(_histogram_lines(name, child, f'{metric.label}="{_escape(value)}"'))
+            else:
+                lines.extend(_histogram_lines(name, metric, ""))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def _histogram_lines(name: str, h: Histogram, labels: str) -> List[str]:
+    with h._lock:
+        counts, count, total = list(h.counts), h.count, h.sum
+    sep = "," if labels else ""
+    lines = []
+    seen = 0
+    for bound, c in zip(h.buckets + (float("inf"),), counts):
+        seen += c
+        lines.append(f'{name}_bucket{{{labels}{sep}le="{_number(bound)}"}} {seen}')
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{suffix} {_number(total)}")
+    lines.append(f"{name}_count{suffix} {count}")
+    return lines
+
+
+# Per-request stage timings, for the Server-Timing header: the request handler calls begin_request(),
+# and timed()/record() anywhere below it (same task, or threads and tasks started from it) add to it.
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def begin_request() -> Dict[str, float]:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record(family: HistogramFamily, stage: str, seconds: float):
+    family.labels(stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(family: HistogramFamily, stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(family, stage, time.perf_counter() - start)
+
+
+def server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value, durations in milliseconds."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
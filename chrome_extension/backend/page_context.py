@@ -0,0 +1,93 @@
+# page_context.py
+"""
+Relevance selection for the webpage text sent by the extension.
+
+Instead of pasting the whole page into every prompt, the page is cut into
+sentence-aligned passages, the passages are ranked against the question, and
+only the best ones that fit in a token budget are kept (in page order). Passage
+embeddings are cached per (url, content hash), so follow-up questions on the
+same page only need the query embedding.
+"""
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import numpy as np
+import bm25
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)."""
+    return (len(text) + 3) // 4
+
+
+def chunk_page(content: str, chunk_chars: int) -> List[str]:
+    """Pack sentences into passages of about chunk_chars; overlong sentences are split."""
+    passages = []
+    current = ""
+    for sentence in SENTENCE_END_RE.split(content):
+        while len(sentence) > chunk_chars:
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(sentence[:chunk_chars])
+            sentence = sentence[chunk_chars:]
+        if current and len(current) + 1 + len(sentence) > chunk_chars:
+            passages.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        passages.append(current)
+    return passages
+
+
+def page_key(url: str, content: str) -> Tuple[str, str]:
+    return url, hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class PageCache:
+    """LRU of page passages and their normalized embeddings."""
+
+    def __init__(self, max_pages: int):
+        self.max_pages = max_pages
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Tuple[List[str], Optional[np.ndarray]]]:
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None:
+                self._pages.move_to_end(key)
+            return entry
+
+    def put(self, key, passages: List[str], embeddings: Optional[np.ndarray]):
+        with self._lock:
+            self._pages[key] = (passages, embeddings)
+            self._pages.move_to_end(key)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+
+    def __len__(self):
+        return len(self._pages)
+
+
+def lexical_scores(query: str, passages: List[str]) -> np.ndarray:
+    terms = set(bm25.tokenize(query))
+    return np.array([len(terms.intersection(bm25.tokenize(p))) for p in passages], dtype=np.float32)
+
+
+def select_passages(passages: List[str], scores: np.ndarray, token_budget: int) -> str:
+    """Highest-scoring passages that fit the budget, joined back in page order."""
+    chosen = []
+    used = 0
+    for i in np.argsort(-scores, kind='stable'):
+        cost = estimate_tokens(passages[i])
+        if used + cost > token_budget:
+            continue
+        chosen.append(int(i))
+        used += cost
+    return " ... ".join(passages[i] for i in sorted(chosen))
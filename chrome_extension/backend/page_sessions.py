@@ -0,0 +1,101 @@
+# page_sessions.py
+"""
+Server-side page sessions, so the extension uploads a page's context once.
+
+POST /pages registers a page_context and returns its page_id, a hash of the
+context (result_cache.page_hash, so re-registering an unchanged page is a no-op).
+Follow-up questions send only {query, page_id}. Each session keeps the page
+ready for prompting: the page passages and their embeddings (when the page is
+over the page-context budget) and the serialized code/image/video items.
+
+Sessions live in a per-process LRU with a sliding TTL. When a directory is
+configured the registered contexts are also written there as <page_id>.json,
+so another worker process (uvicorn --workers) can rebuild a session it has not
+seen; passage embeddings then come from the shared embedding cache. Files older
+than the TTL are removed while registering.
+"""
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import result_cache as rc
+
+PRUNE_EVERY = 64  # registrations between scans of the session directory
+
+
+class PageSession:
+    def __init__(self, page_id: str, page_context: dict):
+        self.page_id = page_id
+        self.page_context = page_context
+        self.content = page_context.get('content', '').strip()
+        self.passages: Optional[List[str]] = None  # None when the whole page fits the budget
+        self.embeddings: Optional[np.ndarray] = None  # normalized, None when embedding failed
+        self.media: Optional[Dict[str, Tuple[List[str], List[int]]]] = None
+
+
+class PageSessionStore:
+    def __init__(self, max_pages: int, ttl_seconds: float, directory: Optional[str] = None):
+        self.sessions = rc.TTLCache(max_pages, ttl_seconds, sliding=True)
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+        self.registrations = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, page_id: str) -> Optional[PageSession]:
+        return self.sessions.get(page_id)
+
+    def put(self, session: PageSession):
+        self.sessions.put(session.page_id, session)
+
+    def _path(self, page_id: str) -> str:
+        return os.path.join(self.directory, f"{page_id}.json")
+
+    def save(self, page_id: str, page_context: dict):
+        """Write the context for other workers (tmp + rename, readers never see a partial file)."""
+        if not self.directory:
+            return
+        path = self._path(page_id)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(page_context, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        with self._lock:
+            self.registrations += 1
+            prune = self.registrations % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    def load(self, page_id: str) -> Optional[dict]:
+        """The context registered (on any worker) under page_id, None when unknown or expired."""
+        if not self.directory or not page_id.isalnum():
+            return None
+        path = self._path(page_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                page_context = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return page_context
+
+    def prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass  # removed by another worker meanwhile
+
+    def stats(self) -> dict:
+        return {**self.sessions.stats(), "directory": self.directory}
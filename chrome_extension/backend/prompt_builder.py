@@ -0,0 +1,214 @@
+# prompt_builder.py
+"""
+Prompt assembly shared by /chat and /chat/stream.
+
+The context is built from sections (page text, code blocks, images, videos,
+knowledge-base excerpts). Each section's items carry a token count, and when the
+prompt exceeds the budget, items are dropped from the lowest-priority sections
+first. The page text is truncated rather than dropped. The serialized media
+sections of a page are cached, so follow-up turns on the same page reuse them.
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from page_context import estimate_tokens
+
+SYSTEM_PROMPT_WEBPAGE = (
+    "You are a helpful and conversational AI assistant that answers questions about webpages in a natural, human-friendly way. "
+    "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, code blocks (```), and other Markdown formatting. "
+    "PRIORITIZE the webpage content provided above all other sources. Use the supplementary knowledge base only if the webpage content doesn't contain the answer. "
+    "When relevant to the user's question, include and reference code blocks, images, or videos from the webpage. "
+    "For code blocks, use proper syntax highlighting with language tags (```javascript, ```python, etc.). "
+    "For images, describe them and mention their purpose when relevant. "
+    "For videos, reference their titles and content when applicable. "
+    "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
+    "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
+)
+
+SYSTEM_PROMPT_KB = (
+    "You are a helpful and conversational AI assistant that answers questions using the provided knowledge base. "
+    "Format your responses using proper Markdown for better readability - use headers (##), bullet points (-), **bold text**, and other Markdown formatting. "
+    "Structure your answers clearly with appropriate headings and bullet points for easy reading. "
+    "Use the context provided below and do NOT hallucinate facts. If the answer is not in the context, say you don't know and optionally give general guidance. "
+    "Keep your tone conversational and helpful, like ChatGPT would respond, but use Markdown formatting for better presentation."
+)
+
+SYSTEM_PROMPT_TOKENS = {
+    SYSTEM_PROMPT_WEBPAGE: estimate_tokens(SYSTEM_PROMPT_WEBPAGE),
+    SYSTEM_PROMPT_KB: estimate_tokens(SYSTEM_PROMPT_KB),
+}
+
+# lower number = kept longer when the prompt is over budget; 0 is never trimmed
+PRIORITY_FIXED = 0
+PRIORITY_PAGE = 1
+PRIORITY_CODE = 2
+PRIORITY_KB = 3
+PRIORITY_IMAGES = 4
+PRIORITY_VIDEOS = 5
+
+
+class Section:
+    def __init__(self, name: str, priority: int, items: List[str], header: Optional[List[str]] = None,
+                 footer: Optional[List[str]] = None, item_tokens: Optional[List[int]] = None, truncate: bool = False):
+        self.name = name
+        self.priority = priority
+        self.items = list(items)
+        self.item_tokens = list(item_tokens) if item_tokens is not None else [estimate_tokens(i) for i in items]
+        self.header = header or []
+        self.footer = footer or []
+        self.frame_tokens = sum(estimate_tokens(line) for line in self.header + self.footer)
+        self.truncate = truncate  # shorten the last item instead of dropping it
+        self.trimmed = 0
+
+    @property
+    def tokens(self) -> int:
+        return (self.frame_tokens + sum(self.item_tokens)) if self.items else 0
+
+    def shrink(self, excess: int) -> int:
+        """Remove up to `excess` tokens from the end of the section; returns the tokens removed."""
+        before = self.tokens
+        if self.truncate and self.item_tokens[-1] > excess:
+            keep = self.item_tokens[-1] - excess - 1  # one token for the "..."
+            self.items[-1] = self.items[-1][:keep * 4] + "..."
+            self.item_tokens[-1] = estimate_tokens(self.items[-1])
+        else:
+            self.items.pop()
+            self.item_tokens.pop()
+        self.trimmed += 1
+        return before - self.tokens
+
+    def lines(self) -> List[str]:
+        return self.header + self.items + self.footer if self.items else []
+
+
+def code_block_items(blocks: list, limit: int = 5) -> List[str]:
+    return [
+        f"Code Block {i+1} ({block.get('language', 'text')}):\n"
+        f"Context: {block.get('context', 'No context')}\n"
+        f"Code:\n{block.get('code', '')}\n---"
+        for i, block in enumerate(blocks[:limit])
+    ]
+
+
+def image_items(images: list, limit: int = 3) -> List[str]:
+    return [
+        f"Image {i+1}:\n"
+        f"Alt text: {img.get('alt', 'No alt text')}\n"
+        f"Caption: {img.get('caption', 'No caption')}\n"
+        f"Source: {img.get('src', 'No source')}\n"
+        f"Context: {img.get('context', 'No context')}\n---"
+        for i, img in enumerate(images[:limit])
+    ]
+
+
+def video_items(videos: list, limit: int = 3) -> List[str]:
+    return [
+        f"Video {i+1}:\n"
+        f"Title: {video.get('title', 'No title')}\n"
+        f"Caption: {video.get('caption', 'No caption')}\n"
+        f"Source: {video.get('src', 'No source')}\n"
+        f"Context: {video.get('context', 'No context')}\n---"
+        for i, video in enumerate(videos[:limit])
+    ]
+
+
+def media_items(page_context: dict) -> Dict[str, Tuple[List[str], List[int]]]:
+    """Serialized code/image/video items of a page and their token counts, as webpage_sections() takes them."""
+    entry = {}
+    for name, items in (("code_blocks", code_block_items(page_context.get('codeBlocks', []))),
+                        ("images", image_items(page_context.get('images', []))),
+                        ("videos", video_items(page_context.get('videos', [])))):
+        entry[name] = (items, [estimate_tokens(i) for i in items])
+    return entry
+
+
+class MediaSectionCache:
+    """LRU of serialized code/image/video items (and their token counts) per page."""
+
+    def __init__(self, max_pages: int = 256):
+        self.max_pages = max_pages
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, page_context: dict) -> Dict[str, Tuple[List[str], List[int]]]:
+        media = [page_context.get('codeBlocks', []), page_context.get('images', []), page_context.get('videos', [])]
+        key = hashlib.sha256(json.dumps(media, sort_keys=True).encode('utf-8')).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = media_items(page_context)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_pages:
+                self._entries.popitem(last=False)
+        return entry
+
+
+def webpage_sections(page_context: dict, page_text: str, media: Dict[str, Tuple[List[str], List[int]]]) -> List[Section]:
+    code_blocks = page_context.get('codeBlocks', [])
+    images = page_context.get('images', [])
+    videos = page_context.get('videos', [])
+    items, tokens = media["code_blocks"]
+    sections = [
+        Section("page", PRIORITY_PAGE, [f"Content: {page_text}"], truncate=True, header=[
+            "=== CURRENT WEBPAGE CONTENT ===",
+            f"Title: {page_context.get('title', 'Current Webpage')}",
+            f"URL: {page_context.get('url', '')}",
+        ]),
+        Section("code_blocks", PRIORITY_CODE, items, item_tokens=tokens,
+                header=[f"\n=== CODE BLOCKS ON PAGE ({len(code_blocks)} found) ==="]),
+    ]
+    items, tokens = media["images"]
+    sections.append(Section("images", PRIORITY_IMAGES, items, item_tokens=tokens,
+                            header=[f"\n=== IMAGES ON PAGE ({len(images)} found) ==="]))
+    items, tokens = media["videos"]
+    sections.append(Section("videos", PRIORITY_VIDEOS, items, item_tokens=tokens,
+                            header=[f"\n=== VIDEOS ON PAGE ({len(videos)} found) ==="]))
+    sections.append(Section("page_end", PRIORITY_FIXED, ["=== END WEBPAGE CONTENT ===\n"]))
+    return sections
+
+
+def knowledge_base_section(excerpts: List[Tuple[str, str]], supplementary: bool) -> Section:
+    """excerpts: (title, excerpt) pairs in rank order."""
+    if supplementary:
+        return Section("knowledge_base", PRIORITY_KB,
+                       [f"Title: {title}\nExcerpt: {excerpt}\n---" for title, excerpt in excerpts],
+                       header=["=== SUPPLEMENTARY KNOWLEDGE BASE ==="], footer=["=== END KNOWLEDGE BASE ==="])
+    return Section("knowledge_base", PRIORITY_KB,
+                   [f"Title: {title}\nExcerpt: {excerpt}\n---\n" for title, excerpt in excerpts])
+
+
+def fit_to_budget(sections: List[Section], budget: int, fixed_tokens: int):
+    """Trim items from the lowest-priority sections until the prompt fits the budget."""
+    excess = fixed_tokens + sum(s.tokens for s in sections) - budget
+    for section in sorted(sections, key=lambda s: -s.priority):
+        if section.priority == PRIORITY_FIXED:
+            continue
+        while excess > 0 and section.items:
+            excess -= section.shrink(excess)
+
+
+def assemble(system_prompt: str, sections: List[Section], page_context: dict, query: str,
+             budget: int) -> Tuple[str, dict]:
+    """Render the user prompt within the token budget; returns (user_prompt, token counts per section)."""
+    page_info = f"Page: {page_context.get('title', 'Unknown')} ({page_context.get('url', 'No URL')})"
+    question_tokens = estimate_tokens(page_info) + estimate_tokens(query) + 8
+    system_tokens = SYSTEM_PROMPT_TOKENS.get(system_prompt) or estimate_tokens(system_prompt)
+    fit_to_budget(sections, budget, system_tokens + question_tokens)
+
+    lines = [line for s in sections for line in s.lines()]
+    combined_context = "\n".join(lines)
+    user_prompt = f"Page Info: {page_info}\n\nContext:\n{combined_context}\n\nQuestion: {query}"
+
+    counts = {"system": system_tokens, "question": question_tokens}
+    for s in sections:
+        if s.priority != PRIORITY_FIXED:
+            counts[s.name] = s.tokens
+    counts["total"] = sum(counts.values())
+    counts["budget"] = budget
+    counts["trimmed"] = {s.name: s.trimmed for s in sections if s.trimmed}
+    return user_prompt, counts
@@ -0,0 +1,84 @@
+# query_batcher.py
+"""
+Coalesces concurrent single-query embedding requests into batched calls.
+
+Each /chat request needs the embedding of one query. Instead of one upstream
+round trip per request, queries that arrive within `max_wait_ms` of the first
+pending one (or until `max_batch` are pending) are sent together and each caller
+gets its own vector back. Identical queries in a batch are embedded once. A batch
+is embedded in the most urgent admission lane among its callers (see admission.py),
+not in whichever caller's context happened to start the flush.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, List
+import numpy as np
+import admission
+from metrics import Histogram, BATCH_SIZE_BUCKETS, LATENCY_MS_BUCKETS
+
+
+class QueryBatcher:
+    def __init__(self, embed_fn: Callable[[List[str]], Awaitable[np.ndarray]], max_batch: int = 32,
+                 max_wait_ms: float = 5.0):
+        self.embed_fn = embed_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []  # (text, future, enqueued_at, lane)
+        self._timer = None
+        self._running = set()  # keeps in-flight batch tasks referenced
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_ms = Histogram(LATENCY_MS_BUCKETS)
+        self.batches = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embedding of one text, computed in a batch with other concurrent callers."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut, time.perf_counter(), admission.current_lane()))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        # this task runs in a copy of the context of the caller that scheduled the flush
+        admission.set_lane(min((lane for _, _, _, lane in batch), key=admission.LANES.index))
+        now = time.perf_counter()
+        for _, _, enqueued, _ in batch:
+            self.wait_ms.observe((now - enqueued) * 1000)
+        texts = list(dict.fromkeys(text for text, _, _, _ in batch))
+        self.batch_sizes.observe(len(texts))
+        self.batches += 1
+        try:
+            embs = await self.embed_fn(texts)
+        except Exception as e:
+            for _, fut, _, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        by_text = dict(zip(texts, embs))
+        for text, fut, _, _ in batch:
+            if not fut.done():  # caller may have been cancelled (e.g. QUERY_EMBED_TIMEOUT)
+                fut.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+        }
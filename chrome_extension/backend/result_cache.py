@@ -0,0 +1,114 @@
+# result_cache.py
+"""
+In-process caches for repeated questions, in two tiers:
+
+  retrieval - top-k rows per (normalized query, snapshot version, retrieval settings).
+              A new snapshot changes the key, so results never outlive the index they came from.
+  answer    - the LLM answer, hits and prompt token counts per (normalized query, page hash,
+              snapshot version, model and prompt settings), shared by /chat and /chat/stream.
+
+Both are LRU-bounded with a TTL and count hits, misses, evictions (LRU) and
+expirations (TTL). Each worker process has its own copy.
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+TRAILING_PUNCT_RE = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer to a question."""
+    return TRAILING_PUNCT_RE.sub("", " ".join(query.lower().split()))
+
+
+VOLATILE_PAGE_KEYS = ("timestamp",)  # set by the extension on every refresh, not part of the page
+
+
+def page_hash(page_context: dict) -> str:
+    """Hash of everything the extension sent about the page (content, title, url, media)."""
+    if not page_context:
+        return ""
+    page = {k: v for k, v in page_context.items() if k not in VOLATILE_PAGE_KEYS}
+    data = json.dumps(page, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def retrieval_key(query: str, version: Optional[str], *settings) -> tuple:
+    return (normalize_query(query), version, *settings)
+
+
+def answer_key(query: str, page: str, version: Optional[str], *settings) -> tuple:
+    """page: page_hash() of the request's page context."""
+    return (normalize_query(query), page, version, *settings)
+
+
+class TTLCache:
+    """
+    Thread-safe LRU of at most max_entries values, each valid for ttl_seconds after it was put
+    (or, when sliding, after it was last read).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, sliding: bool = False):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sliding = sliding
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if self.sliding:
+                self._entries[key] = (time.monotonic() + self.ttl_seconds, entry[1])
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "max_entries": self.max_entries, "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "expirations": self.expirations}
+
+
+def replay_pieces(answer: str, max_chars: int = 32) -> List[str]:
+    """A cached answer cut into stream-sized pieces at whitespace, so it can be replayed as content events."""
+    pieces, current = [], ""
+    for word in re.findall(r"\s*\S+\s*|\s+", answer):
+        if current and len(current) + len(word) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += word
+    if current:
+        pieces.append(current)
+    return pieces
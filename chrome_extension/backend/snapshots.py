@@ -0,0 +1,129 @@
+# snapshots.py
+"""
+Versioned, immutable index snapshots.
+
+Every ingest writes a complete snapshot (FAISS index, columnar metadata, chunk store,
+BM25 postings, manifest) into a staging directory, fsyncs it, renames it to
+snapshots/<version>/ and only then atomically replaces snapshots/CURRENT with
+the new version name. A published directory is never modified again, so a
+reader sees either the old version or the new one, never a mix of both.
+
+Serving processes poll CURRENT and swap in a newer version with a single
+reference assignment; a request keeps the Snapshot object it started with.
+
+Writers hold the root's LOCK_FILE (file_lock.py) from reading the base version to
+publishing, and publish() refuses to move CURRENT when it no longer points at that
+base, so concurrent ingests in several processes never drop each other's changes.
+"""
+import os
+import time
+import uuid
+import shutil
+from typing import List, Optional
+
+SNAPSHOTS_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+STAGING_PREFIX = ".staging-"
+LOCK_FILE = ".ingest.lock"
+ANY_VERSION = "*"  # publish() without checking the base version
+
+
+class PublishConflict(RuntimeError):
+    pass
+
+
+class Snapshot:
+    """Everything a request searches, loaded from one published version."""
+
+    def __init__(self, version: Optional[str], path: Optional[str], index, docs_meta, id_to_row,
+                 info: dict, chunk_store=None, bm25_index=None):
+        self.version = version  # None for an empty or pre-snapshot index
+        self.path = path
+        self.index = index
+        self.docs_meta = docs_meta  # meta_store.MetaStore (or a list of dicts for old indexes): {'id', 'title', 'source', 'start', 'end'}
+        self.id_to_row = id_to_row  # faiss vector id -> position in docs_meta / chunk_store
+        self.info = info  # contents of index_info.json
+        self.chunk_store = chunk_store  # chunk_store.ChunkStore aligned with docs_meta
+        self.bm25_index = bm25_index  # bm25.BM25Index over the same rows
+        self.nbytes = 0  # estimated memory footprint, measured when it is opened (kb_collections.snapshot_bytes)
+
+
+def fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_tree(path: str):
+    for dirpath, _, filenames in os.walk(path, topdown=False):
+        for name in filenames:
+            fd = os.open(os.path.join(dirpath, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        fsync_dir(dirpath)
+
+
+def staging_dir(root: str = SNAPSHOTS_DIR) -> str:
+    """A fresh directory to write the next snapshot into."""
+    now = time.time_ns()
+    # sorts by creation time, nanoseconds included; the random suffix keeps concurrent writers apart
+    version = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(now // 10**9))}.{now % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(root, STAGING_PREFIX + version)
+    os.makedirs(path)
+    return path
+
+
+def publish(staging: str, root: str = SNAPSHOTS_DIR, base: Optional[str] = ANY_VERSION) -> str:
+    """
+    Make a fully written staging directory durable and point CURRENT at it; returns the version.
+    base is the version the snapshot was built on (None: no CURRENT yet); when CURRENT has moved
+    since, the staging directory is removed and PublishConflict raised.
+    """
+    version = os.path.basename(staging)[len(STAGING_PREFIX):]
+    current = current_version(root)
+    if base != ANY_VERSION and current != base:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise PublishConflict(f"{root} moved from {base} to {current} while {version} was built, ingest again")
+    fsync_tree(staging)
+    os.rename(staging, os.path.join(root, version))
+    fsync_dir(root)
+    tmp = os.path.join(root, f"{CURRENT_FILE}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+    fsync_dir(root)
+    return version
+
+
+def current_version(root: str = SNAPSHOTS_DIR) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def versions(root: str = SNAPSHOTS_DIR) -> List[str]:
+    """Published versions, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root)
+                  if not d.startswith(".") and os.path.isdir(os.path.join(root, d)))
+
+
+def prune(keep: int, root: str = SNAPSHOTS_DIR):
+    """
+    Delete all but the newest `keep` versions (never the current one). Processes that still
+    have an old snapshot open keep working: its files stay readable until they are closed.
+    """
+    current = current_version(root)
+    old = versions(root)[:-keep] if keep > 0 else versions(root)
+    for version in old:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
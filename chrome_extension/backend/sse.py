@@ -0,0 +1,51 @@
+# sse.py
+"""
+Helpers for the text/event-stream responses of /chat/stream.
+
+Events are `data: <json>` lines followed by a blank line. Heartbeats are SSE
+comment lines, which EventSource and the extension's line parser both skip, so
+they keep proxies and idle timeouts from closing a connection while retrieval
+or the LLM's first token is still pending.
+"""
+import json
+import asyncio
+from typing import AsyncIterator, Awaitable
+
+MEDIA_TYPE = "text/event-stream"
+HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # nginx would otherwise buffer the stream
+}
+OPEN = ": open\n\n"  # first bytes of every stream, sent before any work is done
+HEARTBEAT = ": heartbeat\n\n"
+
+
+def event(type_: str, **fields) -> str:
+    return f"data: {json.dumps({'type': type_, **fields})}\n\n"
+
+
+async def heartbeats(aw: Awaitable, interval: float) -> AsyncIterator[str]:
+    """Yield HEARTBEAT every `interval` seconds until aw (a task or future) is done; await it afterwards."""
+    while True:
+        done, _ = await asyncio.wait({aw}, timeout=interval)
+        if done:
+            return
+        yield HEARTBEAT
+
+
+async def with_heartbeats(items: AsyncIterator, interval: float) -> AsyncIterator:
+    """Items of an async iterator, with HEARTBEAT strings in between whenever it is silent for `interval` seconds."""
+    it = items.__aiter__()
+    while True:
+        nxt = asyncio.ensure_future(it.__anext__())
+        try:
+            async for beat in heartbeats(nxt, interval):
+                yield beat
+        finally:
+            if not nxt.done():
+                nxt.cancel()
+        try:
+            yield nxt.result()
+        except StopAsyncIteration:
+            return
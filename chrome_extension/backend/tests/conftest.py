@@ -0,0 +1,36 @@
+"""The backend app, imported once with settings suited to tests, in a scratch working directory."""
+import os
+import sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("backend")
+    env = {
+        "ANSWER_CACHE_MAX_ENTRIES": "0",  # answer_key() then skips retrieval_mode(), see test_chat_batch.py
+        "RETRIEVAL_CACHE_MAX_ENTRIES": "0",
+        "EMBED_CACHE_MAX_ENTRIES": "0",
+        "QUERY_BATCH_WAIT_MS": "0",
+        "PAGE_SESSIONS_DIR": "",
+        "INGEST_WORKERS": "1",  # read files in-process
+        "INGEST_BATCH_CHUNKS": "4",  # several batches per ingest
+    }
+    saved = {k: os.environ.get(k) for k in env}
+    cwd = os.getcwd()
+    os.environ.update(env)
+    os.chdir(workdir)
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+        sys.path.remove(BACKEND_DIR)
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
@@ -0,0 +1,62 @@
+"""Admission control: a full lane queue is a 429, a wait past the lane's deadline a 503, both with Retry-After."""
+import os
+import sys
+import asyncio
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import admission  # noqa: E402
+
+TIMEOUTS = {admission.INTERACTIVE: 0.05, admission.BATCH: 0.05, admission.INGEST: 0.05}
+
+
+def test_full_queue_is_429():
+    async def scenario():
+        limiter = admission.Limiter("LLM", limit=1, max_queue=1, timeouts=TIMEOUTS)
+        held = limiter.reserve()
+        queued = limiter.reserve()
+        with pytest.raises(admission.Overloaded) as e:
+            limiter.reserve()
+        assert e.value.status_code == 429
+        assert int(e.value.headers["Retry-After"]) >= 1
+        assert limiter.rejected == 1
+        # other lanes have queues of their own
+        limiter.reserve(admission.BATCH).release()
+        queued.release()
+        held.release()
+        assert limiter.in_flight == 0 and limiter.queue_depth() == 0
+
+    asyncio.run(scenario())
+
+
+def test_wait_past_deadline_is_503():
+    async def scenario():
+        limiter = admission.Limiter("LLM", limit=1, max_queue=4, timeouts=TIMEOUTS)
+        held = limiter.reserve()
+        with pytest.raises(admission.Overloaded) as e:
+            async with limiter.reserve():
+                pass
+        assert e.value.status_code == 503
+        assert int(e.value.headers["Retry-After"]) >= 1
+        assert limiter.timeouts_total == 1 and limiter.queue_depth() == 0
+        held.release()
+        async with limiter.reserve():  # the slot is free again
+            assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_chat_is_refused_before_any_work(app_module, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("no retrieval or LLM call for a refused request")
+
+    limiter = admission.Limiter("LLM", limit=1, max_queue=0, timeouts=TIMEOUTS)
+    held = limiter.reserve()
+    monkeypatch.setattr(app_module, "llm_limiter", limiter)
+    monkeypatch.setattr(app_module, "build_prompt", fail)
+    r = TestClient(app_module.app).post("/chat", json={"query": "anything"})
+    assert r.status_code == 429
+    assert int(r.headers["Retry-After"]) >= 1
+    held.release()
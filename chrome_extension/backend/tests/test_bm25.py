@@ -0,0 +1,45 @@
+"""bm25: lookups in the sorted on-disk vocabulary, and indexes written with a vocab.json."""
+import os
+import sys
+import json
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bm25  # noqa: E402
+
+TEXTS = [
+    "Request failed with ERR_TIMEOUT after 30s",
+    "Set config.keys in the settings file",
+    "héllo wörld, 日本語 text",
+    "timeout handling and retries",
+    "",
+]
+
+
+def test_search_finds_every_term(tmp_path):
+    bm25.build_bm25(TEXTS, str(tmp_path), run_rows=2)
+    index = bm25.BM25Index(str(tmp_path))
+    assert index.vocab is None
+    assert index.search("ERR_TIMEOUT", 5) == [0, 3]  # the whole identifier ranks above its part
+    assert index.search("timeout", 5) == [3, 0]
+    assert index.search("keys", 5) == [1]
+    assert index.search("wörld 日本語", 5) == [2]
+    assert index.search("a", 5) == [] and index.search("zzz", 5) == []
+    assert index.search("", 5) == []
+
+
+def test_reads_vocab_json(tmp_path):
+    bm25.build_bm25(TEXTS, str(tmp_path))
+    index = bm25.BM25Index(str(tmp_path))
+    vocab = {}
+    for name in ("terms", "term_starts", "term_ids"):
+        vocab[name] = np.load(os.path.join(tmp_path, f"{name}.npy"))
+        os.remove(os.path.join(tmp_path, f"{name}.npy"))
+    starts = vocab["term_starts"]
+    terms = [vocab["terms"][starts[i]:starts[i + 1]].tobytes().decode('utf-8') for i in range(len(starts) - 1)]
+    with open(os.path.join(tmp_path, "vocab.json"), 'w', encoding='utf-8') as f:
+        json.dump(dict(zip(terms, vocab["term_ids"].tolist())), f)
+    legacy = bm25.BM25Index(str(tmp_path))
+    assert legacy.vocab is not None
+    for query in ("timeout", "config.keys", "héllo", "retries text"):
+        assert legacy.search(query, 5) == index.search(query, 5)
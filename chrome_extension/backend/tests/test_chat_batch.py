@@ -0,0 +1,47 @@
+"""POST /chat/batch: a bad item is reported on its own line and never fails the batch."""
+import json
+import numpy as np
+import pytest
+import faiss
+
+
+@pytest.fixture
+def client(app_module, monkeypatch):
+    from fastapi.testclient import TestClient
+    from snapshots import Snapshot
+
+    dim = app_module.EMBED_DIM
+    rng = np.random.default_rng(0)
+    vecs = app_module.normalize(rng.standard_normal((4, dim))).astype('float32')
+    index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+    index.add_with_ids(vecs, np.arange(4, dtype='int64'))
+    docs_meta = [{"id": i, "title": f"doc {i}", "source": f"doc{i}.md", "start": 0, "end": 0} for i in range(4)]
+    snap = Snapshot("test", None, index, docs_meta, {i: i for i in range(4)}, {})
+    monkeypatch.setattr(app_module, "snapshot", snap)
+
+    async def fake_embeddings(texts):
+        return rng.standard_normal((len(texts), dim)).astype('float32')
+
+    async def fake_complete(system_prompt, user_prompt):
+        return "an answer"
+
+    monkeypatch.setattr(app_module, "get_embeddings", fake_embeddings)
+    monkeypatch.setattr(app_module, "complete", fake_complete)
+    return TestClient(app_module.app)
+
+
+def test_bad_item_does_not_fail_batch(client):
+    items = [
+        {"query": "first question", "retrieval": "dense"},
+        {"query": "bad mode", "retrieval": "nope"},
+        {"query": "second question", "retrieval": "dense"},
+        {"query": "unknown collection", "collection": "missing"},
+    ]
+    r = client.post("/chat/batch", json={"requests": items})
+    assert r.status_code == 200
+    lines = {line["index"]: line for line in map(json.loads, r.text.splitlines())}
+    assert sorted(lines) == [0, 1, 2, 3]
+    assert lines[0]["answer"] == "an answer" and lines[0]["retrieved"]
+    assert lines[2]["answer"] == "an answer" and lines[2]["retrieved"]
+    assert lines[1]["status"] == 400 and "nope" in lines[1]["error"]
+    assert lines[3]["status"] == 404
@@ -0,0 +1,30 @@
+"""build_index: compressed layouts on corpora too small to train them."""
+import os
+import sys
+import numpy as np
+import pytest
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import index_factory as ix  # noqa: E402
+
+
+@pytest.mark.parametrize("n", [1, 10, 63])
+def test_pca_on_small_corpus_falls_back_to_truncate(n):
+    dim, reduce_dim = 256, 64
+    vecs = np.random.default_rng(0).standard_normal((n, dim)).astype('float32')
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    index = ix.build_index("flat", dim, vecs, reduce="pca", reduce_dim=reduce_dim)
+    index.add_with_ids(vecs, np.arange(n, dtype='int64'))
+    assert ix.base_index(index).d == reduce_dim
+    _, found = index.search(vecs, 1)
+    assert (found[:, 0] == np.arange(n)).all()
+
+
+def test_pca_with_enough_vectors():
+    dim, reduce_dim = 256, 64
+    vecs = np.random.default_rng(0).standard_normal((200, dim)).astype('float32')
+    index = ix.build_index("flat", dim, vecs, reduce="pca", reduce_dim=reduce_dim)
+    assert ix.base_index(index).d == reduce_dim
+    projection = faiss.downcast_index(index.index).chain.at(0)
+    assert isinstance(faiss.downcast_VectorTransform(projection), faiss.PCAMatrix)
@@ -0,0 +1,123 @@
+"""Ingest jobs: resuming after an interrupted batch, and incremental ingests against the last snapshot."""
+import os
+import time
+import hashlib
+import numpy as np
+import pytest
+
+CHUNKING = {"chunker": "chars", "chunk_size": 200, "overlap": 0}
+
+
+def write_docs(docs, n_files=4, paragraphs=6):
+    os.makedirs(docs, exist_ok=True)
+    for f in range(n_files):
+        text = "\n\n".join(f"Paragraph {p} of file {f}. " + f"word{f}x{p} " * 20 for p in range(paragraphs))
+        with open(os.path.join(docs, f"file{f}.md"), 'w', encoding='utf-8') as out:
+            out.write(f"# File {f}\n\n{text}\n")
+
+
+@pytest.fixture
+def embedded(app_module, monkeypatch):
+    """Texts sent to the embedder; each text gets a vector derived from its hash."""
+    texts = []
+
+    async def fake_embeddings(batch):
+        texts.extend(batch)
+        return np.stack([np.random.default_rng(int.from_bytes(hashlib.sha256(t.encode('utf-8')).digest()[:8], 'little'))
+                         .standard_normal(app_module.EMBED_DIM) for t in batch]).astype('float32')
+
+    monkeypatch.setattr(app_module, "get_embeddings", fake_embeddings)
+    return texts
+
+
+@pytest.fixture
+def client(app_module, embedded):
+    from fastapi.testclient import TestClient
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def ingest(client, docs, collection, **extra):
+    r = client.post("/ingest", json={"docs_dir": str(docs), "collection": collection, **CHUNKING, **extra})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def published_texts(app_module, collection):
+    root = app_module.collections.root(collection)
+    version = app_module.snapshots.current_version(root)
+    snap = app_module.open_snapshot(os.path.join(root, version), version)
+    return [snap.chunk_store.text(i) for i in range(len(snap.chunk_store))], snap
+
+
+def test_resume_after_interrupted_batch(app_module, client, embedded, tmp_path):
+    ij = app_module.ij
+    write_docs(tmp_path / "docs")
+    fresh = ingest(client, tmp_path / "docs", "fresh")
+
+    # a job killed while writing its third batch: two batches committed, the third half-written
+    req = app_module.IngestRequest(docs_dir=str(tmp_path / "docs"), collection="resumed", **CHUNKING)
+    files, layout = app_module.ingest_files(req)
+    job = ij.IngestJob.create(req.dict(), layout, files, app_module.INGEST_JOBS_DIR)
+    job.open_scratch()
+    chunks = ij.iter_chunks(app_module.dl.load_files(files, req.chunker, req.chunk_size, req.overlap, 1))
+    for _ in range(2):
+        batch = [next(chunks) for _ in range(4)]
+        job.commit_batch(batch, np.zeros((len(batch), app_module.EMBED_DIM), dtype='float32'))
+    for f in job._scratch.values():
+        f.write(b"half a batch")
+    job.set_status("running", "embedding")
+    job.close_scratch()
+    committed = dict(job.state["sizes"])
+    job.release()  # the process is gone
+
+    r = client.get(f"/ingest/jobs/{job.id}")
+    assert r.json()["status"] == "interrupted"
+    assert client.post(f"/ingest/jobs/{job.id}/resume").status_code == 202
+    assert client.post(f"/ingest/jobs/{job.id}/resume").status_code == 409  # already running
+    deadline = time.time() + 30
+    while (state := client.get(f"/ingest/jobs/{job.id}").json())["status"] not in ("done", "failed"):
+        assert time.time() < deadline
+        time.sleep(0.05)
+    assert state["status"] == "done", state["errors"]
+    assert state["result"]["num_chunks"] == fresh["num_chunks"]
+    assert all(size > 0 for size in committed.values())
+
+    fresh_texts, _ = published_texts(app_module, "fresh")
+    resumed_texts, snap = published_texts(app_module, "resumed")
+    assert resumed_texts == fresh_texts  # nothing of the half-written batch, nothing twice
+    assert [m["id"] for m in snap.docs_meta] == list(range(len(fresh_texts)))
+    # only the chunks after the committed batches were embedded again
+    assert embedded[-(len(fresh_texts) - 8):] == fresh_texts[8:]
+
+
+def test_incremental_ingest(app_module, client, embedded, tmp_path):
+    docs = tmp_path / "docs"
+    write_docs(docs)
+    full = ingest(client, docs, "incremental")
+    texts, _ = published_texts(app_module, "incremental")
+    assert len(embedded) == full["num_chunks"] == len(texts)
+
+    embedded.clear()
+    unchanged = ingest(client, docs, "incremental", incremental=True)
+    assert (unchanged["embedded"], unchanged["removed"], unchanged["num_chunks"]) == (0, 0, full["num_chunks"])
+    assert embedded == []
+
+    with open(docs / "file1.md", 'a', encoding='utf-8') as f:
+        f.write("\n## Appended section\n\n" + "appended words " * 30 + "\n")
+    appended = ingest(client, docs, "incremental", incremental=True)
+    new_texts, _ = published_texts(app_module, "incremental")
+    assert 0 < appended["embedded"] < 4 and appended["num_chunks"] > full["num_chunks"]
+    assert sorted(embedded) == sorted(set(new_texts) - set(texts))
+    assert any("Appended section" in t for t in embedded)
+
+    embedded.clear()
+    file2_chunks = sum(1 for m in published_texts(app_module, "incremental")[1].docs_meta if m["source"].endswith("file2.md"))
+    os.remove(docs / "file2.md")
+    removed = ingest(client, docs, "incremental", incremental=True)
+    assert (removed["embedded"], removed["removed"]) == (0, file2_chunks)
+    assert removed["num_chunks"] == appended["num_chunks"] - file2_chunks
+    _, snap = published_texts(app_module, "incremental")
+    assert not any(m["source"].endswith("file2.md") for m in snap.docs_meta)
+    assert snap.index.ntotal == removed["num_chunks"]
+    assert embedded == []
@@ -0,0 +1,34 @@
+"""Publishing snapshots: a build based on an older version must not replace a newer CURRENT."""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import snapshots  # noqa: E402
+
+
+def stage(root):
+    path = snapshots.staging_dir(str(root))
+    with open(os.path.join(path, "data.txt"), 'w', encoding='utf-8') as f:
+        f.write(os.path.basename(path))
+    return path
+
+
+def test_publish_conflict_against_newer_current(tmp_path):
+    first = snapshots.publish(stage(tmp_path), str(tmp_path), base=None)
+    stale = stage(tmp_path)  # built on `first` ...
+    newer = snapshots.publish(stage(tmp_path), str(tmp_path), base=first)  # ... while another writer published
+    with pytest.raises(snapshots.PublishConflict):
+        snapshots.publish(stale, str(tmp_path), base=first)
+    assert snapshots.current_version(str(tmp_path)) == newer
+    assert not os.path.exists(stale)
+    assert snapshots.versions(str(tmp_path)) == [first, newer]
+    # without a base the caller does not care what it replaces
+    assert snapshots.publish(stage(tmp_path), str(tmp_path)) == snapshots.current_version(str(tmp_path))
+
+
+def test_first_publish_conflicts_with_an_existing_current(tmp_path):
+    existing = snapshots.publish(stage(tmp_path), str(tmp_path), base=None)
+    with pytest.raises(snapshots.PublishConflict):
+        snapshots.publish(stage(tmp_path), str(tmp_path), base=None)
+    assert snapshots.current_version(str(tmp_path)) == existing
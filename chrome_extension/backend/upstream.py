@@ -0,0 +1,60 @@
+# upstream.py
+"""
+Shared connection pool and retry policy for calls to the LLM / embedding APIs.
+
+Both AsyncOpenAI clients in app.py are built on one httpx.AsyncClient, so the
+pool limits below bound the total number of upstream connections per worker.
+The OpenAI SDK's own retries are turned off and with_retries() is used instead,
+so the retry policy is the same (and configurable) for every call.
+"""
+import os
+import random
+import asyncio
+import httpx
+import openai
+
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "50"))
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "120"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))  # seconds
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "10"))
+
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+        ),
+        timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=10.0),
+    )
+
+
+def is_retryable(e: Exception) -> bool:
+    """429s, 5xx and connection failures are worth retrying; other 4xx are not."""
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code == 429 or e.status_code >= 500
+    return False
+
+
+async def with_retries(call, *args, **kwargs):
+    """Await call(*args, **kwargs), retrying retryable errors with jittered exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return await call(*args, **kwargs)
+        except Exception as e:
+            if attempt >= UPSTREAM_MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * (2 ** attempt))
+            retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            attempt += 1
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
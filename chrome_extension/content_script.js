@@ -4,6 +4,7 @@
   window.__tool_assistant_injected = true;
 
   let backendUrl = 'http://localhost:8000';
+  const MAX_PAGE_CONTENT_CHARS = 200000;
   let chatWidget = null;
   let isWidgetOpen = false;
 
@@ -323,8 +324,9 @@
         .replace(/\n\s*\n/g, '\n')
         .trim();
       
-      if (content.length > 8000) {
-        content = content.substring(0, 8000) + '...';
+      // The backend picks the passages relevant to each question, so only guard against huge pages
+      if (content.length > MAX_PAGE_CONTENT_CHARS) {
+        content = content.substring(0, MAX_PAGE_CONTENT_CHARS) + '...';
       }
     }
     
@@ -431,6 +433,43 @@
     messages.scrollTop = messages.scrollHeight;
   }
 
+  // The page context is uploaded once per page (POST /pages); questions then send only its page_id
+  let pageSession = null; // { context, id }
+
+  async function pageIdFor(context) {
+    if (pageSession && pageSession.context === context) return pageSession.id;
+    const response = await fetch(`${backendUrl}/pages`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(context)
+    });
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    pageSession = { context, id: (await response.json()).page_id };
+    return pageSession.id;
+  }
+
+  async function postChat(q) {
+    const context = window.__ta_page_context || {};
+    const post = (page) => fetch(`${backendUrl}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query: q, ...page, top_k: 4 })
+    });
+    let pageId;
+    try {
+      pageId = await pageIdFor(context);
+    } catch (err) {
+      return post({ page_context: context }); // backend without page sessions
+    }
+    const response = await post({ page_id: pageId });
+    if (response.status !== 404) return response;
+    // the session expired or was evicted: upload the page again
+    pageSession = null;
+    return post({ page_id: await pageIdFor(context) });
+  }
+
   async function sendQuery() {
     const input = chatWidget.querySelector('#ta-input');
     const q = input.value.trim();
@@ -448,15 +487,7 @@
     messages.scrollTop = messages.scrollHeight;
 
     try {
-      const response = await fetch(`${backendUrl}/chat/stream`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          query: q,
-          page_context: window.__ta_page_context || {},
-          top_k: 4
-        })
-      });
+      const response = await postChat(q);
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);